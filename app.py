@@ -1,40 +1,120 @@
+import hashlib
 import os
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (Flask, Blueprint, Response, render_template, request, flash,
+                   redirect, session, g, abort, current_app, send_file,
+                   jsonify, stream_with_context)
+from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.exc import IntegrityError
-
+from sqlalchemy.orm import joinedload
+
+from assets import load_manifest, source_files, DIST as ASSET_DIST
+import auth
+from compress import Compress
+from config import configure_app, export_dir
+from image_proxy import (ImageCache, ImageFetchError, SIZES as IMAGE_SIZES,
+                         IMMUTABLE, proxy_url, verify)
+from entity_cache import user_cache, message_cache, configure_entity_caches
+from follows import follow_many, unfollow_many
 from forms import UserAddForm, LoginForm, MessageForm, UserEditForm
-from models import db, connect_db, User, Message, Like
+from hashtags import tag_message, linkify
+import metrics
+from models import (db, connect_db, follow_graph, User, Message, Like,
+                    MessageArchive, Tag, MessageTag, Mention, TrendingMessage,
+                    FollowSuggestion, ExportJob)
+from ratelimit import make_store as make_ratelimit_store, rate_limited
+import repository
+from search import (search_messages, index_message, unindex_message,
+                    unindex_user_messages)
+import summaries
+from summaries import get_summary_or_404
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+bp = Blueprint('warbler', __name__)
+
+
+def create_app(overrides=None):
+    """Application factory: build and configure a Warbler app.
+
+    Nothing is built at import time, so gunicorn can `--preload` this module
+    once and fork workers, and CLI tools that only need the database (like
+    `seed.py`) don't pay for the web stack. Pass `overrides` to replace
+    config values (useful for tests).
+    """
+
+    app = Flask(__name__)
+    configure_app(app, overrides)
+    connect_db(app)
+
+    if app.config.get('DEBUG_TB_ENABLED'):
+        # Only import the toolbar when it's actually wanted; it pulls in a
+        # lot of modules we never need in production.
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    app.extensions['image_cache'] = ImageCache(
+        (app.config['IMAGE_CACHE_DIR']
+         or os.path.join(app.instance_path, 'image_cache')),
+        app.config['IMAGE_CACHE_MAX_BYTES'],
+        app.config['IMAGE_PROXY_ALLOWED_HOSTS'],
+    )
+
+    configure_entity_caches(app)
+    auth.token_versions.ttl = app.config['AUTH_VERSION_TTL']
+
+    app.extensions['ratelimit_store'] = make_ratelimit_store(
+        app.config['RATELIMIT_STORAGE_URL'])
+
+    if app.config['TEMPLATE_TRIM_WHITESPACE']:
+        app.jinja_env.trim_blocks = True
+        app.jinja_env.lstrip_blocks = True
+
+    app.wsgi_app = Compress(app.wsgi_app,
+                            min_size=app.config['COMPRESS_MIN_SIZE'],
+                            gzip_level=app.config['COMPRESS_LEVEL'])
+
+    if app.config['PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'])
+
+    app.register_blueprint(bp)
+
+    return app
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgres:///warbler'))
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-# toolbar = DebugToolbarExtension(app)
+_app = None
 
-connect_db(app)
+
+def __getattr__(name):
+    """Lazily build the module-level `app` on first access.
+
+    Keeps `gunicorn app:app` and `from app import app` working without
+    creating the app (and binding the DB) as a side effect of importing.
+    """
+
+    global _app
+
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    if current_app.config['AUTH_MODE'] == 'token':
+        g.user = user_cache.get(auth.current_user_id())
+
+    elif CURR_USER_KEY in session:
+        g.user = user_cache.get(session[CURR_USER_KEY])
 
     else:
         g.user = None
@@ -43,17 +123,32 @@ def add_user_to_g():
 def do_login(user):
     """Log in user."""
 
-    session[CURR_USER_KEY] = user.id
+    if current_app.config['AUTH_MODE'] == 'token':
+        auth.set_cookie(user)
+    else:
+        session[CURR_USER_KEY] = user.id
+
 
+def do_logout(everywhere=False):
+    """Logout user.
 
-def do_logout():
-    """Logout user."""
+    In token mode, `everywhere` also revokes every token the user has been
+    issued (on their other devices too); otherwise just this one's cookie
+    is dropped.
+    """
+
+    if current_app.config['AUTH_MODE'] == 'token':
+        if everywhere:
+            auth.revoke(g.user.id)
+        else:
+            auth.delete_cookie()
 
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@bp.route('/signup', methods=["GET", "POST"])
+@rate_limited('signup')
 def signup():
     """Handle user signup.
 
@@ -88,7 +183,7 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
@@ -108,7 +203,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Handle logout of user."""
     
@@ -120,10 +215,72 @@ def logout():
     return redirect('/')
 
 
+@bp.route('/logout/everywhere', methods=["POST"])
+def logout_everywhere():
+    """Log the user out on every device (in token mode)."""
+
+    if g.user:
+        do_logout(everywhere=True)
+        flash("You have been logged out everywhere.", "success")
+    else:
+        flash("You're not currently logged in.", "danger")
+    return redirect('/')
+
+
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+# Rows fetched per round trip when streaming long lists.
+STREAM_BATCH_SIZE = 100
+
+# Template events rendered between flushes while streaming; small enough
+# that the page header goes out first, big enough not to flush every tag.
+STREAM_BUFFER = 32
+
+
+@bp.app_template_global()
+def is_following(user, other_user):
+    """Does `user` follow `other_user`? For templates.
+
+    Reads `follow_graph`, which the follow routes keep up to date; other
+    writes show up within its TTL.
+    """
+
+    return follow_graph.is_following(user.id, other_user.id)
+
+
+@bp.app_template_global()
+def following_count(user):
+    """How many users `user` follows, from `follow_graph`."""
+
+    return follow_graph.following_count(user.id)
+
+
+@bp.app_template_global()
+def followers_count(user):
+    """How many users follow `user`, from `follow_graph`."""
+
+    return follow_graph.followers_count(user.id)
+
+
+def stream_template(template_name, **context):
+    """Like `render_template`, but send the page as it's rendered.
+
+    Pass lists as `yield_per` queries and they're fetched in batches as the
+    template loops over them, so neither the rows nor the HTML are ever all
+    in memory. (Flask 2 has this built in.)
+    """
+
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+
+    return Response(stream_with_context(stream), mimetype='text/html')
+
+
+@bp.route('/users')
 def list_users():
     """Page with listing of users.
 
@@ -132,15 +289,19 @@ def list_users():
 
     search = request.args.get('q')
 
-    if not search:
-        users = User.query.all()
-    else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+    users = User.query.order_by(User.id)
+    if search:
+        users = users.filter(User.username.like(f"%{search}%"))
+
+    return stream_template('users/index.html',
+                           users=users.yield_per(STREAM_BATCH_SIZE))
 
-    return render_template('users/index.html', users=users)
 
+# Messages per page of a user's profile.
+PROFILE_PAGE_SIZE = 20
 
-@app.route('/users/<int:user_id>', methods = ['GET'])
+
+@bp.route('/users/<int:user_id>', methods = ['GET'])
 def users_show(user_id):
     """Show user profile."""
 
@@ -169,17 +330,39 @@ def users_show(user_id):
         return redirect("/")
 
     #if GET request, display messages
-    user = User.query.get_or_404(user_id)
-    messages = (Message
-            .query
-            .filter(Message.user_id == user_id)
-            .order_by(Message.timestamp.desc())
-            .limit(100)
-            .all())
-    return render_template('users/show.html', user=user, messages=messages)
+    profile = get_summary_or_404(user_id)
+    messages = []
+
+    if profile.last_message_id is not None:
+        # Pages end at a message id: ?before=<id of the last message shown>.
+        messages = repository.user_messages(
+            user_id, before=request.args.get('before', type=int),
+            limit=PROFILE_PAGE_SIZE + 1)
+
+    next_before = None
+    if len(messages) > PROFILE_PAGE_SIZE:
+        messages = messages[:PROFILE_PAGE_SIZE]
+        next_before = messages[-1].id
+
+    return render_template('users/show.html', profile=profile,
+                           messages=messages, next_before=next_before)
+
 
+@bp.route('/users/<int:user_id>/archive', methods=['GET'])
+def users_archive(user_id):
+    """Show a user's archived (old) messages."""
 
-@app.route('/users/<int:user_id>/following')
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    profile = get_summary_or_404(user_id)
+    messages = repository.archived_messages(user_id)
+    return render_template('users/archive.html', profile=profile,
+                           messages=messages)
+
+
+@bp.route('/users/<int:user_id>/following')
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -187,11 +370,14 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    profile = get_summary_or_404(user_id)
+    following = repository.following(user_id, STREAM_BATCH_SIZE)
+
+    return stream_template('users/following.html', profile=profile,
+                           following=following)
 
 
-@app.route('/users/<int:user_id>/followers')
+@bp.route('/users/<int:user_id>/followers')
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -199,11 +385,36 @@ def users_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    profile = get_summary_or_404(user_id)
+    followers = repository.followers(user_id, STREAM_BATCH_SIZE)
 
+    return stream_template('users/followers.html', profile=profile,
+                           followers=followers)
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+
+@bp.route('/users/suggestions')
+def show_suggestions():
+    """Show who the current user might want to follow.
+
+    Reads the suggestions precomputed by `suggestions.py`.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    suggestions = (FollowSuggestion
+                   .query
+                   .options(joinedload(FollowSuggestion.suggested_user))
+                   .filter(FollowSuggestion.user_id == g.user.id)
+                   .order_by(FollowSuggestion.rank)
+                   .all())
+
+    return render_template('users/suggestions.html', suggestions=suggestions)
+
+
+@bp.route('/users/follow/<int:follow_id>', methods=['POST'])
+@rate_limited('follows')
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -212,13 +423,15 @@ def add_follow(follow_id):
         return redirect("/")
 
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    follow_many(g.user.id, [followed_user.id])
     db.session.commit()
+    follow_graph.add(g.user.id, followed_user.id)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@bp.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@rate_limited('follows')
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -226,14 +439,60 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    unfollow_many(g.user.id, [follow_id])
     db.session.commit()
+    follow_graph.remove(g.user.id, follow_id)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+# Most ids one /api/follows call may name, follows and unfollows together.
+MAX_BULK_FOLLOWS = 10_000
+
+
+@bp.route('/api/follows', methods=['POST'])
+@rate_limited('bulk_follows')
+def api_follows():
+    """Follow and unfollow many users at once (e.g. importing a contact list).
+
+    Takes JSON like `{"follow": [2, 3, ...], "unfollow": [4, ...]}`, applied
+    follows first. Returns how many follows were added and removed, and
+    which ids to follow weren't users.
+    """
+
+    if not g.user:
+        return jsonify(error="Access unauthorized."), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object."), 400
+
+    to_follow = data.get('follow', [])
+    to_unfollow = data.get('unfollow', [])
+
+    for ids in (to_follow, to_unfollow):
+        if not isinstance(ids, list) or not all(
+                type(user_id) is int for user_id in ids):
+            return jsonify(error="Expected lists of user ids."), 400
+
+    if len(to_follow) + len(to_unfollow) > MAX_BULK_FOLLOWS:
+        return jsonify(
+            error=f"At most {MAX_BULK_FOLLOWS} ids per request."), 400
+
+    followed, added = follow_many(g.user.id, to_follow)
+    removed = unfollow_many(g.user.id, to_unfollow)
+    db.session.commit()
+
+    follow_graph.add_many(g.user.id, followed)
+    follow_graph.remove_many(g.user.id, to_unfollow)
+
+    not_found = set(to_follow) - set(followed) - {g.user.id}
+
+    return jsonify(followed=added, unfollowed=removed,
+                   not_found=sorted(not_found))
+
+
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -251,8 +510,11 @@ def profile():
             user.image_url = update_user_form.image_url.data or "/static/images/default-pic.png"
             user.header_image_url = update_user_form.header_image_url.data or "/static/images/warbler-hero.jpg"
             user.bio = update_user_form.bio.data
-            
+            db.session.flush()
+            summaries.refresh([user.id], summaries.DISPLAY_FIELDS)
+
             db.session.commit()
+            user_cache.invalidate(user.id)
             return redirect(f'/users/{g.user.id}')
         else:
             flash("Incorrect password, please try again.", "danger")
@@ -260,7 +522,57 @@ def profile():
     return render_template('/users/edit.html', form=update_user_form, user_id=user.id) #this one actually shows the page
     
 
-@app.route('/users/delete', methods=["POST"])
+@bp.route('/users/export', methods=["GET", "POST"])
+def export_data():
+    """Show the user's data exports; POST to ask for a new one.
+
+    The export itself is run by `export.py`; this page shows its progress.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    jobs = (ExportJob
+            .query
+            .filter_by(user_id=g.user.id)
+            .order_by(ExportJob.id.desc())
+            .limit(10)
+            .all())
+
+    if request.method == 'POST':
+        timeout = current_app.config['EXPORT_TIMEOUT']
+        if any(job.in_progress(timeout) for job in jobs):
+            flash("You already have an export in progress.", "warning")
+        else:
+            db.session.add(ExportJob(user_id=g.user.id))
+            db.session.commit()
+            flash("Export started; it'll be ready to download here.",
+                  "success")
+
+        return redirect("/users/export")
+
+    return render_template('users/export.html', jobs=jobs)
+
+
+@bp.route('/users/export/<int:job_id>', methods=["GET"])
+def download_export(job_id):
+    """Download a finished export."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    job = ExportJob.query.get_or_404(job_id)
+    if job.user_id != g.user.id or job.status != 'done':
+        abort(404)
+
+    return send_file(os.path.join(export_dir(current_app), job.filename),
+                     mimetype='application/zip', as_attachment=True,
+                     attachment_filename=job.filename)
+
+
+@bp.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -268,33 +580,74 @@ def delete_user():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    do_logout()
+    do_logout(everywhere=True)
+
+    # Their likes go away with them (ON DELETE CASCADE), so take them back
+    # out of the like counts first.
+    liked_ids = db.session.query(Like.message_id).filter(Like.user_id == g.user.id)
+    (Message
+        .query
+        .filter(Message.id.in_(liked_ids))
+        .update({Message.like_count: Message.like_count - 1},
+                synchronize_session=False))
+
+    user_id = g.user.id
+    following = list(follow_graph.following(user_id))
+    followers = list(follow_graph.followers(user_id))
+
+    # Messages they liked (changed counts) or wrote (about to be deleted).
+    changed_message_ids = [message_id for (message_id,) in (db.session
+        .query(Message.id)
+        .filter((Message.user_id == user_id) | Message.id.in_(liked_ids)))]
+
+    # Their ExportJob rows cascade; the archives on disk don't.
+    export_files = [job.filename for job in
+                    ExportJob.query.filter_by(user_id=user_id, status='done')]
+
+    unindex_user_messages(user_id)
+    summaries.remove_user(user_id)
 
     db.session.delete(g.user)
     db.session.commit()
 
+    # Imported here: export.py is the worker's, and pulls in zipfile, csv
+    # and argparse, which no other route needs.
+    from export import remove_archives
+    remove_archives(export_dir(current_app), export_files)
+    follow_graph.drop_user(user_id, following, followers)
+    user_cache.invalidate(user_id)
+    auth.token_versions.discard(user_id)
+    message_cache.invalidate(*changed_message_ids)
+
     return redirect("/signup")
 
 
-@app.route('/users/<int:user_id>/likes')
+@bp.route('/users/<int:user_id>/likes')
 def show_likes(user_id):
     """ Display all messages liked by a user. """
-    user = User.query.get_or_404(user_id)
-    #TODO: use ORM solutions instead of 'writing sql queries'
-    #TODO: use count instead of len, it's faster
-    #TODO: use ORM!!!!!!
-    # messages = [Message.query.get(like.message_id) for like in User.query.get(user_id).likes]
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    return render_template('users/likes.html', user=user)
+    profile = get_summary_or_404(user_id)
+
+    messages = (Message
+                .query
+                .join(Like, Like.message_id == Message.id)
+                .filter(Like.user_id == user_id)
+                .options(joinedload(Message.user))
+                .order_by(Like.id.desc())
+                .yield_per(STREAM_BATCH_SIZE))
+
+    return stream_template('users/likes.html', profile=profile,
+                           messages=messages)
 
 
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
+@rate_limited('messages')
 def messages_add():
     """Add a message:
 
@@ -310,22 +663,115 @@ def messages_add():
     if form.validate_on_submit():
         msg = Message(text=form.text.data)
         g.user.messages.append(msg)
+        tag_message(msg)
+        db.session.flush()
+        summaries.add_message(msg)
         db.session.commit()
+        index_message(msg)
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+# Message text in templates goes through `linkify` to link #tags and @mentions.
+bp.add_app_template_filter(linkify)
+
+
+@bp.route('/tags/<name>', methods=["GET"])
+def tag_timeline(name):
+    """Show the latest messages with hashtag #name."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    tag = Tag.query.filter_by(name=name.lower()).first_or_404()
+    messages = (Message
+                .query
+                .join(MessageTag, MessageTag.message_id == Message.id)
+                .options(joinedload(Message.user))
+                .filter(MessageTag.tag_id == tag.id)
+                .order_by(MessageTag.timestamp.desc())
+                .limit(100)
+                .all())
+
+    return render_template('messages/timeline.html', messages=messages,
+                           title=f"#{tag.name}")
+
+
+@bp.route('/users/<int:user_id>/mentions', methods=["GET"])
+def user_mentions(user_id):
+    """Show the latest messages that @mention this user."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    user = user_cache.get_or_404(user_id)
+    messages = (Message
+                .query
+                .join(Mention, Mention.message_id == Message.id)
+                .options(joinedload(Message.user))
+                .filter(Mention.user_id == user.id)
+                .order_by(Mention.timestamp.desc())
+                .limit(100)
+                .all())
+
+    return render_template('messages/timeline.html', messages=messages,
+                           title=f"Mentions of @{user.username}")
+
+
+@bp.route('/messages/search', methods=["GET"])
+def messages_search():
+    """Search messages by text.
+
+    Takes the search in 'q' and, for later pages, the 'cursor' returned
+    with the previous page.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    search = request.args.get('q', '')
+    messages, next_cursor = search_messages(search, request.args.get('cursor'))
+
+    return render_template('messages/search.html', search=search,
+                           messages=messages, next_cursor=next_cursor)
+
+
+@bp.route('/messages/trending', methods=["GET"])
+def messages_trending():
+    """Show the most popular recent messages.
+
+    Reads the ranking precomputed by `trending.py`.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    trending = (TrendingMessage
+                .query
+                .options(joinedload(TrendingMessage.message)
+                         .joinedload(Message.user))
+                .order_by(TrendingMessage.rank)
+                .all())
+
+    return render_template('messages/trending.html', trending=trending)
+
+
+@bp.route('/messages/<int:message_id>', methods=["GET"])
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = (message_cache.get(message_id)
+           or MessageArchive.query.get_or_404(message_id))
     return render_template('messages/show.html', message=msg)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@bp.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -333,9 +779,13 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get(message_id)
+    msg = (Message.query.get(message_id)
+           or MessageArchive.query.get_or_404(message_id))
+    summaries.remove_message(msg)
     db.session.delete(msg)
     db.session.commit()
+    message_cache.invalidate(message_id)
+    unindex_message(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
@@ -343,7 +793,7 @@ def messages_destroy(message_id):
 # Homepage and error pages
 
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def homepage():
     """Show homepage:
 
@@ -374,19 +824,13 @@ def homepage():
 
     #if GET, check if logged in then get user's & followed's msgs and show on homepage
     if g.user:
-        follower_ids = [follower.id for follower in g.user.following]
-        
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(follower_ids) | (Message.user_id == g.user.id))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        messages = repository.timeline(g.user.id, limit=100)
         return render_template('home.html', messages=messages, user_id = g.user.id)
     else:
         return render_template('home-anon.html')
 
-@app.route('/messages/<int:message_id>/like', methods=['POST'])
+@bp.route('/messages/<int:message_id>/like', methods=['POST'])
+@rate_limited('likes')
 def add_like(message_id):
     """toggle liking a message for a logged in user
     """
@@ -396,27 +840,168 @@ def add_like(message_id):
         return redirect("/")
 
     liked_message = Message.query.get_or_404(message_id)
-    
+
     if liked_message in g.user.liked_messages:
         g.user.liked_messages.remove(liked_message)
+        liked_message.like_count = Message.like_count - 1
+        summaries.adjust(g.user.id, likes_count=-1)
     else:
         g.user.liked_messages.append(liked_message)
+        liked_message.like_count = Message.like_count + 1
+        summaries.adjust(g.user.id, likes_count=1)
 
     db.session.commit()
-        
+    message_cache.invalidate(message_id)
+
     return redirect('/')
 
 ##############################################################################
-# Turn off all caching in Flask
+# Images and static assets
+
+
+@bp.route('/images/<size>/<signature>')
+def proxied_image(size, signature):
+    """Serve an external image resized to one of IMAGE_SIZES.
+
+    URLs come from the `resized` template filter and are signed, so this
+    can't be used to fetch arbitrary URLs.
+    """
+
+    url = request.args.get('url', '')
+
+    if size not in IMAGE_SIZES or not verify(
+            current_app.config['SECRET_KEY'], url, size, signature):
+        abort(404)
+
+    try:
+        path, mimetype = current_app.extensions['image_cache'].get(url, size)
+    except ImageFetchError:
+        # Let the browser try the original rather than show a broken image.
+        return redirect(url)
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+_static_hashes = {}
+
+
+def _static_file(filename):
+    """Path of `filename` if it's a real file inside static/, else None."""
+
+    root = os.path.realpath(current_app.static_folder)
+    path = os.path.realpath(os.path.join(root, filename))
+
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+
+    return path
+
+
+@bp.app_template_global()
+def static_url(filename):
+    """URL for a file in static/, fingerprinted with a hash of its contents.
+
+    The fingerprint changes whenever the file does, so these URLs can be
+    cached forever. Names that aren't files in static/ aren't fingerprinted.
+    """
+
+    if filename not in _static_hashes:
+        path = _static_file(filename)
+        if path is None:
+            return f"/static/{filename}"
+
+        with open(path, 'rb') as f:
+            _static_hashes[filename] = hashlib.md5(f.read()).hexdigest()[:12]
+
+    return f"/static/{filename}?v={_static_hashes[filename]}"
+
+
+_asset_manifest = None
+
+
+@bp.app_template_global()
+def asset_urls(bundle):
+    """URLs to load a front-end bundle ('app.css' or 'app.js') from.
+
+    Just the content-hashed bundle once `tools/build_assets.py` has built
+    it; otherwise each of its files separately (see assets.py).
+    """
+
+    global _asset_manifest
+
+    if _asset_manifest is None:
+        _asset_manifest = load_manifest(current_app.static_folder)
+
+    if bundle in _asset_manifest:
+        return [f"/static/{_asset_manifest[bundle]}"]
+
+    return [source if source.startswith('https:') else static_url(source)
+            for source in source_files(current_app.static_folder, bundle)]
+
+
+# Shown instead of /static/ images that don't exist, by size.
+DEFAULT_IMAGES = {
+    'hero': 'images/warbler-hero.jpg',
+    'card-hero': 'images/warbler-hero.jpg',
+}
+DEFAULT_AVATAR = 'images/default-pic.png'
+
+
+@bp.app_template_filter()
+def resized(url, size):
+    """Where to load image `url` from, at one of IMAGE_SIZES.
+
+    Our own /static/ images are already small, so they're only fingerprinted
+    (or replaced by the default image if there's no such file); external
+    ones go through the resizing proxy.
+    """
+
+    if not url:
+        return url
+
+    if url.startswith('/static/'):
+        filename = url[len('/static/'):]
+        if _static_file(filename) is None:
+            filename = DEFAULT_IMAGES.get(size, DEFAULT_AVATAR)
+        return static_url(filename)
+
+    return proxy_url(current_app.config['SECRET_KEY'], url, size)
+
+
+##############################################################################
+# Metrics
+
+
+@bp.route('/metrics')
+def show_metrics():
+    """This process's counters, for a Prometheus-style scraper."""
+
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+##############################################################################
+# Turn off caching of pages in Flask
 #   (useful for dev; in production, this kind of stuff is typically
 #   handled elsewhere)
 #
 # https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
 
-@app.after_request
+@bp.after_app_request
 def add_header(response):
-    """Add non-caching headers on every request."""
+    """Add non-caching headers to pages.
+
+    Fingerprinted static files, asset bundles and proxied images never
+    change at a given URL, so those are cached for good instead.
+    """
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
+    if request.endpoint == 'static' and (
+            request.args.get('v')
+            or request.view_args['filename'].startswith(f'{ASSET_DIST}/')):
+        response.headers['Cache-Control'] = IMMUTABLE
+    elif response.headers.get('Cache-Control') != IMMUTABLE:
+        response.cache_control.no_store = True
+
     return response
@@ -0,0 +1,117 @@
+"""Move old messages (and their likes) into the archive tables.
+
+Profiles and timelines only read `messages`, which should hold recent
+warbles only; older ones go to `messages_archive` / `likes_archive`, where
+they can still be looked at but don't bloat the hot indexes. Their hashtags
+and mentions are kept in `messages_tags_archive` / `mentions_archive`, but
+archived messages no longer show on tag and mention timelines.
+
+Each batch is copied and deleted in its own transaction, with the messages
+locked first so no like can be added to them between copying and deleting.
+Run it on a schedule:
+
+    python archive.py               # archive everything over a year old
+    python archive.py --days 90
+    python archive.py --every 3600  # keep running, once an hour
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import (db, Like, LikeArchive, Mention, MentionArchive, Message,
+                    MessageArchive, MessageTag, MessageTagArchive)
+from search import unindex_message
+
+ARCHIVE_AFTER = timedelta(days=365)
+
+BATCH_SIZE = 1000
+
+MESSAGE_COLUMNS = ['id', 'text', 'timestamp', 'user_id', 'like_count']
+LIKE_COLUMNS = ['id', 'user_id', 'message_id']
+TAG_COLUMNS = ['tag_id', 'message_id', 'timestamp']
+MENTION_COLUMNS = ['user_id', 'message_id', 'timestamp']
+
+
+def archive_batch(cutoff, batch_size=BATCH_SIZE):
+    """Archive up to `batch_size` messages older than `cutoff`.
+
+    Returns how many were moved.
+    """
+
+    # FOR UPDATE blocks new likes of these messages (their foreign key check
+    # needs a share lock on the message) until the batch is committed, so
+    # every like deleted below has been copied. SQLite has no row locks,
+    # but only runs one write transaction at a time anyway.
+    ids = [message_id for (message_id,) in (db.session
+           .query(Message.id)
+           .filter(Message.timestamp < cutoff)
+           .order_by(Message.id)
+           .limit(batch_size)
+           .with_for_update())]
+
+    if not ids:
+        return 0
+
+    def move(model, archive_model, columns, key):
+        table = model.__table__
+        db.session.execute(archive_model.__table__.insert().from_select(
+            columns,
+            select([table.c[name] for name in columns])
+            .where(table.c[key].in_(ids))))
+
+    move(Message, MessageArchive, MESSAGE_COLUMNS, 'id')
+    move(Like, LikeArchive, LIKE_COLUMNS, 'message_id')
+    move(MessageTag, MessageTagArchive, TAG_COLUMNS, 'message_id')
+    move(Mention, MentionArchive, MENTION_COLUMNS, 'message_id')
+
+    # Likes are deleted explicitly as they've been copied; tags, mentions
+    # (copied too) and trending rows go with the messages (ON DELETE
+    # CASCADE).
+    likes = Like.__table__
+    messages = Message.__table__
+    db.session.execute(likes.delete().where(likes.c.message_id.in_(ids)))
+    db.session.execute(messages.delete().where(messages.c.id.in_(ids)))
+    db.session.commit()
+
+    for message_id in ids:
+        unindex_message(message_id)
+
+    return len(ids)
+
+
+def archive_old_messages(now=None, older_than=ARCHIVE_AFTER,
+                         batch_size=BATCH_SIZE):
+    """Archive every message older than `older_than`. Returns the count."""
+
+    cutoff = (now or datetime.utcnow()) - older_than
+    total = 0
+
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+
+
+if __name__ == '__main__':
+    from config import create_db_app
+
+    parser = argparse.ArgumentParser(description="Archive old messages.")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER.days,
+                        help="archive messages older than this many days")
+    parser.add_argument('--every', type=int, metavar='SECONDS',
+                        help="keep running, archiving this often")
+    args = parser.parse_args()
+
+    create_db_app()
+
+    while True:
+        count = archive_old_messages(older_than=timedelta(days=args.days))
+        print(f"archived {count} messages")
+
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,241 @@
+"""Self-hosted, bundled front-end assets.
+
+Bootstrap, jQuery, Popper and Font Awesome are vendored (at pinned
+versions) into static/vendor/, then concatenated with our own stylesheet
+into one content-hashed CSS and one JS file in static/dist/. A manifest maps
+bundle names to the hashed files, which can be cached forever. Rebuild after
+changing style.css or a pinned version:
+
+    python tools/build_assets.py
+
+Until the bundles are built, pages load the individual files: the vendored
+copies if they've been downloaded, else the same pinned versions from unpkg.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+# static/vendor/ path -> where to download it from.
+VENDOR = {
+    'bootstrap.min.css':
+        'https://unpkg.com/bootstrap@4.5.2/dist/css/bootstrap.min.css',
+    'fontawesome/css/all.min.css':
+        'https://unpkg.com/@fortawesome/fontawesome-free@5.3.1/css/all.min.css',
+    'jquery.min.js':
+        'https://unpkg.com/jquery@3.5.1/dist/jquery.min.js',
+    'popper.min.js':
+        'https://unpkg.com/popper.js@1.16.1/dist/umd/popper.min.js',
+    'bootstrap.min.js':
+        'https://unpkg.com/bootstrap@4.5.2/dist/js/bootstrap.min.js',
+}
+
+# all.min.css refers to these as ../webfonts/...; every browser we support
+# takes woff2, so the older formats aren't fetched (and build() drops their
+# url()s from the bundle).
+for _style in ('brands-400', 'regular-400', 'solid-900'):
+    VENDOR[f'fontawesome/webfonts/fa-{_style}.woff2'] = (
+        'https://unpkg.com/@fortawesome/fontawesome-free@5.3.1'
+        f'/webfonts/fa-{_style}.woff2')
+
+# Bundle name -> its sources, relative to static/, in order.
+BUNDLES = {
+    'app.css': ['vendor/bootstrap.min.css',
+                'vendor/fontawesome/css/all.min.css',
+                'stylesheets/style.css'],
+    'app.js': ['vendor/jquery.min.js', 'vendor/popper.min.js',
+               'vendor/bootstrap.min.js'],
+}
+
+DIST = 'dist'
+MANIFEST = posixpath.join(DIST, 'manifest.json')
+
+
+def load_manifest(static_dir):
+    """The built bundle name -> file mapping, or {} if not built yet."""
+
+    try:
+        with open(os.path.join(static_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def source_files(static_dir, bundle):
+    """Paths (relative to static/) or URLs to load `bundle` unbundled."""
+
+    sources = []
+
+    for source in BUNDLES[bundle]:
+        name = source[len('vendor/'):] if source.startswith('vendor/') else None
+
+        if name and not os.path.exists(os.path.join(static_dir, source)):
+            sources.append(VENDOR[name])
+        else:
+            sources.append(source)
+
+    return sources
+
+
+##############################################################################
+# Building (see tools/build_assets.py)
+
+
+def fetch(url):
+    """Download a vendored file."""
+
+    import requests
+
+    resp = requests.get(url, timeout=30)
+    resp.raise_for_status()
+    return resp.content
+
+
+def vendor(static_dir, fetch=fetch, force=False):
+    """Download any VENDOR files we don't have yet. Returns their names."""
+
+    fetched = []
+
+    for name, url in VENDOR.items():
+        path = os.path.join(static_dir, 'vendor', name)
+        if os.path.exists(path) and not force:
+            continue
+
+        # Download first, so a failed fetch doesn't leave an empty file
+        # that later runs would take for the real one.
+        data = fetch(url)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        fetched.append(name)
+
+    return fetched
+
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def rebase_css_urls(css, source, dest, static_dir=None):
+    """Rewrite relative url()s in `source`'s CSS to work from `dest`.
+
+    With `static_dir`, url()s of files in it also get a `?v=` fingerprint
+    of their contents (like `static_url`), so fonts and images the bundle
+    loads can be cached for good too.
+    """
+
+    source_dir = posixpath.dirname(source)
+    dest_dir = posixpath.dirname(dest)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+
+        url, query = re.match(r"([^?#]*)(.*)", url).groups()
+        path = posixpath.normpath(posixpath.join(source_dir, url))
+        rebased = posixpath.relpath(path, dest_dir)
+
+        file_path = static_dir and os.path.join(static_dir, path)
+        if not query and file_path and os.path.isfile(file_path):
+            with open(file_path, 'rb') as f:
+                query = f"?v={hashlib.md5(f.read()).hexdigest()[:12]}"
+
+        return f"url({quote}{rebased}{query}{quote})"
+
+    return CSS_URL.sub(rebase, css)
+
+
+FONT_SRC = re.compile(r"src:([^;}]*)(;?)")
+
+
+def drop_missing_fonts(css, source, static_dir):
+    """Remove @font-face sources in `source`'s CSS that aren't in static/.
+
+    Vendored stylesheets list fonts in formats we don't download; leaving
+    them in would have browsers that try them first request missing files.
+    A `src` left with no sources is removed altogether.
+    """
+
+    source_dir = posixpath.dirname(source)
+
+    def exists(entry):
+        match = CSS_URL.search(entry)
+        if not match:
+            return True
+
+        url = match.group(2)
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return True
+
+        path = posixpath.join(source_dir, re.match(r"[^?#]*", url).group(0))
+        return os.path.isfile(os.path.join(static_dir, path))
+
+    def drop(match):
+        entries = [entry for entry in match.group(1).split(',')
+                   if exists(entry)]
+        return f"src:{','.join(entries)}{match.group(2)}" if entries else ""
+
+    return FONT_SRC.sub(drop, css)
+
+
+def minify_css(css):
+    """Strip comments and needless whitespace from CSS."""
+
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+
+    return css.strip()
+
+
+def build(static_dir):
+    """Write every bundle to static/dist/ and the manifest. Returns it."""
+
+    manifest = {}
+    dist_dir = os.path.join(static_dir, DIST)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    for bundle, sources in BUNDLES.items():
+        base, ext = posixpath.splitext(bundle)
+        parts = []
+
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+                text = f.read()
+
+            if ext == '.css':
+                text = drop_missing_fonts(text, source, static_dir)
+                text = rebase_css_urls(text, source,
+                                       posixpath.join(DIST, bundle),
+                                       static_dir)
+                if not source.endswith('.min.css'):
+                    text = minify_css(text)
+
+            parts.append(text)
+
+        # ';' so a JS file missing its trailing semicolon can't run into the
+        # next one.
+        data = ('\n' if ext == '.css' else ';\n').join(parts).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        path = posixpath.join(DIST, f"{base}.{digest}{ext}")
+
+        with open(os.path.join(static_dir, path), 'wb') as f:
+            f.write(data)
+        manifest[bundle] = path
+
+    # Drop bundles from previous builds.
+    current = {posixpath.basename(path) for path in manifest.values()}
+    for filename in os.listdir(dist_dir):
+        if filename not in current and filename != 'manifest.json':
+            os.remove(os.path.join(dist_dir, filename))
+
+    with open(os.path.join(static_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    return manifest
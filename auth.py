@@ -0,0 +1,181 @@
+"""Signed login tokens (AUTH_MODE = 'token').
+
+Instead of keeping the logged-in user's id in the Flask session, login
+sets a small cookie of its own holding a signed, timestamped
+`[user id, token version]` (API clients can send the same token as
+`Authorization: Bearer <token>`). A request is logged in if the signature
+checks out, the token isn't older than AUTH_TOKEN_MAX_AGE, and its version
+is still the user's `token_version`.
+
+Versions are cached per process for AUTH_VERSION_TTL seconds, so most
+requests check their token without SQL. Logging out just drops the cookie.
+Logging out everywhere (a POST) bumps the version, which revokes every
+token issued to the user so far, on all their devices; deleting the
+account revokes them all too. Other workers notice within the TTL, this
+one straight away.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import after_this_request, current_app, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from entity_cache import user_cache
+from models import db, User
+
+COOKIE_NAME = 'warbler_auth'
+
+# Versions older than this are reloaded, to see other workers' revocations.
+DEFAULT_TTL = 10
+
+DEFAULT_MAX_USERS = 100_000
+
+
+class TokenVersions:
+    """LRU map of user id -> current token version (None: no such user)."""
+
+    def __init__(self, load, ttl=DEFAULT_TTL, max_users=DEFAULT_MAX_USERS):
+        self.load = load
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """`user_id`'s token version, loading it if needed."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        version = self.load(user_id)
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), version)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+        return version
+
+    def discard(self, user_id):
+        """Forget `user_id`'s version (after changing or deleting it)."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_version(user_id):
+    return (db.session
+            .query(User.token_version)
+            .filter(User.id == user_id)
+            .scalar())
+
+
+token_versions = TokenVersions(_load_version)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='warbler-auth')
+
+
+def make_token(user):
+    """A signed token logging in as `user`, until their version changes."""
+
+    return _serializer().dumps([user.id, user.token_version])
+
+
+def verify_token(token):
+    """The id of the user `token` logs in as, or None if it isn't valid."""
+
+    try:
+        user_id, version = _serializer().loads(
+            token, max_age=current_app.config['AUTH_TOKEN_MAX_AGE'])
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+    if token_versions.get(user_id) != version:
+        return None
+
+    return user_id
+
+
+def request_token():
+    """The token sent with this request (header first, then cookie)."""
+
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):]
+
+    return request.cookies.get(COOKIE_NAME)
+
+
+def current_user_id():
+    """The id of the user this request's token logs in as, if any.
+
+    A cookie that's no longer valid is deleted.
+    """
+
+    token = request_token()
+    if token is None:
+        return None
+
+    user_id = verify_token(token)
+    if user_id is None and request.cookies.get(COOKIE_NAME) == token:
+        after_this_request(_delete_cookie)
+
+    return user_id
+
+
+def set_cookie(user):
+    """Log in as `user` with a token cookie on this request's response."""
+
+    token = make_token(user)
+
+    @after_this_request
+    def set_token_cookie(response):
+        response.set_cookie(
+            COOKIE_NAME, token,
+            max_age=current_app.config['AUTH_TOKEN_MAX_AGE'],
+            secure=current_app.config['SESSION_COOKIE_SECURE'],
+            httponly=True, samesite='Lax')
+        return response
+
+
+def _delete_cookie(response):
+    response.delete_cookie(COOKIE_NAME)
+    return response
+
+
+def delete_cookie():
+    """Drop the token cookie on this request's response (log out here)."""
+
+    after_this_request(_delete_cookie)
+
+
+def revoke(user_id):
+    """Invalidate every token issued to `user_id`, and delete the cookie.
+
+    Commits.
+    """
+
+    (User
+        .query
+        .filter(User.id == user_id)
+        .update({User.token_version: User.token_version + 1},
+                synchronize_session=False))
+    db.session.commit()
+    token_versions.discard(user_id)
+    user_cache.invalidate(user_id)
+
+    after_this_request(_delete_cookie)
@@ -0,0 +1,190 @@
+"""WSGI middleware compressing text responses with brotli or gzip.
+
+Pages are mostly repeated markup (a hundred near-identical `<li>`s on the
+timeline), which compresses very well. Brotli is used when the `brotli`
+package is installed and the client accepts it, else gzip.
+
+Responses with a Content-Length are compressed in one go (and skipped if
+they're too small to be worth it); streamed responses, which have none, are
+compressed chunk by chunk and flushed after each chunk, so they still
+reach the browser as they're produced. Data an app sends with the legacy
+`write()` callable is treated as body chunks coming before the ones it
+returns.
+"""
+
+import itertools
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+
+
+class GzipEncoder:
+    """Incremental gzip, with a flush that doesn't end the stream."""
+
+    def __init__(self, level):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._zlib.compress(data)
+
+    def flush(self):
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush()
+
+
+class BrotliEncoder:
+    """Incremental brotli, with the same interface as GzipEncoder."""
+
+    def __init__(self, quality):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._brotli.process(data)
+
+    def flush(self):
+        return self._brotli.flush()
+
+    def finish(self):
+        return self._brotli.finish()
+
+
+class Compress:
+    """Wrap a WSGI app so text responses are compressed when accepted."""
+
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=5):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, accept_encoding):
+        """'br', 'gzip' or None, from an Accept-Encoding header."""
+
+        accepted = parse_accept_header(accept_encoding)
+
+        if brotli and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+
+        return None
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+
+        return GzipEncoder(self.gzip_level)
+
+    def __call__(self, environ, start_response):
+        encoding = self.choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+
+        if not encoding or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+
+        started = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            started[:] = [status, headers, exc_info]
+            return written.append
+
+        app_iter = self.app(environ, capture)
+
+        return self._respond(app_iter, written, started, start_response,
+                             encoding)
+
+    @staticmethod
+    def _chunks(app_iter, written):
+        """The body: `write()` data, in order, interleaved with `app_iter`."""
+
+        def drain():
+            while written:
+                yield written.pop(0)
+
+        yield from drain()
+        for chunk in app_iter:
+            yield from drain()
+            yield chunk
+        yield from drain()
+
+    def _compressible(self, status, headers):
+        if not status.startswith('200'):
+            return False
+
+        content_type = headers.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+
+        if 'Content-Encoding' in headers:
+            return False
+
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _respond(self, app_iter, written, started, start_response, encoding):
+        """Generate the (possibly compressed) body, starting the response."""
+
+        try:
+            chunks = self._chunks(app_iter, written)
+
+            # The app may not start its response until its first chunk.
+            body = []
+            while not started:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                body.append(chunk)
+
+            status, headers, exc_info = started
+            headers = Headers(headers)
+
+            if not self._compressible(status, headers):
+                start_response(status, headers.to_wsgi_list(), exc_info)
+                yield from body
+                yield from chunks
+                return
+
+            headers['Content-Encoding'] = encoding
+            headers.add('Vary', 'Accept-Encoding')
+
+            # It's a different representation now, so can't share a strong
+            # ETag with the uncompressed one.
+            etag = headers.get('ETag')
+            if etag and not etag.startswith('W/'):
+                headers['ETag'] = 'W/' + etag
+
+            encoder = self.encoder(encoding)
+
+            if 'Content-Length' in headers:
+                body.extend(chunks)
+                data = encoder.compress(b''.join(body)) + encoder.finish()
+                headers['Content-Length'] = str(len(data))
+                start_response(status, headers.to_wsgi_list(), exc_info)
+                yield data
+                return
+
+            start_response(status, headers.to_wsgi_list(), exc_info)
+
+            for chunk in itertools.chain(body, chunks):
+                if not chunk:
+                    continue
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+
+            yield encoder.finish()
+
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
@@ -0,0 +1,102 @@
+"""Configuration for Warbler apps."""
+
+import os
+
+from flask import Flask
+
+from models import connect_db
+
+
+def configure_app(app, overrides=None):
+    """Load Warbler settings onto `app`.
+
+    Get DB_URI from environ variable (useful for production/testing) or,
+    if not set there, use development local db.
+    """
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        os.environ.get('DATABASE_URL', 'postgres:///warbler'))
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ECHO'] = False
+    app.config['DEBUG_TB_ENABLED'] = bool(os.environ.get('DEBUG_TB_ENABLED'))
+    app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+
+    # Resized images from the image proxy (defaults to instance/image_cache).
+    app.config['IMAGE_CACHE_DIR'] = os.environ.get('IMAGE_CACHE_DIR')
+    app.config['IMAGE_CACHE_MAX_BYTES'] = int(
+        os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+    # Hosts the image proxy may fetch from even though they aren't public
+    # (comma separated). Empty in production; see image_proxy.check_host.
+    app.config['IMAGE_PROXY_ALLOWED_HOSTS'] = [
+        host for host in
+        os.environ.get('IMAGE_PROXY_ALLOWED_HOSTS', '').split(',') if host]
+
+    # Finished data exports (defaults to instance/exports). See export.py;
+    # the export worker and the web app must both see this directory.
+    app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR')
+    # Running exports that haven't recorded progress (a batch) for this
+    # long are taken to have lost their worker; finished archives are
+    # deleted after EXPORT_TTL. Both in seconds.
+    app.config['EXPORT_TIMEOUT'] = 15 * 60
+    app.config['EXPORT_TTL'] = 7 * 24 * 3600
+
+    # 'session' keeps the logged-in user's id in the Flask session; 'token'
+    # uses signed, revocable login tokens instead (see auth.py).
+    app.config['AUTH_MODE'] = os.environ.get('AUTH_MODE', 'session')
+    app.config['AUTH_TOKEN_MAX_AGE'] = 30 * 24 * 3600
+    app.config['AUTH_VERSION_TTL'] = 10
+
+    # Users and messages cached by id across requests (see entity_cache.py).
+    app.config['ENTITY_CACHE_URL'] = os.environ.get('ENTITY_CACHE_URL')
+    app.config['ENTITY_CACHE_TTL'] = 30
+    app.config['ENTITY_CACHE_SIZE'] = 10_000
+
+    # Write-route rate limits: name -> {'user' or 'ip': (count, seconds)}.
+    # See ratelimit.py.
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_STORAGE_URL'] = os.environ.get('RATELIMIT_STORAGE_URL')
+    app.config['RATELIMITS'] = {
+        'signup': {'ip': (10, 3600)},
+        'messages': {'user': (30, 60), 'ip': (120, 60)},
+        'likes': {'user': (60, 60), 'ip': (240, 60)},
+        'follows': {'user': (60, 60), 'ip': (240, 60)},
+        'bulk_follows': {'user': (10, 60), 'ip': (30, 60)},
+    }
+
+    # Compress text responses at least this big (see compress.py).
+    app.config['COMPRESS_MIN_SIZE'] = 500
+    app.config['COMPRESS_LEVEL'] = 6
+
+    # Drop the whitespace around {% ... %} tags from rendered templates.
+    app.config['TEMPLATE_TRIM_WHITESPACE'] = True
+
+    # How many reverse proxies (e.g. Heroku's router) set X-Forwarded-For
+    # in front of us; needed to rate limit by the real client address.
+    app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', 0))
+
+    if overrides:
+        app.config.update(overrides)
+
+
+def export_dir(app):
+    """Where `export.py` writes data exports and the app serves them from."""
+
+    return (app.config['EXPORT_DIR']
+            or os.path.join(app.instance_path, 'exports'))
+
+
+def create_db_app(overrides=None):
+    """Make a bare app that only has the database bound to it.
+
+    For scripts like `seed.py` that need `db` but none of the routes, forms
+    or templates.
+    """
+
+    app = Flask(__name__)
+    configure_app(app, overrides)
+    connect_db(app)
+
+    return app
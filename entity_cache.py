@@ -0,0 +1,226 @@
+"""Cross-request cache of `User` and `Message` rows by id.
+
+Nearly every request looks up the logged-in user, and most look up another
+user or a message by id. The session's identity map only lasts one request,
+so without this each of those is a query.
+
+There are two tiers:
+
+- a per-process LRU of column values, which is checked first (a hit there
+  costs no round trip at all);
+- optionally, a shared cache (a redis:// ENTITY_CACHE_URL, needs the `redis`
+  package) that every worker on the machine reads and fills.
+
+Cached rows are merged into `db.session` without a query, so they behave
+like instances loaded from the database (relationships still lazy-load).
+
+Routes that change a cached row call `invalidate` after committing. That
+drops this process's copy and, with a shared tier, bumps the row's version
+there so the shared copy is ignored from then on. Other workers' local
+copies can still be served for up to `ttl` seconds (like `follow_graph`),
+so this is only for pages; routes that change a row load it from the
+database.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy.orm import make_transient_to_detached
+
+import metrics
+from models import db, User, Message
+
+DEFAULT_TTL = 30
+
+DEFAULT_MAX_SIZE = 10_000
+
+hits = metrics.counter(
+    'entity_cache_hits_total', "Entity lookups answered from a cache tier.")
+misses = metrics.counter(
+    'entity_cache_misses_total', "Entity lookups that went to the database.")
+
+
+class RedisTier:
+    """Column values shared between processes, under versioned keys."""
+
+    def __init__(self, url, ttl):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def version(self, key):
+        return int(self.redis.get(f"{key}:version") or 0)
+
+    def get(self, key, version):
+        data = self.redis.get(f"{key}:v{version}")
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, version, values):
+        self.redis.set(f"{key}:v{version}", json.dumps(values), ex=self.ttl)
+
+    def bump(self, key):
+        self.redis.incr(f"{key}:version")
+
+
+class EntityCache:
+    """Lookups by primary key for one model, through the cache tiers."""
+
+    def __init__(self, model, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.model = model
+        self.ttl = ttl
+        self.max_size = max_size
+        self.shared = None
+
+        # Filled in on first use: reading the mapper's columns configures
+        # every mapper, which is too slow to do when the module is imported.
+        self.columns = None
+        self.datetimes = None
+        self.prefix = None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _describe(self):
+        attrs = self.model.__mapper__.column_attrs
+
+        self.datetimes = {column.key for column in attrs
+                          if isinstance(column.columns[0].type, db.DateTime)}
+
+        # Part of every key, so a change to the columns can't read rows
+        # cached in the old shape.
+        columns = [column.key for column in attrs]
+        schema = hashlib.sha1(' '.join(columns).encode()).hexdigest()[:8]
+        self.prefix = f"entity:{self.model.__tablename__}:{schema}"
+        self.columns = columns
+
+    def get(self, entity_id):
+        """The instance with this primary key (in `db.session`), or None.
+
+        May be up to `ttl` seconds out of date.
+        """
+
+        if entity_id is None:
+            return None
+
+        if self.columns is None:
+            self._describe()
+
+        entity_id = int(entity_id)
+        name = self.model.__tablename__
+
+        values = self._get_local(entity_id)
+        tier = 'local'
+
+        if values is None and self.shared:
+            key = f"{self.prefix}:{entity_id}"
+            version = self.shared.version(key)
+            shared_values = self.shared.get(key, version)
+            if shared_values is not None:
+                values = self._decode(shared_values)
+                tier = 'shared'
+                self._set_local(entity_id, values)
+
+        if values is None:
+            misses.inc(entity=name)
+            instance = self.model.query.get(entity_id)
+            if instance is None:
+                return None
+
+            values = {column: getattr(instance, column)
+                      for column in self.columns}
+            self._set_local(entity_id, values)
+            if self.shared:
+                self.shared.set(key, version, self._encode(values))
+
+            return instance
+
+        hits.inc(entity=name, tier=tier)
+
+        instance = self.model(**values)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
+
+    def get_or_404(self, entity_id):
+        instance = self.get(entity_id)
+        if instance is None:
+            abort(404)
+        return instance
+
+    def invalidate(self, *entity_ids):
+        """Forget rows that have changed or been deleted."""
+
+        with self._lock:
+            for entity_id in entity_ids:
+                self._entries.pop(int(entity_id), None)
+
+        if self.shared:
+            if self.prefix is None:
+                self._describe()
+
+            for entity_id in entity_ids:
+                self.shared.bump(f"{self.prefix}:{int(entity_id)}")
+
+    def clear(self):
+        """Forget every row this process has cached."""
+
+        with self._lock:
+            self._entries.clear()
+
+    def _get_local(self, entity_id):
+        with self._lock:
+            entry = self._entries.get(entity_id)
+
+            if entry is None:
+                return None
+
+            cached_at, values = entry
+            if time.monotonic() - cached_at >= self.ttl:
+                del self._entries[entity_id]
+                return None
+
+            self._entries.move_to_end(entity_id)
+            return values
+
+    def _set_local(self, entity_id, values):
+        with self._lock:
+            self._entries[entity_id] = (time.monotonic(), values)
+            self._entries.move_to_end(entity_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _encode(self, values):
+        """Column values as JSON-friendly types, for the shared tier."""
+
+        return {column: (value.isoformat()
+                         if column in self.datetimes and value else value)
+                for column, value in values.items()}
+
+    def _decode(self, values):
+        return {column: (datetime.fromisoformat(value)
+                         if column in self.datetimes and value else value)
+                for column, value in values.items()}
+
+
+user_cache = EntityCache(User)
+message_cache = EntityCache(Message)
+
+
+def configure_entity_caches(app):
+    """Apply the app's ENTITY_CACHE_* settings to both caches."""
+
+    shared = None
+    if app.config['ENTITY_CACHE_URL']:
+        shared = RedisTier(app.config['ENTITY_CACHE_URL'],
+                           app.config['ENTITY_CACHE_TTL'])
+
+    for cache in (user_cache, message_cache):
+        cache.ttl = app.config['ENTITY_CACHE_TTL']
+        cache.max_size = app.config['ENTITY_CACHE_SIZE']
+        cache.shared = shared
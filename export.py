@@ -0,0 +1,275 @@
+"""Export a user's data as a zip of NDJSON and CSV files.
+
+Users ask for an export on /users/export, which adds a pending ExportJob.
+This script picks those up and writes each archive to EXPORT_DIR, so the
+work stays out of the web workers:
+
+    python export.py               # run the pending exports, then stop
+    python export.py --every 5     # keep polling for new ones
+
+Rows are read in keyset-paginated batches and written straight into the
+compressed archive, so memory use doesn't grow with the account. Progress
+is committed after every batch for the status page to show.
+
+Each pass also fails running jobs that haven't recorded progress for
+EXPORT_TIMEOUT (their worker died) and deletes archives older than
+EXPORT_TTL.
+"""
+
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import time
+import traceback
+import zipfile
+from datetime import datetime, timedelta
+
+from models import (db, ExportJob, Follows, Like, LikeArchive, Message,
+                    MessageArchive, User)
+
+BATCH_SIZE = 1000
+
+
+def _sections(user_id):
+    """(filename, column names, [(key column, query), ...]) per file.
+
+    Each query selects its key column (unique, to paginate on) and then the
+    named columns.
+    """
+
+    def messages(model):
+        return (model.id, db.session
+                .query(model.id, model.id, model.text, model.timestamp,
+                       model.like_count)
+                .filter(model.user_id == user_id))
+
+    def likes(like, message):
+        return (like.id, db.session
+                .query(like.id, message.id, User.username, message.text,
+                       message.timestamp)
+                .join(message, message.id == like.message_id)
+                .join(User, User.id == message.user_id)
+                .filter(like.user_id == user_id))
+
+    def users(join_on, where):
+        return (User.id, db.session
+                .query(User.id, User.id, User.username)
+                .join(Follows, join_on == User.id)
+                .filter(where == user_id))
+
+    return [
+        ('messages.ndjson', ['id', 'text', 'timestamp', 'like_count'],
+         [messages(Message), messages(MessageArchive)]),
+        ('likes.ndjson', ['message_id', 'author', 'text', 'timestamp'],
+         [likes(Like, Message), likes(LikeArchive, MessageArchive)]),
+        ('following.csv', ['id', 'username'],
+         [users(Follows.user_being_followed_id, Follows.user_following_id)]),
+        ('followers.csv', ['id', 'username'],
+         [users(Follows.user_following_id, Follows.user_being_followed_id)]),
+    ]
+
+
+def _batches(key, query):
+    """Rows of `query` in batches of BATCH_SIZE, ordered by `key`."""
+
+    last = None
+
+    while True:
+        q = query if last is None else query.filter(key > last)
+        batch = q.order_by(key).limit(BATCH_SIZE).all()
+
+        if not batch:
+            return
+
+        yield batch
+        last = batch[-1][0]
+
+
+def _write(f, filename, columns, rows):
+    if filename.endswith('.csv'):
+        csv.writer(f).writerows(row[1:] for row in rows)
+        return
+
+    for row in rows:
+        record = dict(zip(columns, row[1:]))
+        f.write(json.dumps(record, default=datetime.isoformat) + '\n')
+
+
+class JobReclaimed(Exception):
+    """The job was failed as stale while this worker was still running it."""
+
+
+def _set(job_id, **values):
+    """Update (and commit) a running job's columns, bumping its heartbeat.
+
+    Returns False if the job isn't running any more.
+    """
+
+    updated = (ExportJob
+               .query
+               .filter_by(id=job_id, status='running')
+               .update({**values, 'updated_at': datetime.utcnow()}))
+    db.session.commit()
+
+    return bool(updated)
+
+
+def run_export(job_id, export_dir):
+    """Claim a pending job and write its archive.
+
+    Returns False if the job wasn't pending (another worker got it first).
+    """
+
+    claimed = (ExportJob
+               .query
+               .filter_by(id=job_id, status='pending')
+               .update({'status': 'running',
+                        'started_at': datetime.utcnow(),
+                        'updated_at': datetime.utcnow()}))
+    db.session.commit()
+
+    if not claimed:
+        return False
+
+    job = ExportJob.query.get(job_id)
+    path = os.path.join(export_dir, job.filename)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    sections = _sections(job.user_id)
+
+    try:
+        _set(job_id, total_rows=sum(query.count()
+                                    for _, _, queries in sections
+                                    for _, query in queries))
+
+        os.makedirs(export_dir, exist_ok=True)
+        written = 0
+
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename, columns, queries in sections:
+                with io.TextIOWrapper(archive.open(filename, 'w'),
+                                      encoding='utf-8', newline='') as f:
+                    if filename.endswith('.csv'):
+                        csv.writer(f).writerow(columns)
+
+                    for key, query in queries:
+                        for batch in _batches(key, query):
+                            _write(f, filename, columns, batch)
+                            written += len(batch)
+                            if not _set(job_id, rows_written=written):
+                                raise JobReclaimed(job_id)
+
+        os.replace(tmp_path, path)
+
+    except Exception:
+        db.session.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        _set(job_id, status='failed', finished_at=datetime.utcnow(),
+             error=traceback.format_exc(limit=1))
+        return True
+
+    if not _set(job_id, status='done', finished_at=datetime.utcnow()):
+        # Reclaimed just before finishing; nothing will serve this file.
+        os.remove(path)
+
+    return True
+
+
+def run_pending_exports(export_dir):
+    """Run every pending export, oldest first. Returns how many ran."""
+
+    pending = [job_id for (job_id,) in (db.session
+               .query(ExportJob.id)
+               .filter(ExportJob.status == 'pending')
+               .order_by(ExportJob.id))]
+
+    return sum(run_export(job_id, export_dir) for job_id in pending)
+
+
+def reclaim_stale_exports(export_dir, timeout):
+    """Fail running jobs with no progress for `timeout` seconds.
+
+    Their worker was killed mid-job; without this they'd stay running, and
+    their users couldn't start another export. Returns how many.
+    """
+
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    stale = (ExportJob
+             .query
+             .filter(ExportJob.status == 'running',
+                     ExportJob.updated_at < cutoff)
+             .all())
+
+    for job in stale:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+        job.error = "Timed out (the export worker stopped)"
+
+        for tmp_path in glob.glob(
+                os.path.join(export_dir, f"{job.filename}.*.tmp")):
+            os.remove(tmp_path)
+
+    db.session.commit()
+    return len(stale)
+
+
+def expire_exports(export_dir, ttl):
+    """Delete archives finished over `ttl` seconds ago. Returns how many."""
+
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    expired = (ExportJob
+               .query
+               .filter(ExportJob.status == 'done',
+                       ExportJob.finished_at < cutoff)
+               .all())
+
+    for job in expired:
+        job.status = 'expired'
+        remove_archives(export_dir, [job.filename])
+
+    db.session.commit()
+    return len(expired)
+
+
+def remove_archives(export_dir, filenames):
+    """Delete these archives from `export_dir`, if they're there."""
+
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(export_dir, filename))
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    from config import create_db_app, export_dir
+
+    parser = argparse.ArgumentParser(description="Run pending data exports.")
+    parser.add_argument('--every', type=int, metavar='SECONDS',
+                        help="keep running, checking this often")
+    args = parser.parse_args()
+
+    app = create_db_app()
+
+    while True:
+        directory = export_dir(app)
+
+        count = reclaim_stale_exports(directory, app.config['EXPORT_TIMEOUT'])
+        if count:
+            print(f"failed {count} stale exports")
+
+        count = expire_exports(directory, app.config['EXPORT_TTL'])
+        if count:
+            print(f"expired {count} exports")
+
+        count = run_pending_exports(directory)
+        if count:
+            print(f"ran {count} exports")
+
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,187 @@
+"""Shared setup for the test suite.
+
+Import `app` and `DBTestCase` from here instead of building an app in each
+test module:
+
+- The schema is created once per test process. Each test runs inside a
+  transaction (with the app's commits turned into SAVEPOINTs) that is
+  rolled back afterwards, so nothing has to be deleted between tests.
+- Passwords are hashed with cheap bcrypt rounds.
+- The database comes from TEST_DATABASE_URL (default
+  postgresql:///warbler_test). Use `sqlite://` to run without Postgres (in
+  a temporary file), or `embedded` for a throwaway Postgres (needs the
+  `testing.postgresql` package and Postgres binaries).
+- Under pytest-xdist each worker gets its own Postgres schema (or SQLite
+  file), so the suite can run in parallel:
+
+      TEST_DATABASE_URL=sqlite:// python -m pytest -n auto
+
+- Set CAPTURE_SQL to a file name to record the app's queries there for
+  `tools/plan_check.py`.
+"""
+
+import atexit
+import os
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import event
+
+import metrics
+from app import create_app
+from auth import token_versions
+from entity_cache import user_cache, message_cache
+from models import db, follow_graph
+from search import message_index
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL',
+                                   'postgresql:///warbler_test')
+
+# pytest-xdist sets this to gw0, gw1, ... in each worker process.
+WORKER = os.environ.get('PYTEST_XDIST_WORKER', '')
+
+
+def _database_config(url):
+    """Config overrides isolating this test process's tables."""
+
+    if url == 'embedded':
+        import testing.postgresql
+
+        server = testing.postgresql.Postgresql()
+        atexit.register(server.stop)
+        url = server.url()
+
+    elif url == 'sqlite://':
+        # A file rather than :memory:, which SQLAlchemy shares between all
+        # connections through one static pool and doesn't reset cleanly.
+        fd, path = tempfile.mkstemp(prefix='warbler_test_', suffix='.db')
+        os.close(fd)
+        atexit.register(os.remove, path)
+        url = f'sqlite:///{path}'
+        return {'SQLALCHEMY_DATABASE_URI': url}
+
+    config = {'SQLALCHEMY_DATABASE_URI': url}
+
+    if url.startswith('postgres') and WORKER:
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'options': f'-csearch_path=test_{WORKER}'},
+        }
+
+    elif url.startswith('sqlite:///') and WORKER:
+        base, ext = os.path.splitext(url)
+        config['SQLALCHEMY_DATABASE_URI'] = f"{base}_{WORKER}{ext}"
+
+    return config
+
+
+app = create_app({
+    **_database_config(TEST_DATABASE_URL),
+    'TESTING': True,
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    'WTF_CSRF_ENABLED': False,
+    # The minimum bcrypt allows; real hashing is far too slow for tests.
+    'BCRYPT_LOG_ROUNDS': 4,
+    # test_image_proxy.py serves its "external" images from localhost.
+    'IMAGE_PROXY_ALLOWED_HOSTS': ['127.0.0.1'],
+})
+
+
+def _setup_sqlite(engine):
+    """Make pysqlite handle SAVEPOINTs and enforce foreign keys."""
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Stop pysqlite from issuing its own BEGIN/COMMIT...
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        # ...and emit BEGIN ourselves, so SAVEPOINTs work.
+        connection.execute('BEGIN')
+
+
+def _create_schema():
+    """Create fresh tables for this test process."""
+
+    if db.engine.dialect.name == 'sqlite':
+        _setup_sqlite(db.engine)
+
+    if db.engine.dialect.name == 'postgresql' and WORKER:
+        db.engine.execute(f'CREATE SCHEMA IF NOT EXISTS test_{WORKER}')
+
+    db.drop_all()
+    db.create_all()
+
+
+_create_schema()
+
+if os.environ.get('CAPTURE_SQL'):
+    from tools.plan_check import capture_statements
+
+    base, ext = os.path.splitext(os.environ['CAPTURE_SQL'])
+    capture_statements(db.engine,
+                       f"{base}.{WORKER}{ext}" if WORKER else base + ext)
+
+
+def clear_caches():
+    """Forget per-process state so tests can't see each other's data."""
+
+    follow_graph.clear()
+    message_index.clear()
+    user_cache.clear()
+    token_versions.clear()
+    message_cache.clear()
+    app.extensions['ratelimit_store'].clear()
+    metrics.clear()
+
+
+class DBTestCase(TestCase):
+    """TestCase running each test in a transaction that's rolled back.
+
+    `db.session` is swapped for a session on that transaction; the app's
+    `commit()`s only release a SAVEPOINT, which is immediately restarted.
+    The session also survives the end of each request (it's just expired),
+    so model instances made in `setUp` stay usable after requests.
+    """
+
+    def setUp(self):
+        """Open the per-test transaction and a test client."""
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+
+        session = db.create_scoped_session(
+            options=dict(bind=self.connection, binds={}))
+        session.begin_nested()
+        event.listen(session(), 'after_transaction_end', self._restart_savepoint)
+        session.remove = session.expire_all
+
+        self._saved_session = db.session
+        db.session = session
+
+        clear_caches()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Throw away everything the test did."""
+
+        session = db.session
+        db.session = self._saved_session
+
+        # Roll back the current SAVEPOINT (without starting another) before
+        # the outer transaction, so the connection is left clean.
+        event.remove(session(), 'after_transaction_end', self._restart_savepoint)
+        session.rollback()
+        session.close()
+        self.transaction.rollback()
+        self.connection.close()
+
+        clear_caches()
+
+    @staticmethod
+    def _restart_savepoint(session, transaction):
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
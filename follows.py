@@ -0,0 +1,88 @@
+"""Set-based follow and unfollow, for one id or thousands.
+
+Each chunk of target ids costs two statements however many ids are in it:
+one to find which of them are real users, and one INSERT (skipping follows
+that already exist) or DELETE ... WHERE IN, plus recounting the affected
+profile summaries. Doesn't commit; the caller commits, then applies the
+changes to `follow_graph` with `add_many` / `remove_many`.
+"""
+
+from datetime import datetime
+
+from models import (db, insert_ignoring_duplicates, Follows, User,
+                    StaleSuggestion)
+import summaries
+
+CHUNK_SIZE = 1000
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def follow_many(user_id, followed_ids):
+    """Have `user_id` follow every user in `followed_ids`.
+
+    Ids of users that don't exist (and `user_id` itself) are skipped.
+    Returns (ids now followed, how many of those are new follows).
+    """
+
+    existing = []
+    added = 0
+
+    for chunk in _chunks(followed_ids):
+        ids = [followed_id for (followed_id,) in (db.session
+                                                  .query(User.id)
+                                                  .filter(User.id.in_(chunk),
+                                                          User.id != user_id))]
+        if not ids:
+            continue
+
+        result = db.session.execute(
+            insert_ignoring_duplicates(Follows.__table__).values([
+                {'user_following_id': user_id,
+                 'user_being_followed_id': followed_id}
+                for followed_id in ids
+            ]))
+
+        existing.extend(ids)
+        added += result.rowcount
+
+        if result.rowcount:
+            summaries.refresh(ids, ['followers_count'])
+
+    if added:
+        db.session.merge(StaleSuggestion(user_id=user_id,
+                                          marked_at=datetime.utcnow()))
+        summaries.refresh([user_id], ['following_count'])
+
+    return existing, added
+
+
+def unfollow_many(user_id, followed_ids):
+    """Have `user_id` stop following every user in `followed_ids`.
+
+    Returns how many follows were removed.
+    """
+
+    follows = Follows.__table__
+    removed = 0
+
+    for chunk in _chunks(followed_ids):
+        result = db.session.execute(follows.delete().where(
+            (follows.c.user_following_id == user_id)
+            & follows.c.user_being_followed_id.in_(chunk)))
+
+        removed += result.rowcount
+
+        if result.rowcount:
+            summaries.refresh(chunk, ['followers_count'])
+
+    if removed:
+        db.session.merge(StaleSuggestion(user_id=user_id,
+                                          marked_at=datetime.utcnow()))
+        summaries.refresh([user_id], ['following_count'])
+
+    return removed
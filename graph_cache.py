@@ -0,0 +1,213 @@
+"""In-process cache of the follow graph.
+
+Each user's following and followers are kept as sorted `array('l')`s of
+user ids, so "does A follow B" is a binary search, degree counts are
+`len()`, and a page of neighbors is a slice -- no SQL and no `User` rows.
+
+The web routes apply deltas as they write (`add`, `remove`, `drop_user`).
+Each gunicorn worker has its own copy and can't see other workers' writes,
+so entries also expire after `ttl` seconds and are reloaded from the DB.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# Entries older than this are reloaded, to pick up other workers' writes.
+DEFAULT_TTL = 30
+
+# Most users whose adjacency lists we keep (per direction).
+DEFAULT_MAX_USERS = 100_000
+
+
+class AdjacencyCache:
+    """LRU map of user id -> sorted array of neighbor ids, for one direction."""
+
+    def __init__(self, load, ttl=DEFAULT_TTL, max_users=DEFAULT_MAX_USERS):
+        self.load = load
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, user_id):
+        """Sorted neighbor ids of `user_id`, loading them if needed."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        neighbors = array('l', sorted(self.load(user_id)))
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), neighbors)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+        return neighbors
+
+    def add(self, user_id, neighbor_id):
+        """Record a new edge, if we have `user_id` cached."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry and not _contains(entry[1], neighbor_id):
+                insort(entry[1], neighbor_id)
+
+    def remove(self, user_id, neighbor_id):
+        """Forget an edge, if we have `user_id` cached."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry and _contains(entry[1], neighbor_id):
+                del entry[1][bisect_left(entry[1], neighbor_id)]
+
+    def add_many(self, user_id, neighbor_ids):
+        """Record several new edges at once, if we have `user_id` cached."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry:
+                merged = sorted(set(entry[1]).union(neighbor_ids))
+                self._entries[user_id] = (entry[0], array('l', merged))
+
+    def remove_many(self, user_id, neighbor_ids):
+        """Forget several edges at once, if we have `user_id` cached."""
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry:
+                removed = set(neighbor_ids)
+                kept = [n for n in entry[1] if n not in removed]
+                self._entries[user_id] = (entry[0], array('l', kept))
+
+    def discard(self, user_id):
+        """Drop `user_id`'s entry altogether."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FollowGraph:
+    """Who-follows-whom lookups backed by two `AdjacencyCache`s.
+
+    `load_following(user_id)` and `load_followers(user_id)` return iterables
+    of user ids and are only called on a miss. The arrays handed back are
+    the cached ones, so treat them as read-only.
+    """
+
+    def __init__(self, load_following, load_followers, ttl=DEFAULT_TTL,
+                 max_users=DEFAULT_MAX_USERS):
+        self._following = AdjacencyCache(load_following, ttl, max_users)
+        self._followers = AdjacencyCache(load_followers, ttl, max_users)
+
+    @property
+    def ttl(self):
+        return self._following.ttl
+
+    @ttl.setter
+    def ttl(self, seconds):
+        self._following.ttl = self._followers.ttl = seconds
+
+    def following(self, user_id):
+        """Sorted ids of the users `user_id` follows."""
+
+        return self._following.get(user_id)
+
+    def followers(self, user_id):
+        """Sorted ids of the users following `user_id`."""
+
+        return self._followers.get(user_id)
+
+    def is_following(self, user_id, other_id):
+        """Does `user_id` follow `other_id`?"""
+
+        return _contains(self._following.get(user_id), other_id)
+
+    def following_count(self, user_id):
+        return len(self._following.get(user_id))
+
+    def followers_count(self, user_id):
+        return len(self._followers.get(user_id))
+
+    def following_page(self, user_id, page=1, per_page=100):
+        """One page (1-based) of the ids `user_id` follows."""
+
+        start = (page - 1) * per_page
+        return self._following.get(user_id)[start:start + per_page]
+
+    def followers_page(self, user_id, page=1, per_page=100):
+        """One page (1-based) of the ids following `user_id`."""
+
+        start = (page - 1) * per_page
+        return self._followers.get(user_id)[start:start + per_page]
+
+    def add(self, follower_id, followed_id):
+        """Apply a new follow made by this process."""
+
+        self._following.add(follower_id, followed_id)
+        self._followers.add(followed_id, follower_id)
+
+    def remove(self, follower_id, followed_id):
+        """Apply an unfollow made by this process."""
+
+        self._following.remove(follower_id, followed_id)
+        self._followers.remove(followed_id, follower_id)
+
+    def add_many(self, follower_id, followed_ids):
+        """Apply a bulk follow made by this process."""
+
+        self._following.add_many(follower_id, followed_ids)
+        for followed_id in followed_ids:
+            self._followers.add(followed_id, follower_id)
+
+    def remove_many(self, follower_id, followed_ids):
+        """Apply a bulk unfollow made by this process."""
+
+        self._following.remove_many(follower_id, followed_ids)
+        for followed_id in followed_ids:
+            self._followers.remove(followed_id, follower_id)
+
+    def drop_user(self, user_id, following=(), followers=()):
+        """Apply a user deletion.
+
+        Pass the deleted user's neighbor ids (read before deleting) so they
+        can be taken out of the other users' entries too.
+        """
+
+        for followed_id in following:
+            self._followers.remove(followed_id, user_id)
+
+        for follower_id in followers:
+            self._following.remove(follower_id, user_id)
+
+        self._following.discard(user_id)
+        self._followers.discard(user_id)
+
+    def clear(self):
+        """Forget everything (e.g. after bulk changes made outside the app)."""
+
+        self._following.clear()
+        self._followers.clear()
+
+
+def _contains(ids, value):
+    """Is `value` in the sorted array `ids`?"""
+
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
@@ -0,0 +1,99 @@
+"""Hashtag and @mention extraction.
+
+Messages are parsed once, when they're written, into `messages_tags` and
+`mentions` rows; the tag and mention timelines read those tables (by index)
+rather than searching message text.
+"""
+
+import re
+
+from markupsafe import Markup, escape
+
+from models import (db, insert_ignoring_duplicates, Tag, MessageTag,
+                    Mention, User)
+
+# '#' or '@' at the start of a word. Usernames may contain dots, but not
+# end with one (that's the end of a sentence).
+HASHTAG = re.compile(r"(?<![\w#])#(\w{1,50})")
+MENTION = re.compile(r"(?<![\w@])@(\w+(?:\.\w+)*)")
+
+
+def extract_hashtags(text):
+    """Distinct hashtags in `text`, lowercased, in order of appearance."""
+
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG.findall(text)))
+
+
+def extract_mentions(text):
+    """Distinct usernames @mentioned in `text`, in order of appearance."""
+
+    return list(dict.fromkeys(MENTION.findall(text)))
+
+
+def get_or_create_tags(names):
+    """Tag rows for `names`, creating any that don't exist yet.
+
+    Another request may create the same new tag at the same time, so
+    missing tags are inserted skipping any that now exist, then re-read.
+    """
+
+    if not names:
+        return []
+
+    tags = Tag.query.filter(Tag.name.in_(names)).all()
+    missing = set(names) - {tag.name for tag in tags}
+
+    if missing:
+        db.session.execute(insert_ignoring_duplicates(Tag.__table__).values(
+            [{'name': name} for name in sorted(missing)]))
+        tags += Tag.query.filter(Tag.name.in_(missing)).all()
+
+    return tags
+
+
+def tag_message(msg):
+    """Record the hashtags and mentions in a new message.
+
+    Call after the message has been added to the session; doesn't commit.
+    """
+
+    db.session.flush()
+
+    for tag in get_or_create_tags(extract_hashtags(msg.text)):
+        db.session.add(MessageTag(tag_id=tag.id, message_id=msg.id,
+                                  timestamp=msg.timestamp))
+
+    usernames = extract_mentions(msg.text)
+    if usernames:
+        for (user_id,) in (db.session
+                           .query(User.id)
+                           .filter(User.username.in_(usernames))):
+            db.session.add(Mention(user_id=user_id, message_id=msg.id,
+                                   timestamp=msg.timestamp))
+
+
+LINKABLE = re.compile(f"{HASHTAG.pattern}|{MENTION.pattern}")
+
+
+def linkify(text):
+    """Message text as HTML, with hashtags and mentions linked."""
+
+    parts = []
+    last = 0
+
+    for match in LINKABLE.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        tag, username = match.groups()
+
+        if tag:
+            parts.append(Markup('<a href="/tags/{}">#{}</a>')
+                         .format(tag.lower(), tag))
+        else:
+            parts.append(Markup('<a href="/users?q={}">@{}</a>')
+                         .format(username, username))
+
+        last = match.end()
+
+    parts.append(escape(text[last:]))
+
+    return Markup('').join(parts)
@@ -0,0 +1,316 @@
+"""Resizing image proxy with an on-disk LRU cache.
+
+User avatars and header images point at arbitrary external hosts and are
+full-size originals. The `/images/...` route fetches each original once,
+resizes it to the sizes our templates actually draw, and keeps the variants
+on disk. Variants never change for a given URL, so they're served with
+immutable cache headers.
+
+Proxy URLs are signed with the app's SECRET_KEY so the route can't be used
+to fetch arbitrary URLs. Users still choose the URLs we sign, though, so
+`fetch` refuses hosts that resolve to loopback, private or link-local
+addresses (our own network), and follows redirects one checked hop at a
+time. Each request connects to the address that was checked, so DNS
+can't hand out a different one in between. IMAGE_PROXY_ALLOWED_HOSTS
+exempts named hosts (e.g. in tests).
+
+requests and PIL are imported when first used, not at import time, so
+they don't slow down starting every worker (see tools/importtime.py).
+"""
+
+import hashlib
+import hmac
+import io
+import ipaddress
+import os
+import socket
+import threading
+from urllib.parse import urlencode, urljoin, urlparse
+
+# name -> (width, height, crop). Twice the CSS size, for high-DPI screens.
+SIZES = {
+    'nav': (64, 64, True),            # .nav > li > a > img, 32px
+    'timeline': (96, 96, True),       # .timeline-image, 48px
+    'card': (140, 140, True),         # .card-image, 70px
+    'profile': (400, 400, True),      # #profile-avatar, 200px
+    'card-hero': (720, 260, True),    # .card-hero, 36% high
+    'hero': (1600, 900, False),       # #warbler-hero, full width
+}
+
+# Refuse to download originals bigger than this.
+MAX_ORIGINAL_BYTES = 10 * 1024 * 1024
+
+FETCH_TIMEOUT = 5
+
+MAX_REDIRECTS = 3
+
+JPEG_QUALITY = 85
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class ImageFetchError(Exception):
+    """The original image couldn't be fetched or decoded."""
+
+
+def sign(secret_key, url, size):
+    """Signature for a proxied `url` at `size`."""
+
+    message = f"{size}:{url}".encode('utf-8')
+    return hmac.new(secret_key.encode('utf-8'), message,
+                    hashlib.sha256).hexdigest()[:32]
+
+
+def proxy_url(secret_key, url, size):
+    """The `/images/...` URL serving `url` resized to `size`."""
+
+    query = urlencode({'url': url})
+    return f"/images/{size}/{sign(secret_key, url, size)}?{query}"
+
+
+def verify(secret_key, url, size, signature):
+    """Was this proxy URL made by us?"""
+
+    return hmac.compare_digest(sign(secret_key, url, size), signature)
+
+
+def check_host(url, allowed_hosts=()):
+    """Refuse `url` unless its host is public (or in `allowed_hosts`).
+
+    Every address the host resolves to must be a global one, so the proxy
+    can't be pointed at localhost, the LAN or a cloud metadata service.
+    Returns the address to connect to (None for allowed hosts).
+    """
+
+    parsed = urlparse(url)
+
+    try:
+        hostname, port = parsed.hostname, parsed.port
+    except ValueError as exc:
+        raise ImageFetchError(f"Bad URL: {url}") from exc
+
+    if parsed.scheme not in ('http', 'https') or not hostname:
+        raise ImageFetchError(f"Not an http(s) URL: {url}")
+
+    if hostname in allowed_hosts:
+        return None
+
+    try:
+        infos = socket.getaddrinfo(hostname, port or 0,
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as exc:
+        raise ImageFetchError(f"Can't resolve {hostname}") from exc
+
+    addresses = [info[4][0].split('%')[0] for info in infos]
+
+    for address in addresses:
+        ip = ipaddress.ip_address(address)
+
+        if not ip.is_global or ip.is_multicast:
+            raise ImageFetchError(f"Not a public address: {url}")
+
+    return addresses[0]
+
+
+def _session(address):
+    """A requests session whose connections all go to `address` (if given),
+    whatever the URL's host resolves to by then.
+
+    TLS still checks the certificate against the URL's host name.
+    """
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    session = requests.Session()
+    # A proxy from the environment would do its own DNS lookup.
+    session.trust_env = False
+
+    if address is None:
+        return session
+
+    def pinned(connection_class):
+        class PinnedConnection(connection_class):
+            def _new_conn(self):
+                host, self._dns_host = self._dns_host, address
+                try:
+                    return super()._new_conn()
+                finally:
+                    self._dns_host = host
+
+        return PinnedConnection
+
+    class PinnedHTTPPool(HTTPConnectionPool):
+        ConnectionCls = pinned(HTTPConnection)
+
+    class PinnedHTTPSPool(HTTPSConnectionPool):
+        ConnectionCls = pinned(HTTPSConnection)
+
+    class PinnedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': PinnedHTTPPool, 'https': PinnedHTTPSPool}
+
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, PinnedAdapter())
+
+    return session
+
+
+def fetch(url, allowed_hosts=()):
+    """Download an original image, refusing non-public hosts and huge files."""
+
+    import requests
+
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            with _session(check_host(url, allowed_hosts)) as session:
+                resp = session.get(url, timeout=FETCH_TIMEOUT, stream=True,
+                                   allow_redirects=False)
+
+                with resp:
+                    if resp.is_redirect:
+                        url = urljoin(url, resp.headers['Location'])
+                        continue
+
+                    resp.raise_for_status()
+
+                    data = bytearray()
+                    for chunk in resp.iter_content(64 * 1024):
+                        data += chunk
+                        if len(data) > MAX_ORIGINAL_BYTES:
+                            raise ImageFetchError(f"Image too large: {url}")
+
+                    return bytes(data)
+
+    except requests.RequestException as exc:
+        raise ImageFetchError(str(exc)) from exc
+
+    raise ImageFetchError(f"Too many redirects: {url}")
+
+
+def resize(data, size):
+    """Resize image bytes to the named size. Returns (bytes, mimetype)."""
+
+    from PIL import Image, ImageOps
+
+    width, height, crop = SIZES[size]
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError) as exc:
+        raise ImageFetchError(f"Can't decode image: {exc}") from exc
+
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image.thumbnail((width, height), Image.LANCZOS)
+
+    out = io.BytesIO()
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image.save(out, 'PNG', optimize=True)
+        return out.getvalue(), 'image/png'
+
+    image.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY,
+                              optimize=True, progressive=True)
+    return out.getvalue(), 'image/jpeg'
+
+
+class ImageCache:
+    """Resized variants stored on disk, evicting least recently used.
+
+    Recency is the file's mtime, which is bumped on every hit, so the cache
+    survives restarts and is shared by all workers on the machine.
+    """
+
+    EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png'}
+
+    def __init__(self, root, max_bytes, allowed_hosts=(), fetch=fetch):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.allowed_hosts = frozenset(allowed_hosts)
+        self.fetch = fetch
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _base_path(self, url, size):
+        key = hashlib.sha256(f"{size}:{url}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, key[:2], key)
+
+    def _find(self, url, size):
+        base = self._base_path(url, size)
+
+        for mimetype, ext in self.EXTENSIONS.items():
+            if os.path.exists(base + ext):
+                return base + ext, mimetype
+
+        return None, None
+
+    def get(self, url, size):
+        """Path and mimetype of `url` resized to `size`, fetching on a miss."""
+
+        path, mimetype = self._find(url, size)
+
+        if path:
+            try:
+                os.utime(path)
+                return path, mimetype
+            except FileNotFoundError:
+                pass  # evicted under us; fetch it again
+
+        data, mimetype = resize(self.fetch(url, self.allowed_hosts), size)
+        path = self._base_path(url, size) + self.EXTENSIONS[mimetype]
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._added(len(data))
+
+        return path, mimetype
+
+    def _files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.tmp'):
+                    yield os.path.join(dirpath, filename)
+
+    def _added(self, nbytes):
+        """Track the cache size; evict down to 90% when it's over budget."""
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(os.path.getsize(p) for p in self._files())
+            else:
+                self._size += nbytes
+
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target):
+        entries = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
@@ -0,0 +1,87 @@
+"""Simple in-process counters, exported at /metrics.
+
+Counters are kept per process (so per gunicorn worker); the scraper adds
+them up. The output is the Prometheus text format:
+
+    # HELP ratelimit_rejected_total Requests refused by a rate limit.
+    # TYPE ratelimit_rejected_total counter
+    ratelimit_rejected_total{limit="messages",scope="user"} 3
+"""
+
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the count for these labels."""
+
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """The current count for these labels."""
+
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        """This counter's lines of the text exposition format."""
+
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} counter"]
+
+        with self._lock:
+            values = sorted(self._values.items())
+
+        for key, value in values:
+            if key:
+                labels = ','.join(f'{name}="{label}"' for name, label in key)
+                lines.append(f"{self.name}{{{labels}}} {value}")
+            else:
+                lines.append(f"{self.name} {value}")
+
+        return lines
+
+
+_registry = {}
+
+
+def counter(name, description):
+    """The counter called `name`, created on first use."""
+
+    if name not in _registry:
+        _registry[name] = Counter(name, description)
+
+    return _registry[name]
+
+
+def render():
+    """Every counter, in the Prometheus text format."""
+
+    lines = []
+    for name in sorted(_registry):
+        lines.extend(_registry[name].render())
+
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    """Reset every counter to zero (for tests)."""
+
+    for metric in _registry.values():
+        metric.clear()
@@ -1,19 +1,31 @@
 """SQLAlchemy models for Warbler."""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+
+from graph_cache import FollowGraph
 
 bcrypt = Bcrypt()
 db = SQLAlchemy()
 
+# Text search configuration for message search (see search.py).
+TS_CONFIG = 'english'
+
 
 class Follows(db.Model):
     """Connection of a follower <-> followed_user."""
 
     __tablename__ = 'follows'
 
+    # The primary key covers "who follows X"; this covers "who does X follow".
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
     user_being_followed_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id', ondelete="cascade"),
@@ -73,8 +85,19 @@ class User(db.Model):
         db.Text,
         nullable=False,
     )
+
+    # Part of every login token (see auth.py); bumping it revokes them all.
+    token_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
  
-    messages = db.relationship('Message', order_by='Message.timestamp.desc()')
+    # passive_deletes: let ON DELETE CASCADE remove a deleted user's messages
+    # instead of the ORM trying to null out their (non-nullable) user_id.
+    messages = db.relationship('Message', order_by='Message.timestamp.desc()',
+                               passive_deletes=True)
     # likes = db.relationship('Like')
 
     followers = db.relationship(
@@ -96,17 +119,40 @@ class User(db.Model):
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    @property
+    def following_count(self):
+        """How many users this user follows."""
+
+        return (Follows
+                .query
+                .filter(Follows.user_following_id == self.id)
+                .count())
+
+    @property
+    def followers_count(self):
+        """How many users follow this user."""
+
+        return (Follows
+                .query
+                .filter(Follows.user_being_followed_id == self.id)
+                .count())
+
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return other_user.is_following(self)
 
     def is_following(self, other_user):
-        """Is this user following `other_use`?"""
+        """Is this user following `other_use`?
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        Always asks the database. Pages use the `is_following` template
+        global instead, which reads `follow_graph`.
+        """
+
+        return db.session.query(Follows.query.filter(
+            Follows.user_following_id == self.id,
+            Follows.user_being_followed_id == other_user.id,
+        ).exists()).scalar()
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -150,10 +196,18 @@ class User(db.Model):
 
 
 class Message(db.Model):
-    """An individual message ("warble")."""
+    """An individual message ("warble").
+
+    Only recent messages live here; `archive.py` moves old ones to
+    `messages_archive` so this table and its indexes stay small.
+    """
 
     __tablename__ = 'messages'
 
+    __table_args__ = (
+        db.Index('ix_messages_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -167,7 +221,8 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
+        index=True,
     )
 
     user_id = db.Column(
@@ -176,10 +231,20 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # Kept in step with the likes table by the like/unlike/delete routes, so
+    # ranking never has to COUNT(*) over likes.
+    like_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
     user = db.relationship('User')
     # likes = db.relationship('Like')
     # users = db.relationship('User', secondary='likes')
-    # tags = db.relationship('Tag', secondary = 'posts_tags', backref='posts')
+    # Written through MessageTag rows (see hashtags.py), so read-only here.
+    tags = db.relationship('Tag', secondary='messages_tags', viewonly=True)
 
 
 
@@ -193,6 +258,17 @@ class Message(db.Model):
         
 
 
+# Full-text index for message search. Postgres only; elsewhere search.py
+# falls back to an in-process index.
+event.listen(
+    Message.__table__,
+    'after_create',
+    DDL(f"CREATE INDEX ix_messages_text_fts ON messages "
+        f"USING gin (to_tsvector('{TS_CONFIG}', text))"
+        ).execute_if(dialect='postgresql'),
+)
+
+
 class Like(db.Model):
     """A like between a user and a message."""
 
@@ -221,6 +297,444 @@ class Like(db.Model):
     # message = db.relationship('Message')
 
 
+class MessageArchive(db.Model):
+    """An old message, moved out of `messages` by `archive.py`.
+
+    Keeps the id it had in `messages`.
+    """
+
+    __tablename__ = 'messages_archive'
+
+    __table_args__ = (
+        db.Index('ix_messages_archive_user_id_timestamp',
+                 'user_id', 'timestamp'),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    text = db.Column(
+        db.String(140),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    like_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    user = db.relationship('User')
+
+
+class LikeArchive(db.Model):
+    """A like of an archived message."""
+
+    __tablename__ = 'likes_archive'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages_archive.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+
+
+class Tag(db.Model):
+    """A hashtag used in messages."""
+
+    __tablename__ = 'tags'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # Lowercased, without the '#'.
+    name = db.Column(
+        db.Text,
+        nullable=False,
+        unique=True,
+    )
+
+
+class MessageTag(db.Model):
+    """A hashtag in a message.
+
+    Carries a copy of the message's timestamp so a tag's timeline is a
+    single range scan of (tag_id, timestamp).
+    """
+
+    __tablename__ = 'messages_tags'
+
+    __table_args__ = (
+        db.Index('ix_messages_tags_tag_id_timestamp', 'tag_id', 'timestamp'),
+    )
+
+    tag_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tags.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+
+class Mention(db.Model):
+    """An @mention of a user in a message.
+
+    Like MessageTag, copies the timestamp so a user's mentions timeline is a
+    range scan of (user_id, timestamp).
+    """
+
+    __tablename__ = 'mentions'
+
+    __table_args__ = (
+        db.Index('ix_mentions_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+
+class MessageTagArchive(db.Model):
+    """A hashtag in an archived message (moved from `messages_tags`)."""
+
+    __tablename__ = 'messages_tags_archive'
+
+    tag_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tags.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages_archive.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+
+class MentionArchive(db.Model):
+    """An @mention in an archived message (moved from `mentions`)."""
+
+    __tablename__ = 'mentions_archive'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages_archive.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+
+class TrendingMessage(db.Model):
+    """A precomputed slot in the trending-messages ranking.
+
+    Rebuilt in batches by `trending.py`; the trending page only reads this
+    (small) table, so its cost doesn't grow with the number of likes.
+    """
+
+    __tablename__ = 'trending_messages'
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+    message = db.relationship('Message')
+
+
+class FollowSuggestion(db.Model):
+    """A precomputed "who to follow" suggestion for a user.
+
+    Filled in by `suggestions.py`; the suggestions page just reads these.
+    """
+
+    __tablename__ = 'follow_suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    suggested_user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    # How many of the people `user` follows also follow the suggested user
+    # (0 for popular-account fallbacks).
+    score = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    suggested_user = db.relationship('User', foreign_keys=[suggested_user_id])
+
+
+class StaleSuggestion(db.Model):
+    """A user whose follows changed since their suggestions were computed."""
+
+    __tablename__ = 'stale_suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    # Re-marking an already stale user moves this forward, so a refresh
+    # that started earlier leaves the row for the next one.
+    marked_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+
+class UserSummary(db.Model):
+    """What a profile header shows about a user, in one row.
+
+    Maintained by `summaries.py`: built on first use, then kept up to date
+    by the routes that change what it counts.
+    """
+
+    __tablename__ = 'user_summaries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    # So a summary can stand in for its user (e.g. `is_following(summary)`).
+    id = db.synonym('user_id')
+
+    username = db.Column(db.Text)
+    image_url = db.Column(db.Text)
+    header_image_url = db.Column(db.Text)
+    bio = db.Column(db.Text)
+    location = db.Column(db.Text)
+
+    # Including archived messages and likes.
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    likes_count = db.Column(db.Integer, nullable=False, default=0)
+
+    following_count = db.Column(db.Integer, nullable=False, default=0)
+    followers_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Newest message in `messages` (null if there are none).
+    last_message_id = db.Column(db.Integer)
+    last_message_at = db.Column(db.DateTime)
+
+
+class ExportJob(db.Model):
+    """A user's request for an archive of their data.
+
+    Created by the web app and run by `export.py`, which moves it from
+    pending to running to done (or failed), counting rows as it goes. Done
+    jobs' files are deleted after EXPORT_TTL, making them expired.
+    """
+
+    __tablename__ = 'export_jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True,
+    )
+
+    status = db.Column(
+        db.String(10),
+        nullable=False,
+        default='pending',
+        index=True,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    started_at = db.Column(
+        db.DateTime,
+    )
+
+    # Bumped by the worker running the job every time it records progress.
+    updated_at = db.Column(
+        db.DateTime,
+    )
+
+    finished_at = db.Column(
+        db.DateTime,
+    )
+
+    rows_written = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    total_rows = db.Column(
+        db.Integer,
+    )
+
+    error = db.Column(
+        db.Text,
+    )
+
+    @property
+    def progress(self):
+        """Fraction done, from 0 to 1."""
+
+        if self.status == 'done':
+            return 1
+        if not self.total_rows:
+            return 0
+        return min(1, self.rows_written / self.total_rows)
+
+    def in_progress(self, timeout):
+        """Pending, or running with progress in the last `timeout` seconds.
+
+        Running jobs quiet for longer are taken to have lost their worker.
+        """
+
+        if self.status == 'pending':
+            return True
+
+        return (self.status == 'running'
+                and datetime.utcnow() - self.updated_at
+                < timedelta(seconds=timeout))
+
+    @property
+    def filename(self):
+        return f"warbler-export-{self.id}.zip"
+
+
+def _load_following(user_id):
+    """Ids of the users `user_id` follows (for `follow_graph`)."""
+
+    return [followed_id for (followed_id,) in db.session
+            .query(Follows.user_being_followed_id)
+            .filter(Follows.user_following_id == user_id)]
+
+
+def _load_followers(user_id):
+    """Ids of the users following `user_id` (for `follow_graph`)."""
+
+    return [follower_id for (follower_id,) in db.session
+            .query(Follows.user_following_id)
+            .filter(Follows.user_being_followed_id == user_id)]
+
+
+follow_graph = FollowGraph(_load_following, _load_followers)
+
+
+def insert_ignoring_duplicates(table):
+    """INSERT that skips rows clashing with an existing primary key or
+    unique value, instead of failing (e.g. when racing another request).
+    """
+
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(table).on_conflict_do_nothing()
+
+    return table.insert().prefix_with('OR IGNORE')
+
+
 def connect_db(app):
     """Connect this database to provided Flask app.
 
@@ -229,3 +743,4 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
+    bcrypt.init_app(app)
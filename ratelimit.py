@@ -0,0 +1,171 @@
+"""Token-bucket rate limits for the write routes.
+
+Each limited route has a name, and RATELIMITS in the config gives it a
+per-user and/or per-IP limit of `(count, seconds)`: up to `count` requests
+in a burst, refilled at `count` per `seconds`. Over the limit, the request
+gets a 429 with a Retry-After header instead of touching the database.
+
+Buckets live in the process by default, so each gunicorn worker limits on
+its own. Set RATELIMIT_STORAGE_URL to a redis:// URL (needs the `redis`
+package) to share them between workers.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from flask import current_app, g, request
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+checked = metrics.counter(
+    'ratelimit_checked_total', "Requests checked against a rate limit.")
+rejected = metrics.counter(
+    'ratelimit_rejected_total', "Requests refused by a rate limit.")
+
+
+class MemoryStore:
+    """Buckets in a dict; only limits within this process."""
+
+    # Forget buckets that have refilled once there are this many.
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Take a token from `key`'s bucket.
+
+        Returns 0 if one was available, or else how many seconds until
+        there will be.
+        """
+
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            full_at = now + (burst - tokens) / rate
+            self._buckets[key] = (tokens, now, full_at)
+
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+
+        return wait
+
+    def _prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """Buckets in Redis, shared by every process using the same server."""
+
+    # Same arithmetic as MemoryStore.take, done atomically in Redis.
+    SCRIPT = """
+        local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]),
+                                 tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    PREFIX = 'ratelimit:'
+
+    def __init__(self, url):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self._take = self.redis.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        return float(self._take(keys=[self.PREFIX + key],
+                                args=[rate, burst, now]))
+
+    def clear(self):
+        for key in self.redis.scan_iter(self.PREFIX + '*'):
+            self.redis.delete(key)
+
+
+def make_store(url=None):
+    """The bucket store for RATELIMIT_STORAGE_URL (in-process if unset)."""
+
+    if url:
+        return RedisStore(url)
+
+    return MemoryStore()
+
+
+def check(name):
+    """Apply the limits called `name` to the current request.
+
+    Raises TooManyRequests (a 429 with Retry-After) if any is exceeded.
+    """
+
+    if not current_app.config['RATELIMIT_ENABLED']:
+        return
+
+    limits = current_app.config['RATELIMITS'].get(name, {})
+    store = current_app.extensions['ratelimit_store']
+
+    keys = {'ip': request.remote_addr}
+    if g.get('user'):
+        keys['user'] = str(g.user.id)
+
+    wait = 0
+    for scope, (count, seconds) in limits.items():
+        if scope not in keys:
+            continue
+
+        checked.inc(limit=name, scope=scope)
+        scope_wait = store.take(f"{name}:{scope}:{keys[scope]}",
+                                count / seconds, count)
+
+        if scope_wait:
+            rejected.inc(limit=name, scope=scope)
+            wait = max(wait, scope_wait)
+
+    if wait:
+        raise TooManyRequests(retry_after=math.ceil(wait))
+
+
+def rate_limited(name):
+    """Decorate a route so its POSTs are subject to the limits `name`."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'POST':
+                check(name)
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
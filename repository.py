@@ -0,0 +1,282 @@
+"""The read queries behind the user and timeline pages, keyed by user id.
+
+This is not a sharding layer: Warbler runs on one database, and this module
+doesn't change that. What it does is keep the queries of the profile,
+archive, following, followers and home pages in one place, each naming the
+user whose rows it reads, and spell out the placement they'd need if users
+were ever spread over several databases:
+
+- a user's row, their messages and the follows they made live on the shard
+  `user_id % len(shards)`;
+- a query about one user's own rows goes to that user's shard;
+- a query about many users (a timeline, someone's followers) runs on each
+  shard involved, and the results are merged in order as they're read
+  (`heapq.merge`), so long lists still stream.
+
+`ShardRouter` only has one session (`db.session`) in the app. The
+multi-session paths exist for the tests, which place every row on its shard
+by hand. Actually sharding would also take routing every write and the rest
+of the routes' queries (likes, search, exports, summaries...), a per-shard
+id sequence, and dropping the foreign keys that would cross shards (likes,
+follows); none of that is done.
+"""
+
+import heapq
+from itertools import islice
+from operator import attrgetter
+
+from sqlalchemy import literal, select, true
+from sqlalchemy.orm import joinedload
+
+from models import db, follow_graph, Follows, Message, MessageArchive, User
+
+
+class ShardRouter:
+    """Maps user ids to the sessions of the databases holding their rows.
+
+    With no sessions given there's one shard, `db.session` (looked up on
+    each use, so the tests can swap it). Nothing writes through the router,
+    so several sessions need `reads_only=True`, for tests that place every
+    row on its shard themselves.
+    """
+
+    def __init__(self, sessions=None, reads_only=False):
+        self._sessions = list(sessions or [])
+
+        if len(self._sessions) > 1 and not reads_only:
+            raise ValueError(
+                "The app isn't sharded: writes all go to db.session, so "
+                "reads routed over several sessions would miss rows. Pass "
+                "reads_only=True if every row is already on its shard.")
+
+    @property
+    def sessions(self):
+        return self._sessions or [db.session]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def shard_of(self, user_id):
+        return user_id % len(self.sessions)
+
+    def session(self, user_id):
+        """The session for `user_id`'s shard."""
+
+        return self.sessions[self.shard_of(user_id)]
+
+    def by_shard(self, user_ids):
+        """{session: [user ids on its shard]} for these users."""
+
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.shard_of(user_id), []).append(user_id)
+
+        return {self.sessions[shard]: ids for shard, ids in groups.items()}
+
+
+shards = ShardRouter()
+
+
+def _merged(results, key, reverse=False):
+    """Merge results that are each already sorted by `key`."""
+
+    if len(results) == 1:
+        return results[0]
+
+    return heapq.merge(*results, key=key, reverse=reverse)
+
+
+def _newest_first(message):
+    return (message.timestamp, message.id)
+
+
+##############################################################################
+# Messages
+
+
+def user_messages(user_id, before=None, limit=20):
+    """Up to `limit` of a user's messages, newest first.
+
+    Pass the id of the last message of the previous page as `before` to get
+    the next page.
+    """
+
+    session = shards.session(user_id)
+    query = session.query(Message).filter(Message.user_id == user_id)
+
+    if before is not None:
+        cursor = (session
+                  .query(Message.timestamp)
+                  .filter(Message.id == before)
+                  .as_scalar())
+        query = query.filter((Message.timestamp < cursor)
+                             | ((Message.timestamp == cursor)
+                                & (Message.id < before)))
+
+    return (query
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit)
+            .all())
+
+
+def archived_messages(user_id, limit=100):
+    """Up to `limit` of a user's archived messages, newest first."""
+
+    return (shards.session(user_id)
+            .query(MessageArchive)
+            .filter(MessageArchive.user_id == user_id)
+            .order_by(MessageArchive.timestamp.desc())
+            .limit(limit)
+            .all())
+
+
+# Follow counts from which (on Postgres) timelines use the LATERAL plan;
+# see tools/bench_timeline.py.
+TIMELINE_LATERAL_MIN_FOLLOWS = 1000
+
+
+def timeline_strategy(session, follow_count):
+    """How to query the timeline of a user following `follow_count` users.
+
+    'join': one scan of the messages of everyone followed, newest first.
+    Fine while that's not many users.
+
+    'lateral': the newest few messages of each followed user, from one index
+    range scan apiece, then the newest of those. Costs a little per user
+    followed but never touches older messages, however many there are.
+    """
+
+    if (session.get_bind().dialect.name == 'postgresql'
+            and follow_count >= TIMELINE_LATERAL_MIN_FOLLOWS):
+        return 'lateral'
+
+    return 'join'
+
+
+def _authors(user_id):
+    """SELECT of the users in `user_id`'s timeline: who they follow, and
+    themselves."""
+
+    return (select([Follows.user_being_followed_id.label('author_id')])
+            .where(Follows.user_following_id == user_id)
+            .union_all(select([literal(user_id, db.Integer)])))
+
+
+def timeline_query(session, user_id, limit, strategy):
+    """Query for `user_id`'s timeline, the given way (see timeline_strategy)."""
+
+    if strategy == 'lateral':
+        authors = _authors(user_id).alias('authors')
+        latest = (select([Message.id, Message.timestamp])
+                  .where(Message.user_id == authors.c.author_id)
+                  .order_by(Message.timestamp.desc())
+                  .limit(limit)
+                  .lateral('latest'))
+        newest = (select([latest.c.id])
+                  .select_from(authors.join(latest, true()))
+                  .order_by(latest.c.timestamp.desc())
+                  .limit(limit)
+                  .alias('newest'))
+        query = session.query(Message).join(newest, Message.id == newest.c.id)
+    else:
+        query = session.query(Message).filter(
+            Message.user_id.in_(_authors(user_id)))
+
+    return (query
+            .options(joinedload(Message.user))
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit))
+
+
+def timeline(user_id, limit=100, strategy=None):
+    """The newest `limit` messages by `user_id` and the users they follow.
+
+    With one shard, the follows are joined in the database (the `strategy`
+    picked by follow count, unless given). With more, the follows are read
+    from `user_id`'s shard, and each shard with followed users returns its
+    newest `limit`, which are merged.
+    """
+
+    if len(shards) == 1:
+        session = shards.session(user_id)
+        strategy = strategy or timeline_strategy(
+            session, follow_graph.following_count(user_id))
+        return timeline_query(session, user_id, limit, strategy).all()
+
+    author_ids = [followed_id for (followed_id,) in (shards.session(user_id)
+                  .query(Follows.user_being_followed_id)
+                  .filter(Follows.user_following_id == user_id))]
+    author_ids.append(user_id)
+
+    results = [session
+               .query(Message)
+               .filter(Message.user_id.in_(ids))
+               .options(joinedload(Message.user))
+               .order_by(Message.timestamp.desc(), Message.id.desc())
+               .limit(limit)
+               .all()
+               for session, ids in shards.by_shard(author_ids).items()]
+
+    return list(islice(_merged(results, _newest_first, reverse=True), limit))
+
+
+##############################################################################
+# Users
+
+
+def users_by_ids(user_ids, batch_size=100):
+    """Users with these ids, in id order, looked up `batch_size` at a time."""
+
+    ids = sorted(set(user_ids))
+
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        results = [session
+                   .query(User)
+                   .filter(User.id.in_(group))
+                   .order_by(User.id)
+                   .all()
+                   for session, group in shards.by_shard(chunk).items()]
+
+        yield from _merged(results, attrgetter('id'))
+
+
+def following(user_id, batch_size=100):
+    """The users `user_id` follows, in id order.
+
+    The follows are on `user_id`'s shard but the users may be on any, so
+    (unless there's only one) this looks up the ids first.
+    """
+
+    session = shards.session(user_id)
+
+    if len(shards) == 1:
+        return (session
+                .query(User)
+                .join(Follows, Follows.user_being_followed_id == User.id)
+                .filter(Follows.user_following_id == user_id)
+                .order_by(User.id)
+                .yield_per(batch_size))
+
+    ids = [followed_id for (followed_id,) in (session
+           .query(Follows.user_being_followed_id)
+           .filter(Follows.user_following_id == user_id))]
+
+    return users_by_ids(ids, batch_size)
+
+
+def followers(user_id, batch_size=100):
+    """The users following `user_id`, in id order, from every shard.
+
+    Each follower's follow is on their own shard, with their user row.
+    """
+
+    results = [session
+               .query(User)
+               .join(Follows, Follows.user_following_id == User.id)
+               .filter(Follows.user_being_followed_id == user_id)
+               .order_by(User.id)
+               .yield_per(batch_size)
+               for session in shards.sessions]
+
+    return _merged(results, attrgetter('id'))
@@ -0,0 +1,237 @@
+"""Full-text search over messages.
+
+On Postgres, messages are matched with `to_tsvector('english', text)`,
+which has a GIN index (see `models.py`), and ranked with `ts_rank_cd`.
+
+Elsewhere (SQLite in development and tests) an in-process inverted index
+is used instead. It's built from the messages table on first search and
+then kept up to date by the message routes via `index_message` and
+`unindex_message`. Each process has its own, so it's only meant for
+single-process use.
+
+Results are ranked best first and paginated with an opaque cursor.
+"""
+
+import base64
+import math
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import REAL, and_, cast, func, or_
+
+from models import db, Message, TS_CONFIG
+
+PER_PAGE = 20
+
+# Roughly what Postgres' english config ignores, so both backends agree on
+# what matches.
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have he her his i in is it its
+    me my of on or our she so that the their them they this to was we were
+    what when which who will with you your
+""".split())
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercased words of `text`, minus stopwords."""
+
+    return [word for word in WORD.findall(text.lower())
+            if word not in STOPWORDS]
+
+
+def encode_cursor(score, message_id):
+    raw = f"{score!r}:{message_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(score, message_id) from a cursor, or None if it's garbled."""
+
+    try:
+        score, message_id = base64.urlsafe_b64decode(cursor).split(b':')
+        return float(score), int(message_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class InvertedIndex:
+    """Term -> {message id: term frequency} postings, built lazily."""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the index is rebuilt on the next search."""
+
+        with self._lock:
+            self.postings = defaultdict(dict)
+            self.terms = {}
+            self.built = False
+
+    def build(self):
+        """Index every message, in keyset-paginated batches."""
+
+        with self._lock:
+            last_id = 0
+
+            while True:
+                batch = (db.session
+                         .query(Message.id, Message.text)
+                         .filter(Message.id > last_id)
+                         .order_by(Message.id)
+                         .limit(self.BATCH_SIZE)
+                         .all())
+
+                if not batch:
+                    break
+
+                for message_id, text in batch:
+                    self._add(message_id, text)
+                last_id = batch[-1].id
+
+            self.built = True
+
+    def add(self, message_id, text):
+        """Index a new message (if the index has been built yet)."""
+
+        with self._lock:
+            if self.built:
+                self._add(message_id, text)
+
+    def _add(self, message_id, text):
+        terms = tokenize(text)
+        self.terms[message_id] = set(terms)
+
+        for term in terms:
+            postings = self.postings[term]
+            postings[message_id] = postings.get(message_id, 0) + 1
+
+    def remove(self, message_id):
+        """Take a deleted message out of the index."""
+
+        with self._lock:
+            for term in self.terms.pop(message_id, ()):
+                postings = self.postings[term]
+                postings.pop(message_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query):
+        """All (score, message_id) matching every term of `query`, best first.
+
+        Scored with tf-idf, so rarer terms count for more.
+        """
+
+        with self._lock:
+            if not self.built:
+                self.build()
+
+            terms = set(tokenize(query))
+            if not terms:
+                return []
+
+            postings = [self.postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            total = len(self.terms)
+
+            results = []
+            for message_id in postings[0]:
+                if all(message_id in p for p in postings[1:]):
+                    score = sum(
+                        (1 + math.log(p[message_id]))
+                        * math.log(1 + total / len(p))
+                        for p in postings)
+                    results.append((round(score, 6), message_id))
+
+        results.sort(reverse=True)
+        return results
+
+
+message_index = InvertedIndex()
+
+
+def _uses_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def index_message(message):
+    """Make a newly added message searchable."""
+
+    if not _uses_postgres():
+        message_index.add(message.id, message.text)
+
+
+def unindex_message(message_id):
+    """Stop a deleted message from showing up in search."""
+
+    if not _uses_postgres():
+        message_index.remove(message_id)
+
+
+def unindex_user_messages(user_id):
+    """Unindex all of a user's messages; call before deleting the user."""
+
+    if not _uses_postgres():
+        for (message_id,) in (db.session
+                              .query(Message.id)
+                              .filter(Message.user_id == user_id)):
+            message_index.remove(message_id)
+
+
+def search_messages(query, cursor=None, per_page=PER_PAGE):
+    """One page of messages matching `query`, best match first.
+
+    Returns (messages, next_cursor); next_cursor is None on the last page.
+    """
+
+    after = decode_cursor(cursor) if cursor else None
+
+    if _uses_postgres():
+        ranked = _search_postgres(query, after, per_page + 1)
+    else:
+        ranked = _search_index(query, after, per_page + 1)
+
+    next_cursor = None
+    if len(ranked) > per_page:
+        ranked = ranked[:per_page]
+        next_cursor = encode_cursor(*ranked[-1])
+
+    by_id = {msg.id: msg for msg in
+             Message.query.filter(Message.id.in_([i for _, i in ranked]))}
+
+    return [by_id[i] for _, i in ranked if i in by_id], next_cursor
+
+
+def _search_postgres(query, after, limit):
+    vector = func.to_tsvector(TS_CONFIG, Message.text)
+    tsquery = func.plainto_tsquery(TS_CONFIG, query)
+    rank = func.ts_rank_cd(vector, tsquery)
+
+    q = (db.session
+         .query(rank, Message.id)
+         .filter(vector.op('@@')(tsquery)))
+
+    if after:
+        # ts_rank_cd is a float4; compared with the cursor's float8 as is,
+        # a tie would never be equal and tied rows would be skipped.
+        score, message_id = cast(after[0], REAL), after[1]
+        q = q.filter(or_(rank < score,
+                         and_(rank == score, Message.id < message_id)))
+
+    return [(float(score), message_id) for score, message_id in
+            q.order_by(rank.desc(), Message.id.desc()).limit(limit)]
+
+
+def _search_index(query, after, limit):
+    ranked = message_index.search(query)
+
+    if after:
+        ranked = [r for r in ranked if r < after]
+
+    return ranked[:limit]
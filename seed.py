@@ -1,8 +1,10 @@
 """Seed database with sample data from CSV Files."""
 
 from csv import DictReader
-from app import db
-from models import User, Message, Follows
+from config import create_db_app
+from models import db, User, Message, Follows
+
+create_db_app()
 
 db.drop_all()
 db.create_all()
@@ -0,0 +1,169 @@
+"""Batch job computing "who to follow" suggestions.
+
+Builds the follow graph as a sparse matrix `F` (F[a, b] = 1 when a follows
+b), so friends-of-friends counts for a block of users are one sparse
+product, `F[users] @ F`. Results go into `follow_suggestions`; the web app
+only ever reads that table.
+
+Only users marked in `stale_suggestions` (and the people following them,
+whose friends-of-friends just changed) are recomputed:
+
+    python suggestions.py              # refresh stale users once
+    python suggestions.py --all        # recompute everyone
+    python suggestions.py --every 600  # keep refreshing
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from models import db, Follows, User, FollowSuggestion, StaleSuggestion
+
+TOP_N = 10
+
+# Rows of F multiplied at once; bounds the size of the product matrix.
+BATCH_SIZE = 500
+
+
+def load_follow_matrix():
+    """Return the follow graph as a CSR matrix indexed by user id."""
+
+    pairs = np.array(
+        db.session.query(Follows.user_following_id,
+                         Follows.user_being_followed_id).all(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    size = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+
+    return sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (pairs[:, 0], pairs[:, 1])),
+        shape=(size, size),
+    )
+
+
+def users_to_refresh(follows, stale_ids):
+    """Stale users plus everyone who follows one of them."""
+
+    stale_ids = np.asarray(stale_ids, dtype=np.int64)
+    stale_ids = stale_ids[stale_ids < follows.shape[0]]
+
+    if not len(stale_ids):
+        return stale_ids
+
+    followers = follows.tocsc()[:, stale_ids].nonzero()[0]
+
+    return np.union1d(stale_ids, followers)
+
+
+def top_suggestions(follows, user_ids, top_n=TOP_N):
+    """Yield (user_id, [(suggested_id, score), ...]) for each of `user_ids`.
+
+    Candidates are ranked by how many followed users follow them; empty
+    slots are filled with the most-followed accounts.
+    """
+
+    popularity = np.asarray(follows.sum(axis=0)).ravel()
+    popular = np.argsort(-popularity, kind='stable')
+    popular = popular[popularity[popular] > 0][:top_n * 2]
+
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        rows = user_ids[start:start + BATCH_SIZE]
+        block = follows[rows]
+        fof = (block @ follows).tocsr()
+
+        for i, user_id in enumerate(rows):
+            already = set(block.indices[block.indptr[i]:block.indptr[i + 1]])
+            already.add(user_id)
+
+            cols = fof.indices[fof.indptr[i]:fof.indptr[i + 1]]
+            counts = fof.data[fof.indptr[i]:fof.indptr[i + 1]]
+
+            keep = ~np.isin(cols, list(already))
+            cols, counts = cols[keep], counts[keep]
+
+            if len(cols) > top_n:
+                best = np.argpartition(-counts, top_n)[:top_n]
+                cols, counts = cols[best], counts[best]
+
+            order = np.lexsort((cols, -counts))
+            picks = [(int(c), int(n)) for c, n in zip(cols[order], counts[order])]
+
+            for candidate in popular:
+                if len(picks) >= top_n:
+                    break
+                if candidate not in already and all(candidate != p for p, _ in picks):
+                    picks.append((int(candidate), 0))
+
+            yield int(user_id), picks
+
+
+def refresh_suggestions(all_users=False, top_n=TOP_N):
+    """Recompute suggestions for stale users (or everyone).
+
+    Returns the number of users refreshed. Users marked stale again while
+    this runs stay marked.
+    """
+
+    started = datetime.utcnow()
+    follows = load_follow_matrix()
+
+    if all_users:
+        stale_ids = [user_id for (user_id,) in db.session.query(User.id)]
+        user_ids = np.array(stale_ids, dtype=np.int64)
+        # Users who signed up after the matrix was loaded aren't in it yet.
+        user_ids = user_ids[user_ids < follows.shape[0]]
+    else:
+        stale_ids = [user_id for (user_id,) in
+                     db.session.query(StaleSuggestion.user_id)]
+        user_ids = users_to_refresh(follows, stale_ids)
+
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+
+        (FollowSuggestion
+            .query
+            .filter(FollowSuggestion.user_id.in_(batch.tolist()))
+            .delete(synchronize_session=False))
+
+        db.session.bulk_insert_mappings(FollowSuggestion, [
+            dict(user_id=user_id, rank=rank, suggested_user_id=suggested_id,
+                 score=score)
+            for user_id, picks in top_suggestions(follows, batch, top_n)
+            for rank, (suggested_id, score) in enumerate(picks, start=1)
+        ])
+        db.session.commit()
+
+    if stale_ids:
+        (StaleSuggestion
+            .query
+            .filter(StaleSuggestion.user_id.in_(stale_ids),
+                    StaleSuggestion.marked_at < started)
+            .delete(synchronize_session=False))
+        db.session.commit()
+
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    from config import create_db_app
+
+    parser = argparse.ArgumentParser(description="Refresh follow suggestions.")
+    parser.add_argument('--all', action='store_true',
+                        help="recompute every user, not just stale ones")
+    parser.add_argument('--every', type=int, metavar='SECONDS',
+                        help="keep running, refreshing this often")
+    args = parser.parse_args()
+
+    create_db_app()
+
+    while True:
+        count = refresh_suggestions(all_users=args.all)
+        print(f"refreshed suggestions for {count} users")
+
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,263 @@
+"""Profile summaries: a user's counts and display fields in one row.
+
+Drawing a profile header used to load every message, like, follower and
+followed user of the person shown, just to count them. `user_summaries`
+keeps those counts, the newest message's cursor and the fields the header
+shows instead:
+
+- a user's summary is built (with COUNTs) the first time it's asked for;
+- after that, routes that change what it counts update it in the same
+  transaction, with `adjust` for single changes and `refresh` to recount
+  after bulk ones.
+
+Summaries of users nobody has looked at don't exist, so the updates skip
+them. If counts ever drift (or after loading data behind the app's back,
+like seed.py does), rebuild every summary:
+
+    python summaries.py
+"""
+
+import argparse
+
+from flask import abort
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import (db, Follows, Like, LikeArchive, Message, MessageArchive,
+                    User, UserSummary)
+
+BATCH_SIZE = 1000
+
+DISPLAY_FIELDS = ['username', 'image_url', 'header_image_url', 'bio',
+                  'location']
+
+LAST_MESSAGE_FIELDS = ['last_message_id', 'last_message_at']
+
+FIELDS = DISPLAY_FIELDS + [
+    'message_count', 'likes_count', 'following_count', 'followers_count',
+] + LAST_MESSAGE_FIELDS
+
+
+def _expressions(user_id):
+    """The SQL to compute each field, for `user_id` (a column or value)."""
+
+    def count(column):
+        return select([db.func.count()]).where(column == user_id).as_scalar()
+
+    def user_column(column):
+        return select([column]).where(User.id == user_id).as_scalar()
+
+    def last_message(column):
+        return (select([column])
+                .where(Message.user_id == user_id)
+                .order_by(Message.timestamp.desc(), Message.id.desc())
+                .limit(1)
+                .as_scalar())
+
+    expressions = {field: user_column(getattr(User, field))
+                   for field in DISPLAY_FIELDS}
+
+    expressions.update({
+        'message_count': (count(Message.user_id)
+                          + count(MessageArchive.user_id)),
+        'likes_count': count(Like.user_id) + count(LikeArchive.user_id),
+        'following_count': count(Follows.user_following_id),
+        'followers_count': count(Follows.user_being_followed_id),
+        'last_message_id': last_message(Message.id),
+        'last_message_at': last_message(Message.timestamp),
+    })
+
+    return expressions
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def refresh(user_ids, fields=FIELDS):
+    """Recompute `fields` of these users' summaries from the tables."""
+
+    summaries = UserSummary.__table__
+    expressions = _expressions(summaries.c.user_id)
+
+    for chunk in _chunks(user_ids):
+        db.session.execute(
+            summaries.update()
+            .where(summaries.c.user_id.in_(chunk))
+            .values({field: expressions[field] for field in fields}))
+
+
+def adjust(user_id, **deltas):
+    """Add to counts in a user's summary, e.g. `adjust(1, likes_count=-1)`."""
+
+    _adjust(UserSummary.user_id == user_id, **deltas)
+
+
+def _adjust(where, **deltas):
+    (UserSummary
+        .query
+        .filter(where)
+        .update({getattr(UserSummary, field): getattr(UserSummary, field) + n
+                 for field, n in deltas.items()},
+                synchronize_session=False))
+
+
+def get_summary(user_id):
+    """The summary of `user_id` (None if there's no such user).
+
+    Builds and commits it if it doesn't exist yet.
+    """
+
+    summary = UserSummary.query.get(user_id)
+    if summary is not None:
+        return summary
+
+    if db.session.query(User.id).filter_by(id=user_id).scalar() is None:
+        return None
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserSummary(user_id=user_id))
+    except IntegrityError:
+        # Another request built it first.
+        return UserSummary.query.get(user_id)
+
+    refresh([user_id])
+    db.session.commit()
+
+    return UserSummary.query.get(user_id)
+
+
+def get_summary_or_404(user_id):
+    summary = get_summary(user_id)
+    if summary is None:
+        abort(404)
+    return summary
+
+
+##############################################################################
+# Keeping summaries up to date
+
+
+def add_message(message):
+    """Count a new (flushed) message as its author's newest."""
+
+    adjust(message.user_id, message_count=1)
+
+    (UserSummary
+        .query
+        .filter(UserSummary.user_id == message.user_id)
+        .update({UserSummary.last_message_id: message.id,
+                 UserSummary.last_message_at: message.timestamp},
+                synchronize_session=False))
+
+
+def remove_message(message):
+    """Take a message (and its likes) out of the counts.
+
+    Call before deleting it. `message` may be a `MessageArchive`.
+    """
+
+    likes = LikeArchive if isinstance(message, MessageArchive) else Like
+
+    _adjust(UserSummary.user_id.in_(
+        db.session.query(likes.user_id).filter(likes.message_id == message.id)),
+        likes_count=-1)
+
+    adjust(message.user_id, message_count=-1)
+
+    if isinstance(message, Message):
+        previous = (db.session
+                    .query(Message.id, Message.timestamp)
+                    .filter(Message.user_id == message.user_id,
+                            Message.id != message.id)
+                    .order_by(Message.timestamp.desc(), Message.id.desc())
+                    .first())
+
+        (UserSummary
+            .query
+            .filter(UserSummary.user_id == message.user_id,
+                    UserSummary.last_message_id == message.id)
+            .update({UserSummary.last_message_id: previous and previous.id,
+                     UserSummary.last_message_at:
+                         previous and previous.timestamp},
+                    synchronize_session=False))
+
+
+def remove_user(user_id):
+    """Take a user's follows, and the likes of their messages, out of
+    everyone else's counts.
+
+    Call before deleting the user (these rows go with them by cascade).
+    """
+
+    follows = db.session.query(Follows.user_being_followed_id).filter(
+        Follows.user_following_id == user_id)
+    _adjust(UserSummary.user_id.in_(follows), followers_count=-1)
+
+    followers = db.session.query(Follows.user_following_id).filter(
+        Follows.user_being_followed_id == user_id)
+    _adjust(UserSummary.user_id.in_(followers), following_count=-1)
+
+    for likes, messages in ((Like, Message), (LikeArchive, MessageArchive)):
+        liked = (select([db.func.count()])
+                 .select_from(likes.__table__.join(
+                     messages.__table__, messages.id == likes.message_id))
+                 .where((messages.user_id == user_id)
+                        & (likes.user_id == UserSummary.user_id))
+                 .as_scalar())
+        likers = (db.session
+                  .query(likes.user_id)
+                  .join(messages, messages.id == likes.message_id)
+                  .filter(messages.user_id == user_id))
+
+        (UserSummary
+            .query
+            .filter(UserSummary.user_id.in_(likers))
+            .update({UserSummary.likes_count: UserSummary.likes_count - liked},
+                    synchronize_session=False))
+
+
+def rebuild_all():
+    """Build or recompute every user's summary, a batch at a time.
+
+    Returns how many there are.
+    """
+
+    last_id = 0
+    total = 0
+
+    while True:
+        ids = [user_id for (user_id,) in (db.session
+               .query(User.id)
+               .filter(User.id > last_id)
+               .order_by(User.id)
+               .limit(BATCH_SIZE))]
+
+        if not ids:
+            return total
+
+        existing = {user_id for (user_id,) in (db.session
+                    .query(UserSummary.user_id)
+                    .filter(UserSummary.user_id.in_(ids)))}
+        db.session.bulk_insert_mappings(
+            UserSummary, [{'user_id': user_id} for user_id in ids
+                          if user_id not in existing])
+
+        refresh(ids)
+        db.session.commit()
+
+        total += len(ids)
+        last_id = ids[-1]
+
+
+if __name__ == '__main__':
+    from config import create_db_app
+
+    parser = argparse.ArgumentParser(description="Rebuild profile summaries.")
+    parser.parse_args()
+
+    create_db_app()
+    print(f"rebuilt {rebuild_all()} summaries")
@@ -0,0 +1,132 @@
+"""Message archive tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_archive.py
+
+
+from datetime import datetime, timedelta
+
+from app import CURR_USER_KEY
+from archive import archive_old_messages
+from fixtures import DBTestCase
+from models import (db, User, Message, Like, MessageArchive, LikeArchive, Tag,
+                    MessageTag, MessageTagArchive, Mention, MentionArchive)
+
+NOW = datetime(2020, 6, 1)
+
+
+class ArchiveTestCase(DBTestCase):
+    """Test moving old messages to the archive tables."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        old = [Message(text=f"old {i}", user_id=user.id,
+                       timestamp=NOW - timedelta(days=400 + i))
+               for i in range(3)]
+        new = Message(text="new", user_id=user.id,
+                      timestamp=NOW - timedelta(days=1))
+        db.session.add_all([*old, new])
+        db.session.commit()
+
+        db.session.add(Like(user_id=user.id, message_id=old[0].id))
+        db.session.commit()
+
+        self.user_id = user.id
+        self.old_ids = [msg.id for msg in old]
+        self.new_id = new.id
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_archive_old_messages(self):
+        """Are old messages and their likes moved, and new ones kept?"""
+
+        count = archive_old_messages(now=NOW, batch_size=2)
+
+        self.assertEqual(count, 3)
+        self.assertEqual([msg.id for msg in Message.query], [self.new_id])
+        self.assertEqual(
+            sorted(msg.id for msg in MessageArchive.query), self.old_ids)
+
+        archived = MessageArchive.query.get(self.old_ids[0])
+        self.assertEqual(archived.text, "old 0")
+        self.assertEqual(archived.user.id, self.user_id)
+
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(
+            [like.message_id for like in LikeArchive.query], [self.old_ids[0]])
+
+        self.assertEqual(archive_old_messages(now=NOW), 0)
+
+    def test_archive_tags_and_mentions(self):
+        """Are an old message's hashtags and mentions moved with it?"""
+
+        tag = Tag(name="old")
+        db.session.add(tag)
+        db.session.commit()
+
+        msg = Message.query.get(self.old_ids[0])
+        db.session.add_all([
+            MessageTag(tag_id=tag.id, message_id=msg.id,
+                       timestamp=msg.timestamp),
+            Mention(user_id=self.user_id, message_id=msg.id,
+                    timestamp=msg.timestamp),
+        ])
+        db.session.commit()
+
+        archive_old_messages(now=NOW)
+
+        self.assertEqual(MessageTag.query.count(), 0)
+        self.assertEqual(Mention.query.count(), 0)
+        self.assertEqual(
+            [(row.tag_id, row.message_id) for row in MessageTagArchive.query],
+            [(tag.id, self.old_ids[0])])
+        self.assertEqual(
+            [(row.user_id, row.message_id) for row in MentionArchive.query],
+            [(self.user_id, self.old_ids[0])])
+
+    def test_archived_pages(self):
+        """Do archived messages show on the archive page and their own page?"""
+
+        archive_old_messages(now=NOW)
+
+        with self.client as c:
+            self.login(c)
+
+            resp = c.get(f"/users/{self.user_id}")
+            html = resp.get_data(as_text=True)
+            self.assertIn("new", html)
+            self.assertNotIn("old 1", html)
+
+            resp = c.get(f"/users/{self.user_id}/archive")
+            self.assertIn("old 1", resp.get_data(as_text=True))
+
+            resp = c.get(f"/messages/{self.old_ids[1]}")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("old 1", resp.get_data(as_text=True))
+
+            resp = c.get("/messages/999999")
+            self.assertEqual(resp.status_code, 404)
+
+    def test_delete_archived(self):
+        """Can an archived message be deleted?"""
+
+        archive_old_messages(now=NOW)
+
+        with self.client as c:
+            self.login(c)
+            resp = c.post(f"/messages/{self.old_ids[0]}/delete")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertIsNone(MessageArchive.query.get(self.old_ids[0]))
+        self.assertEqual(LikeArchive.query.count(), 0)
@@ -0,0 +1,122 @@
+"""Asset bundling tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_assets.py
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import assets
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def fake_fetch(url):
+    """Stand-in for downloads: a tiny file naming where it came from."""
+
+    if url.endswith('all.min.css'):
+        # Like the real one: formats we don't vendor next to woff2.
+        return (b'@font-face{font-family:FA;'
+                b'src:url(../webfonts/fa-solid-900.eot);'
+                b'src:url(../webfonts/fa-solid-900.eot?#iefix) '
+                b'format("embedded-opentype"),'
+                b'url(../webfonts/fa-solid-900.woff2) format("woff2"),'
+                b'url(../webfonts/fa-solid-900.ttf) format("truetype")}')
+    if url.endswith('.css'):
+        return f'/* {url} */'.encode('utf-8')
+    return f'// {url}'.encode('utf-8')
+
+
+class AssetsTestCase(TestCase):
+    """Test vendoring and bundling into a scratch static/ (no network)."""
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static_dir, 'stylesheets'))
+        shutil.copy(os.path.join(ROOT, 'static', 'stylesheets', 'style.css'),
+                    os.path.join(self.static_dir, 'stylesheets'))
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def read(self, path):
+        with open(os.path.join(self.static_dir, path)) as f:
+            return f.read()
+
+    def test_unbundled_sources(self):
+        """Before building, are missing vendor files loaded from unpkg?"""
+
+        self.assertEqual(
+            assets.source_files(self.static_dir, 'app.css'),
+            [assets.VENDOR['bootstrap.min.css'],
+             assets.VENDOR['fontawesome/css/all.min.css'],
+             'stylesheets/style.css'])
+
+        assets.vendor(self.static_dir, fetch=fake_fetch)
+
+        self.assertEqual(assets.source_files(self.static_dir, 'app.js'),
+                         assets.BUNDLES['app.js'])
+
+    def test_build(self):
+        """Are bundles content-hashed, minified and listed in the manifest?"""
+
+        self.assertEqual(assets.load_manifest(self.static_dir), {})
+
+        fetched = assets.vendor(self.static_dir, fetch=fake_fetch)
+        self.assertEqual(set(fetched), set(assets.VENDOR))
+        self.assertEqual(assets.vendor(self.static_dir, fetch=fake_fetch), [])
+
+        manifest = assets.build(self.static_dir)
+        self.assertEqual(assets.load_manifest(self.static_dir), manifest)
+        self.assertRegex(manifest['app.css'], r'^dist/app\.[0-9a-f]{12}\.css$')
+
+        css = self.read(manifest['app.css'])
+        self.assertRegex(
+            css, r'\{font-family:FA;src:url\(\.\./vendor/fontawesome/webfonts/'
+                 r'fa-solid-900\.woff2\?v=[0-9a-f]{12}\) format\("woff2"\)\}')
+        self.assertNotIn('.eot', css)
+        self.assertNotIn('.ttf', css)
+        self.assertIn('url("/static/images/nav-bg.png")', css)
+        self.assertNotIn('\n  ', css.split('\n')[-1])
+
+        js = self.read(manifest['app.js'])
+        self.assertLess(js.index('jquery'), js.index('popper'))
+
+        # Unchanged sources give the same names; changed ones new names,
+        # with the old bundle removed.
+        self.assertEqual(assets.build(self.static_dir), manifest)
+
+        with open(os.path.join(self.static_dir, 'stylesheets', 'style.css'),
+                  'a') as f:
+            f.write('\nbody { color: red; }\n')
+
+        rebuilt = assets.build(self.static_dir)
+        self.assertNotEqual(rebuilt['app.css'], manifest['app.css'])
+        self.assertEqual(rebuilt['app.js'], manifest['app.js'])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.static_dir, manifest['app.css'])))
+        self.assertTrue(self.read(rebuilt['app.css']).endswith(
+            'body{color:red}'))
+
+    def test_failed_fetch(self):
+        """Does a failed download leave no file behind to be reused?"""
+
+        def failing_fetch(url):
+            raise OSError("no network")
+
+        with self.assertRaises(OSError):
+            assets.vendor(self.static_dir, fetch=failing_fetch)
+
+        self.assertEqual(assets.source_files(self.static_dir, 'app.css')[0],
+                         assets.VENDOR['bootstrap.min.css'])
+
+    def test_minify_css(self):
+        """Are comments and whitespace removed without changing meaning?"""
+
+        self.assertEqual(
+            assets.minify_css("/* hi */\na > b,\nc:hover {\n  color: red;\n}\n"),
+            "a>b,c:hover{color:red}")
@@ -0,0 +1,135 @@
+"""Token login tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_auth.py
+
+
+from app import CURR_USER_KEY
+import auth
+from fixtures import DBTestCase, app
+from models import db, User
+
+
+class AuthTestCase(DBTestCase):
+    """Test logging in with signed tokens (AUTH_MODE = 'token')."""
+
+    def setUp(self):
+        """Switch to token logins, add a user."""
+
+        super().setUp()
+        app.config['AUTH_MODE'] = 'token'
+
+        user = User.signup(username="testuser", email="test@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.loads = 0
+        load = auth.token_versions.load
+
+        def counting_load(user_id):
+            self.loads += 1
+            return load(user_id)
+
+        auth.token_versions.load = counting_load
+        self.addCleanup(setattr, auth.token_versions, 'load', load)
+
+    def tearDown(self):
+        app.config['AUTH_MODE'] = 'session'
+        super().tearDown()
+
+    def login(self, c):
+        """Log in through the form; return the token cookie's value."""
+
+        resp = c.post("/login", data={"username": "testuser",
+                                      "password": "password"})
+        self.assertEqual(resp.status_code, 302)
+
+        for header in resp.headers.getlist('Set-Cookie'):
+            if header.startswith(f"{auth.COOKIE_NAME}="):
+                return header.split(';')[0].split('=', 1)[1]
+
+        self.fail("no token cookie set")
+
+    def logged_in(self, c, **kwargs):
+        html = c.get("/", **kwargs).get_data(as_text=True)
+        return 'href="/logout"' in html
+
+    def test_login(self):
+        """Does a token cookie log in, checking its version only once?"""
+
+        with self.client as c:
+            token = self.login(c)
+
+            with c.session_transaction() as sess:
+                self.assertNotIn(CURR_USER_KEY, sess)
+
+            self.assertTrue(self.logged_in(c))
+            self.assertTrue(self.logged_in(c))
+            self.assertEqual(self.loads, 1)
+
+        with app.test_client() as c:
+            self.assertFalse(self.logged_in(c))
+            self.assertTrue(self.logged_in(
+                c, headers={"Authorization": f"Bearer {token}"}))
+            self.assertFalse(self.logged_in(
+                c, headers={"Authorization": f"Bearer {token[:-2]}xx"}))
+
+    def test_expiry(self):
+        """Are tokens older than AUTH_TOKEN_MAX_AGE refused?"""
+
+        with self.client as c:
+            self.login(c)
+
+            app.config['AUTH_TOKEN_MAX_AGE'] = -1
+            try:
+                self.assertFalse(self.logged_in(c))
+            finally:
+                app.config['AUTH_TOKEN_MAX_AGE'] = 30 * 24 * 3600
+
+    def test_logout(self):
+        """Does logging out drop this device's cookie only?"""
+
+        with self.client as c:
+            token = self.login(c)
+            c.get("/logout")
+
+            self.assertFalse(self.logged_in(c))
+
+        with app.test_client() as c:
+            self.assertTrue(self.logged_in(
+                c, headers={"Authorization": f"Bearer {token}"}))
+
+    def test_logout_everywhere(self):
+        """Does logging out everywhere revoke tokens already handed out?"""
+
+        with self.client as c:
+            token = self.login(c)
+            c.post("/logout/everywhere")
+
+            self.assertFalse(self.logged_in(c))
+
+        with app.test_client() as c:
+            self.assertFalse(self.logged_in(
+                c, headers={"Authorization": f"Bearer {token}"}))
+
+        with app.test_client() as c:
+            self.login(c)
+            self.assertTrue(self.logged_in(c))
+
+        with app.test_client() as c:
+            self.login(c)
+            self.assertEqual(c.get("/logout/everywhere").status_code, 405)
+
+    def test_delete_revokes(self):
+        """Does deleting the account revoke its tokens?"""
+
+        with self.client as c:
+            token = self.login(c)
+            self.assertTrue(self.logged_in(c))
+            c.post("/users/delete")
+
+        with app.test_client() as c:
+            self.assertFalse(self.logged_in(
+                c, headers={"Authorization": f"Bearer {token}"}))
@@ -0,0 +1,99 @@
+"""Compression middleware tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_compress.py
+
+
+import gzip
+import zlib
+from unittest import TestCase
+
+from werkzeug.test import Client, create_environ
+from werkzeug.wrappers import Response
+
+from compress import Compress
+
+PAGE = b"<li>a warble</li>\n" * 100
+
+
+def page_app(environ, start_response):
+    return Response(PAGE, content_type='text/html')(environ, start_response)
+
+
+def small_app(environ, start_response):
+    return Response(b"<p>hi</p>", content_type='text/html')(
+        environ, start_response)
+
+
+def image_app(environ, start_response):
+    return Response(PAGE, content_type='image/png')(environ, start_response)
+
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/html')])
+    return iter([b"<ul>", PAGE, b"", b"</ul>"])
+
+
+def write_app(environ, start_response):
+    write = start_response('200 OK', [('Content-Type', 'text/html')])
+    write(b"<ul>")
+    write(PAGE)
+    return [b"</ul>"]
+
+
+class CompressTestCase(TestCase):
+    """Test the compression middleware (no database needed)."""
+
+    def get(self, app, accept_encoding='gzip, deflate'):
+        client = Client(Compress(app), Response)
+        return client.get('/', headers={'Accept-Encoding': accept_encoding})
+
+    def test_gzip(self):
+        """Are big pages gzipped, with a correct Content-Length?"""
+
+        resp = self.get(page_app)
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(resp.headers['Content-Length']), len(resp.data))
+        self.assertLess(len(resp.data), len(PAGE) / 10)
+        self.assertEqual(gzip.decompress(resp.data), PAGE)
+
+    def test_not_compressed(self):
+        """Are small, non-text and unwanted responses left alone?"""
+
+        for app, accept_encoding in [(small_app, 'gzip'),
+                                     (image_app, 'gzip'),
+                                     (page_app, ''),
+                                     (page_app, 'gzip;q=0, identity')]:
+            resp = self.get(app, accept_encoding)
+            self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_streaming(self):
+        """Is a streamed page compressed chunk by chunk, as it's produced?"""
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started.append(dict(headers))
+
+        environ = create_environ('/', headers={'Accept-Encoding': 'gzip'})
+        body = Compress(streaming_app)(environ, start_response)
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = [decompressor.decompress(chunk) for chunk in body]
+
+        self.assertEqual(started[0]['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', started[0])
+        self.assertEqual(chunks[0], b"<ul>")
+        self.assertEqual(b''.join(chunks), b"<ul>" + PAGE + b"</ul>")
+
+    def test_write(self):
+        """Is data sent with write() compressed along with the rest?"""
+
+        resp = self.get(write_app)
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.data),
+                         b"<ul>" + PAGE + b"</ul>")
@@ -0,0 +1,157 @@
+"""Entity cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_entity_cache.py
+
+
+import json
+from datetime import datetime
+
+from app import CURR_USER_KEY
+from entity_cache import EntityCache, hits, misses, user_cache, message_cache
+from fixtures import DBTestCase
+from models import db, User, Message
+
+
+class DictTier:
+    """A shared tier in a dict, standing in for Redis."""
+
+    def __init__(self):
+        self.data = {}
+        self.version_reads = 0
+
+    def version(self, key):
+        self.version_reads += 1
+        return self.data.get(f"{key}:version", 0)
+
+    def get(self, key, version):
+        data = self.data.get(f"{key}:v{version}")
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, version, values):
+        self.data[f"{key}:v{version}"] = json.dumps(values)
+
+    def bump(self, key):
+        self.data[f"{key}:version"] = self.version(key) + 1
+
+
+class EntityCacheTestCase(DBTestCase):
+    """Test caching users and messages across requests."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        user = User.signup(username="testuser", email="test@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+
+        msg = Message(text="cached warble", user_id=user.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.msg_id = msg.id
+
+    def test_local_tier(self):
+        """Is a second lookup served from memory, as a usable instance?"""
+
+        user_cache.get(self.user_id)
+        db.session.expunge_all()
+
+        user = user_cache.get(self.user_id)
+
+        self.assertEqual(misses.value(entity='users'), 1)
+        self.assertEqual(hits.value(entity='users', tier='local'), 1)
+        self.assertIn(user, db.session)
+        self.assertEqual(user.username, "testuser")
+        self.assertEqual([m.text for m in user.messages], ["cached warble"])
+
+        self.assertIsNone(user_cache.get(99999))
+
+    def test_ttl(self):
+        """Are expired entries reloaded?"""
+
+        cache = EntityCache(Message, ttl=0)
+        cache.get(self.msg_id)
+        cache.get(self.msg_id)
+
+        self.assertEqual(misses.value(entity='messages'), 2)
+
+    def test_shared_tier(self):
+        """Do workers share rows, and see each other's invalidations?"""
+
+        shared = DictTier()
+        # worker2's own copies expire at once, so it always asks the
+        # shared tier.
+        worker1, worker2 = EntityCache(Message), EntityCache(Message, ttl=0)
+        worker1.shared = worker2.shared = shared
+
+        worker1.get(self.msg_id)
+        db.session.expunge_all()
+        msg = worker2.get(self.msg_id)
+
+        self.assertEqual(hits.value(entity='messages', tier='shared'), 1)
+        self.assertIsInstance(msg.timestamp, datetime)
+
+        msg.text = "edited warble"
+        db.session.commit()
+        worker1.invalidate(self.msg_id)
+        db.session.expunge_all()
+
+        self.assertEqual(worker2.get(self.msg_id).text, "edited warble")
+        self.assertEqual(misses.value(entity='messages'), 2)
+
+    def test_local_before_shared(self):
+        """Are local hits answered without asking the shared tier?"""
+
+        cache = EntityCache(Message)
+        cache.shared = shared = DictTier()
+
+        cache.get(self.msg_id)
+        reads = shared.version_reads
+        cache.get(self.msg_id)
+
+        self.assertEqual(shared.version_reads, reads)
+        self.assertEqual(hits.value(entity='messages', tier='local'), 1)
+
+    def test_invalidated_by_routes(self):
+        """Do the profile and like routes drop the rows they change?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.get("/users/profile")
+            c.post("/users/profile", data={
+                "username": "renamed", "email": "test@test.com",
+                "password": "password"})
+
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertIn("@renamed", resp.get_data(as_text=True))
+
+            c.get(f"/messages/{self.msg_id}")
+            c.post(f"/messages/{self.msg_id}/like")
+
+        self.assertEqual(message_cache.get(self.msg_id).like_count, 1)
+
+    def test_write_routes_skip_cache(self):
+        """Do routes changing a message see it deleted by another worker?"""
+
+        message_cache.get(self.msg_id)
+
+        # Deleted elsewhere: this process's cache still has it.
+        Message.query.filter_by(id=self.msg_id).delete()
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.post(f"/messages/{self.msg_id}/like")
+            self.assertEqual(resp.status_code, 404)
+
+            resp = c.post(f"/messages/{self.msg_id}/delete")
+            self.assertEqual(resp.status_code, 404)
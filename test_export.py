@@ -0,0 +1,240 @@
+"""Data export tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_export.py
+
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+
+import export
+from app import CURR_USER_KEY
+from fixtures import DBTestCase, app
+from models import (db, User, Message, MessageArchive, Like, Follows,
+                    ExportJob)
+
+
+class ExportTestCase(DBTestCase):
+    """Test running exports and the export pages."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.me, friend, fan = [user.id for user in users]
+        self.friend, self.fan = friend, fan
+
+        messages = [Message(text=f"warble {i}", user_id=self.me)
+                    for i in range(3)]
+        liked = Message(text="friend's warble", user_id=friend)
+        db.session.add_all([
+            *messages, liked,
+            MessageArchive(id=1000, text="ancient warble", user_id=self.me,
+                           timestamp=datetime(2010, 1, 1), like_count=0),
+            Follows(user_following_id=self.me, user_being_followed_id=friend),
+            Follows(user_following_id=fan, user_being_followed_id=self.me),
+        ])
+        db.session.commit()
+
+        db.session.add(Like(user_id=self.me, message_id=liked.id))
+        db.session.commit()
+
+        self.export_dir = tempfile.mkdtemp()
+        self._saved = app.config['EXPORT_DIR'], export.BATCH_SIZE
+        app.config['EXPORT_DIR'] = self.export_dir
+        export.BATCH_SIZE = 2
+
+    def tearDown(self):
+        app.config['EXPORT_DIR'], export.BATCH_SIZE = self._saved
+        shutil.rmtree(self.export_dir)
+        super().tearDown()
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.me
+
+    def test_run_export(self):
+        """Does the archive have everything, with progress recorded?"""
+
+        job = ExportJob(user_id=self.me)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        self.assertEqual(export.run_pending_exports(self.export_dir), 1)
+        self.assertFalse(export.run_export(job_id, self.export_dir))
+
+        job = ExportJob.query.get(job_id)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.rows_written, 7)
+        self.assertEqual(job.total_rows, 7)
+        self.assertEqual(job.progress, 1)
+
+        with zipfile.ZipFile(f"{self.export_dir}/{job.filename}") as archive:
+            messages = [json.loads(line) for line in
+                        archive.read('messages.ndjson').splitlines()]
+            likes = archive.read('likes.ndjson').decode('utf-8')
+            following = archive.read('following.csv').decode('utf-8')
+            followers = archive.read('followers.csv').decode('utf-8')
+
+        self.assertEqual([m['text'] for m in messages],
+                         ["warble 0", "warble 1", "warble 2",
+                          "ancient warble"])
+        self.assertEqual(messages[-1]['timestamp'], "2010-01-01T00:00:00")
+        self.assertIn('"author": "testuser1"', likes)
+        self.assertEqual(following.splitlines()[1:],
+                         [f"{self.friend},testuser1"])
+        self.assertEqual(followers.splitlines(),
+                         ["id,username", f"{self.fan},testuser2"])
+
+    def test_pages(self):
+        """Can a user start an export, and download it once it's done?"""
+
+        with self.client as c:
+            self.login(c)
+
+            resp = c.post("/users/export", follow_redirects=True)
+            self.assertIn("Waiting to start", resp.get_data(as_text=True))
+
+            resp = c.post("/users/export", follow_redirects=True)
+            self.assertIn("already have an export",
+                          resp.get_data(as_text=True))
+
+            job = ExportJob.query.filter_by(user_id=self.me).one()
+            resp = c.get(f"/users/export/{job.id}")
+            self.assertEqual(resp.status_code, 404)
+
+            export.run_pending_exports(self.export_dir)
+
+            resp = c.get(f"/users/export/{job.id}")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, 'application/zip')
+            with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+                self.assertIn('messages.ndjson', archive.namelist())
+            resp.close()
+
+    def test_stale_running_job(self):
+        """Is a job whose worker died failed, letting the user start again?"""
+
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        job = ExportJob(user_id=self.me, status='running',
+                        started_at=long_ago, updated_at=long_ago)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        with open(f"{self.export_dir}/{job.filename}.123.tmp", 'wb'):
+            pass
+
+        with self.client as c:
+            self.login(c)
+
+            resp = c.post("/users/export", follow_redirects=True)
+            self.assertNotIn("already have an export",
+                             resp.get_data(as_text=True))
+
+        self.assertEqual(export.reclaim_stale_exports(self.export_dir, 3600),
+                         1)
+        self.assertEqual(ExportJob.query.get(job_id).status, 'failed')
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+    def test_slow_job_not_reclaimed(self):
+        """Is a long-running job that's still making progress left alone?"""
+
+        job = ExportJob(user_id=self.me)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        write = export._write
+        reclaimed = []
+
+        def slow_write(f, filename, columns, rows):
+            # Started long ago, but its last batch was just now.
+            ExportJob.query.filter_by(id=job_id).update(
+                {'started_at': datetime.utcnow() - timedelta(hours=2)})
+            db.session.commit()
+            reclaimed.append(
+                export.reclaim_stale_exports(self.export_dir, 3600))
+            write(f, filename, columns, rows)
+
+        export._write = slow_write
+        try:
+            export.run_pending_exports(self.export_dir)
+        finally:
+            export._write = write
+
+        self.assertEqual(set(reclaimed), {0})
+        self.assertEqual(ExportJob.query.get(job_id).status, 'done')
+
+    def test_reclaimed_worker_stops(self):
+        """Does a worker whose job was reclaimed give up on it?"""
+
+        job = ExportJob(user_id=self.me)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        write = export._write
+
+        def reclaimed_write(f, filename, columns, rows):
+            ExportJob.query.filter_by(id=job_id).update({'status': 'failed'})
+            db.session.commit()
+            write(f, filename, columns, rows)
+
+        export._write = reclaimed_write
+        try:
+            export.run_pending_exports(self.export_dir)
+        finally:
+            export._write = write
+
+        self.assertEqual(ExportJob.query.get(job_id).status, 'failed')
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+    def test_expiry(self):
+        """Are archives deleted once they're older than the TTL?"""
+
+        job = ExportJob(user_id=self.me)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        export.run_pending_exports(self.export_dir)
+
+        self.assertEqual(export.expire_exports(self.export_dir, 3600), 0)
+        self.assertEqual(export.expire_exports(self.export_dir, -1), 1)
+        self.assertEqual(ExportJob.query.get(job_id).status, 'expired')
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+        with self.client as c:
+            self.login(c)
+
+            resp = c.get(f"/users/export/{job_id}")
+            self.assertEqual(resp.status_code, 404)
+
+    def test_delete_user(self):
+        """Does deleting the account delete its archives too?"""
+
+        db.session.add(ExportJob(user_id=self.me))
+        db.session.commit()
+        export.run_pending_exports(self.export_dir)
+        self.assertEqual(len(os.listdir(self.export_dir)), 1)
+
+        with self.client as c:
+            self.login(c)
+            c.post("/users/delete")
+
+        self.assertEqual(os.listdir(self.export_dir), [])
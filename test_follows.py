@@ -0,0 +1,112 @@
+"""Bulk follow tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follows.py
+
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from follows import follow_many, unfollow_many
+from models import db, follow_graph, User, Follows, StaleSuggestion
+
+
+class FollowsTestCase(DBTestCase):
+    """Test set-based follows and the bulk follow API."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.me, *self.others = [user.id for user in users]
+
+        db.session.add(Follows(user_following_id=self.me,
+                               user_being_followed_id=self.others[0]))
+        db.session.commit()
+
+    def following(self):
+        return sorted(f.user_being_followed_id for f in
+                      Follows.query.filter_by(user_following_id=self.me))
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.me
+
+    def test_follow_many(self):
+        """Are new follows added, and duplicates, self and missing skipped?"""
+
+        followed, added = follow_many(
+            self.me, self.others + [self.me, 99999])
+        db.session.commit()
+
+        self.assertEqual(followed, self.others)
+        self.assertEqual(added, 3)
+        self.assertEqual(self.following(), self.others)
+        self.assertIsNotNone(StaleSuggestion.query.get(self.me))
+
+    def test_unfollow_many(self):
+        """Are only the named follows removed?"""
+
+        follow_many(self.me, self.others)
+        removed = unfollow_many(self.me, self.others[:2] + [99999])
+        db.session.commit()
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(self.following(), self.others[2:])
+
+    def test_api(self):
+        """Does the API apply both lists and update the follow graph?"""
+
+        # Cache the current state, to check it's updated rather than reloaded.
+        follow_graph.following(self.me)
+
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/api/follows", json={
+                "follow": self.others[1:] + [99999],
+                "unfollow": [self.others[0]],
+            })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {
+            "followed": 3, "unfollowed": 1, "not_found": [99999]})
+        self.assertEqual(self.following(), self.others[1:])
+        self.assertEqual(list(follow_graph.following(self.me)),
+                         self.others[1:])
+        self.assertTrue(follow_graph.is_following(self.me, self.others[1]))
+
+    def test_api_errors(self):
+        """Are logged-out and malformed requests refused?"""
+
+        resp = self.client.post("/api/follows", json={"follow": [1]})
+        self.assertEqual(resp.status_code, 401)
+
+        with self.client as c:
+            self.login(c)
+
+            for body in [["not", "an", "object"], {"follow": "1"},
+                         {"follow": ["1"]}, {"unfollow": [True]},
+                         {"follow": list(range(10_001))}]:
+                resp = c.post("/api/follows", json=body)
+                self.assertEqual(resp.status_code, 400, body)
+
+        self.assertEqual(self.following(), [self.others[0]])
+
+    def test_stop_following_missing_user(self):
+        """Does unfollowing a user who doesn't exist just redirect?"""
+
+        with self.client as c:
+            self.login(c)
+            resp = c.post("/users/stop-following/99999")
+            self.assertEqual(resp.status_code, 302)
+
+            resp = c.post(f"/users/stop-following/{self.others[0]}")
+
+        self.assertEqual(self.following(), [])
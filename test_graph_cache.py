@@ -0,0 +1,101 @@
+"""Follow graph cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_graph_cache.py
+
+
+from unittest import TestCase
+
+from graph_cache import FollowGraph
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the array-backed follow graph cache (no database needed)."""
+
+    def setUp(self):
+        """Make a graph over a dict of edges, counting loads."""
+
+        # follower -> followed
+        self.edges = {(1, 2), (1, 3), (2, 3), (3, 1)}
+        self.loads = 0
+
+        def load_following(user_id):
+            self.loads += 1
+            return [b for a, b in self.edges if a == user_id]
+
+        def load_followers(user_id):
+            self.loads += 1
+            return [a for a, b in self.edges if b == user_id]
+
+        self.graph = FollowGraph(load_following, load_followers)
+
+    def test_lookups(self):
+        """Do membership, counts and pages come back right?"""
+
+        self.assertTrue(self.graph.is_following(1, 3))
+        self.assertFalse(self.graph.is_following(3, 2))
+        self.assertEqual(self.graph.following_count(1), 2)
+        self.assertEqual(self.graph.followers_count(3), 2)
+        self.assertEqual(list(self.graph.followers(3)), [1, 2])
+        self.assertEqual(list(self.graph.following_page(1, page=2, per_page=1)), [3])
+
+    def test_cached(self):
+        """Is each user loaded only once per direction?"""
+
+        for _ in range(3):
+            self.graph.is_following(1, 2)
+            self.graph.followers_count(1)
+
+        self.assertEqual(self.loads, 2)
+
+    def test_ttl(self):
+        """Are expired entries reloaded?"""
+
+        self.graph.ttl = 0
+        self.graph.is_following(1, 2)
+        self.graph.is_following(1, 2)
+
+        self.assertEqual(self.loads, 2)
+
+    def test_add_remove(self):
+        """Do deltas update cached entries without reloading?"""
+
+        self.graph.following(3)
+        self.graph.followers(2)
+
+        self.graph.add(3, 2)
+        self.assertEqual(list(self.graph.following(3)), [1, 2])
+        self.assertEqual(list(self.graph.followers(2)), [1, 3])
+
+        self.graph.remove(3, 1)
+        self.assertEqual(list(self.graph.following(3)), [2])
+        self.assertEqual(self.loads, 2)
+
+    def test_add_remove_many(self):
+        """Do bulk deltas update both directions without reloading?"""
+
+        self.graph.following(2)
+        self.graph.followers(1)
+
+        self.graph.add_many(2, [1, 3, 4])
+        self.assertEqual(list(self.graph.following(2)), [1, 3, 4])
+        self.assertEqual(list(self.graph.followers(1)), [2, 3])
+
+        self.graph.remove_many(2, [1, 3, 5])
+        self.assertEqual(list(self.graph.following(2)), [4])
+        self.assertEqual(list(self.graph.followers(1)), [3])
+        self.assertEqual(self.loads, 2)
+
+    def test_drop_user(self):
+        """Does deleting a user take them out of everyone's entries?"""
+
+        self.graph.followers(2)
+        self.graph.following(3)
+        self.edges = {(a, b) for a, b in self.edges if 1 not in (a, b)}
+
+        self.graph.drop_user(1, following=[2, 3], followers=[3])
+
+        self.assertEqual(list(self.graph.followers(2)), [])
+        self.assertEqual(list(self.graph.following(3)), [])
+        self.assertEqual(self.graph.following_count(1), 0)
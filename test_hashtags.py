@@ -0,0 +1,133 @@
+"""Hashtag and mention tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_hashtags.py
+
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+import hashtags
+from hashtags import (extract_hashtags, extract_mentions, get_or_create_tags,
+                      linkify)
+from models import db, User, Message, Tag, MessageTag, Mention
+
+
+class HashtagsTestCase(DBTestCase):
+    """Test extracting tags/mentions at write time and their timelines."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        user1 = User(email="test@test.com", username="testuser",
+                     password="HASHED_PASSWORD")
+        user2 = User(email="test2@test.com", username="test.user2",
+                     password="HASHED_PASSWORD")
+        db.session.add_all([user1, user2])
+        db.session.commit()
+
+        self.user1_id = user1.id
+        self.user2_id = user2.id
+
+    def post(self, text):
+        """Post a message as user1."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user1_id
+
+            return c.post("/messages/new", data={"text": text})
+
+    def test_extract(self):
+        """Are tags lowercased and deduplicated, and mentions found?"""
+
+        text = "#Python and #python, not a#b. Hi @test.user2. and @x!"
+
+        self.assertEqual(extract_hashtags(text), ['python'])
+        self.assertEqual(extract_mentions(text), ['test.user2', 'x'])
+
+    def test_linkify(self):
+        """Are tags and mentions linked, and everything else escaped?"""
+
+        html = linkify("<b>#Fun</b> with @testuser")
+
+        self.assertEqual(
+            html,
+            '&lt;b&gt;<a href="/tags/fun">#Fun</a>&lt;/b&gt; with '
+            '<a href="/users?q=testuser">@testuser</a>')
+
+    def test_write_time_extraction(self):
+        """Does adding a message record its tags and mentions?"""
+
+        self.post("Loving #Flask and #SQL, right @test.user2?")
+
+        msg = Message.query.one()
+        self.assertEqual(sorted(tag.name for tag in msg.tags), ['flask', 'sql'])
+        self.assertEqual(Mention.query.one().user_id, self.user2_id)
+        self.assertEqual(MessageTag.query.first().timestamp, msg.timestamp)
+
+        self.post("More #flask")
+        self.assertEqual(Tag.query.count(), 2)
+
+    def test_tag_created_concurrently(self):
+        """Is a tag created by another request mid-way reused, not an error?"""
+
+        insert = hashtags.insert_ignoring_duplicates
+
+        def racing_insert(table):
+            # Another request creates #coffee after we looked for it.
+            db.session.add(Tag(name="coffee"))
+            db.session.flush()
+            return insert(table)
+
+        hashtags.insert_ignoring_duplicates = racing_insert
+        try:
+            tags = get_or_create_tags(["coffee", "tea"])
+        finally:
+            hashtags.insert_ignoring_duplicates = insert
+
+        self.assertEqual(sorted(tag.name for tag in tags), ["coffee", "tea"])
+        self.assertEqual(Tag.query.count(), 2)
+
+    def test_tag_timeline(self):
+        """Does the tag page show only tagged messages?"""
+
+        self.post("first #flask post")
+        self.post("untagged post")
+
+        with self.client as c:
+            resp = c.get("/tags/Flask")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("first", html)
+            self.assertNotIn("untagged post", html)
+
+            self.assertEqual(c.get("/tags/nope").status_code, 404)
+
+    def test_mentions_timeline(self):
+        """Does the mentions page show messages mentioning the user?"""
+
+        self.post("hey @test.user2")
+        self.post("hey nobody")
+
+        with self.client as c:
+            resp = c.get(f"/users/{self.user2_id}/mentions")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("hey <a", html)
+            self.assertNotIn("hey nobody", html)
+
+    def test_delete_cascades(self):
+        """Do a message's tag and mention rows go when it's deleted?"""
+
+        self.post("bye #flask @test.user2")
+
+        with self.client as c:
+            c.post(f"/messages/{Message.query.one().id}/delete")
+
+        self.assertEqual(MessageTag.query.count(), 0)
+        self.assertEqual(Mention.query.count(), 0)
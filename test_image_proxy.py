@@ -0,0 +1,267 @@
+"""Image proxy tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_image_proxy.py
+
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from unittest import TestCase
+
+from PIL import Image
+
+from app import resized
+from fixtures import app
+import image_proxy
+from image_proxy import ImageCache, ImageFetchError, IMMUTABLE, proxy_url
+
+
+def make_image(size=(800, 600), fmt='JPEG'):
+    """Bytes of a plain test image."""
+
+    out = io.BytesIO()
+    Image.new('RGB', size, 'teal').save(out, fmt)
+    return out.getvalue()
+
+
+def _size(fp):
+    """Dimensions of an image file."""
+
+    with Image.open(fp) as image:
+        return image.size
+
+
+class LocalOrigin:
+    """A stand-in for an external image host, served from localhost.
+
+    `images` maps paths to bytes and `redirects` paths to other URLs;
+    `hits` counts requests per path.
+    """
+
+    def __init__(self, images, redirects=None):
+        self.images = images
+        self.redirects = redirects or {}
+        self.hits = {}
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                origin.hits[self.path] = origin.hits.get(self.path, 0) + 1
+
+                if self.path in origin.redirects:
+                    self.send_response(302)
+                    self.send_header('Location', origin.redirects[self.path])
+                    self.end_headers()
+                    return
+
+                data = origin.images.get(self.path)
+
+                if data is None:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ImageProxyTestCase(TestCase):
+    """Test resizing, caching and the proxy route."""
+
+    def setUp(self):
+        """Start a local origin and an empty cache."""
+
+        self.origin = LocalOrigin({
+            '/big.jpg': make_image(),
+            '/logo.png': make_image(fmt='PNG'),
+            '/broken.jpg': b'not an image',
+        })
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ImageCache(
+            self.cache_dir, max_bytes=10 * 1024 * 1024,
+            allowed_hosts=app.config['IMAGE_PROXY_ALLOWED_HOSTS'])
+
+        self._saved_cache = app.extensions['image_cache']
+        app.extensions['image_cache'] = self.cache
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """ Cleans up."""
+        app.extensions['image_cache'] = self._saved_cache
+        self.origin.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_resize_and_cache(self):
+        """Is the original fetched once and resized to the named size?"""
+
+        url = f"{self.origin.url}/big.jpg"
+
+        path, mimetype = self.cache.get(url, 'timeline')
+        self.cache.get(url, 'timeline')
+
+        self.assertEqual(mimetype, 'image/jpeg')
+        self.assertEqual(_size(path), (96, 96))
+        self.assertEqual(self.origin.hits['/big.jpg'], 1)
+
+    def test_hero_keeps_aspect(self):
+        """Are hero images scaled down without cropping?"""
+
+        path, _ = self.cache.get(f"{self.origin.url}/big.jpg", 'hero')
+
+        self.assertEqual(_size(path), (800, 600))
+
+    def test_lru_eviction(self):
+        """Are least recently used variants evicted when over budget?"""
+
+        first, _ = self.cache.get(f"{self.origin.url}/big.jpg", 'card')
+        second, _ = self.cache.get(f"{self.origin.url}/big.jpg", 'profile')
+        old = time.time() - 60
+        os.utime(first, (old, old))
+        os.utime(second, (old + 1, old + 1))
+        self.cache.get(f"{self.origin.url}/big.jpg", 'card')
+
+        # Room for the card variant (just used) and the new one only.
+        self.origin.images['/new.png'] = make_image((64, 64), fmt='PNG')
+        self.cache.max_bytes = os.path.getsize(second) - 1
+        third, _ = self.cache.get(f"{self.origin.url}/new.png", 'nav')
+
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(os.path.exists(third))
+        self.assertFalse(os.path.exists(second))
+
+    def test_route(self):
+        """Does the route serve resized images with immutable headers?"""
+
+        url = f"{self.origin.url}/big.jpg"
+
+        with app.test_request_context():
+            proxied = resized(url, 'card')
+
+        resp = self.client.get(proxied)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Cache-Control'], IMMUTABLE)
+        self.assertEqual(_size(io.BytesIO(resp.data)), (140, 140))
+        resp.close()
+
+    def test_route_bad_signature(self):
+        """Are unsigned URLs refused?"""
+
+        url = f"{self.origin.url}/big.jpg"
+        proxied = proxy_url('wrong key', url, 'card')
+
+        self.assertEqual(self.client.get(proxied).status_code, 404)
+
+    def test_route_broken_image(self):
+        """Do undecodable images fall back to the original URL?"""
+
+        url = f"{self.origin.url}/broken.jpg"
+        proxied = proxy_url(app.config['SECRET_KEY'], url, 'card')
+
+        resp = self.client.get(proxied)
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.location, url)
+
+    def test_private_hosts_refused(self):
+        """Are loopback and private hosts refused unless allowed?"""
+
+        cache = ImageCache(self.cache_dir, max_bytes=10 * 1024 * 1024)
+
+        for url in [f"{self.origin.url}/big.jpg",
+                    "http://169.254.169.254/latest/meta-data/",
+                    "http://10.0.0.1/a.jpg",
+                    "http://[::1]/a.jpg",
+                    "file:///etc/passwd"]:
+            with self.assertRaises(ImageFetchError):
+                cache.get(url, 'card')
+
+        self.assertEqual(self.origin.hits, {})
+
+    def test_bad_port(self):
+        """Are URLs with unusable ports refused, not an error?"""
+
+        for url in ["http://example.com:99999/a.png",
+                    "http://example.com:port/a.png"]:
+            with self.assertRaises(ImageFetchError):
+                self.cache.get(url, 'card')
+
+    def test_address_pinned(self):
+        """Do requests go to the address that was checked?"""
+
+        self.assertEqual(image_proxy.check_host("http://93.184.216.34/a.png"),
+                         "93.184.216.34")
+
+        # A name that doesn't resolve at all: only the pin can reach it.
+        port = self.origin.server.server_port
+        with image_proxy._session('127.0.0.1') as session:
+            resp = session.get(f"http://pinned.invalid:{port}/big.jpg")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.origin.hits['/big.jpg'], 1)
+
+    def test_redirects_checked(self):
+        """Is each redirect hop checked before it's followed?"""
+
+        target = f"{self.origin.url}/big.jpg"
+        redirector = LocalOrigin({}, redirects={'/avatar.jpg': target})
+        self.addCleanup(redirector.close)
+
+        # Only the redirecting host is allowed, not where it points.
+        url = redirector.url.replace('127.0.0.1', 'localhost') + '/avatar.jpg'
+        cache = ImageCache(self.cache_dir, max_bytes=10 * 1024 * 1024,
+                           allowed_hosts=['localhost'])
+
+        with self.assertRaises(ImageFetchError):
+            cache.get(url, 'card')
+        self.assertEqual(self.origin.hits, {})
+
+        path, _ = self.cache.get(f"{redirector.url}/avatar.jpg", 'card')
+        self.assertEqual(_size(path), (140, 140))
+
+    def test_static_fingerprint(self):
+        """Are local images fingerprinted and cached for good?"""
+
+        with app.test_request_context():
+            url = resized('/static/images/default-pic.png', 'card')
+
+        self.assertRegex(url, r'^/static/images/default-pic\.png\?v=\w{12}$')
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.headers['Cache-Control'], IMMUTABLE)
+        resp.close()
+
+        resp = self.client.get('/login')
+        self.assertIn('no-store', resp.headers['Cache-Control'])
+
+    def test_static_missing(self):
+        """Do missing or outside-static/ paths get the default image?"""
+
+        with app.test_request_context():
+            default = resized('/static/images/default-pic.png', 'card')
+
+            self.assertEqual(resized('/static/images/missing.png', 'card'),
+                             default)
+            self.assertEqual(resized('/static/../config.py', 'card'),
+                             default)
+            self.assertRegex(resized('/static/nope.jpg', 'hero'),
+                             r'^/static/images/warbler-hero\.jpg\?v=')
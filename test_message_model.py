@@ -1,43 +1,18 @@
 """Message model tests."""
 
-import os
 from datetime import datetime
-from unittest import TestCase
 
-from models import db, User, Message, Follows
-from flask_bcrypt import Bcrypt
+from fixtures import DBTestCase
+from models import db, bcrypt, User, Message, Follows
 
-bcrypt = Bcrypt()
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
-
-os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
-
-# Now we can import app
-
-from app import app
-
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-
-db.create_all()
-
-
-class MessageModelTestCase(TestCase):
+class MessageModelTestCase(DBTestCase):
     """Test the model for messages. """
 
     def setUp(self):
         """Create test client, add sample data."""
 
-        User.query.delete()
-        Message.query.delete()
-        Follows.query.delete()
-
-        self.client = app.test_client()
+        super().setUp()
 
         user = User(
             email="test@test.com",
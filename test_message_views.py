@@ -5,45 +5,18 @@
 #    FLASK_ENV=production python -m unittest test_message_views.py
 
 
-import os
-from unittest import TestCase
-from flask_bcrypt import Bcrypt
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from models import db, bcrypt, Message, User, Follows
 
-from models import db, connect_db, Message, User, Follows
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
-
-os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
-
-# Now we can import app
-
-from app import app, CURR_USER_KEY
-
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-
-db.create_all()
-
-# Don't have WTForms use CSRF at all, since it's a pain to test
-
-app.config['WTF_CSRF_ENABLED'] = False
-
-bcrypt = Bcrypt()
-
-class MessageViewTestCase(TestCase):
+class MessageViewTestCase(DBTestCase):
     """Test views for messages."""
 
     def setUp(self):
         """Create test client, add sample data."""
 
-        User.query.delete()
-        Message.query.delete()
-
-        self.client = app.test_client()
+        super().setUp()
 
 
         user1 = User(
@@ -137,4 +110,4 @@ class MessageViewTestCase(TestCase):
             resp = c.post(url, data={"text": "unique test message @##$#@$"}, follow_redirects=True)
 
             self.assertEqual(resp.status_code, 200)
-            self.assertIn(f"unique test message", resp.get_data(as_text=True)
\ No newline at end of file
+            self.assertIn(f"unique test message", resp.get_data(as_text=True))
\ No newline at end of file
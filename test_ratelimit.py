@@ -0,0 +1,94 @@
+"""Rate limit tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ratelimit.py
+
+
+from unittest import TestCase
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase, app
+from models import db, User, Message
+from ratelimit import MemoryStore
+
+
+class MemoryStoreTestCase(TestCase):
+    """Test the token bucket arithmetic (no database needed)."""
+
+    def test_burst_then_refill(self):
+        """Is a full burst allowed, then one token per 1/rate seconds?"""
+
+        store = MemoryStore()
+
+        for _ in range(3):
+            self.assertEqual(store.take('k', 0.5, 3, now=100), 0)
+
+        self.assertEqual(store.take('k', 0.5, 3, now=100), 2)
+        self.assertEqual(store.take('k', 0.5, 3, now=101), 1)
+        self.assertEqual(store.take('k', 0.5, 3, now=102), 0)
+        self.assertEqual(store.take('other', 0.5, 3, now=102), 0)
+
+    def test_prune(self):
+        """Are refilled buckets forgotten once there are too many?"""
+
+        store = MemoryStore()
+        store.MAX_KEYS = 2
+
+        store.take('a', 1, 2, now=0)
+        store.take('b', 1, 2, now=5)
+        store.take('c', 1, 2, now=5)
+
+        self.assertEqual(set(store._buckets), {'b', 'c'})
+
+
+class RateLimitViewsTestCase(DBTestCase):
+    """Test limiting the write routes."""
+
+    def setUp(self):
+        """Create test client, add sample data, tighten the limits."""
+
+        super().setUp()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self._saved_limits = app.config['RATELIMITS']
+        app.config['RATELIMITS'] = {
+            'messages': {'user': (2, 60), 'ip': (5, 60)},
+        }
+
+    def tearDown(self):
+        app.config['RATELIMITS'] = self._saved_limits
+        super().tearDown()
+
+    def test_messages_limited(self):
+        """Are posts over the limit refused with a 429 and Retry-After?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            for i in range(2):
+                resp = c.post("/messages/new", data={"text": f"hi {i}"})
+                self.assertEqual(resp.status_code, 302)
+
+            resp = c.post("/messages/new", data={"text": "too many"})
+            self.assertEqual(resp.status_code, 429)
+            self.assertEqual(resp.headers['Retry-After'], '30')
+
+            # Only POSTs count.
+            resp = c.get("/messages/new")
+            self.assertEqual(resp.status_code, 200)
+
+        self.assertEqual(Message.query.count(), 2)
+
+        resp = self.client.get("/metrics")
+        text = resp.get_data(as_text=True)
+        self.assertIn(
+            'ratelimit_rejected_total{limit="messages",scope="user"} 1', text)
+        self.assertIn(
+            'ratelimit_checked_total{limit="messages",scope="ip"} 3', text)
@@ -0,0 +1,159 @@
+"""Repository (sharded data access) tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_repository.py
+
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import repository
+from fixtures import DBTestCase
+from models import db, Follows, Message, User
+
+SHARDS = 3
+
+
+class RepositoryTestCase(TestCase):
+    """Test routing and merging across several SQLite databases."""
+
+    def setUp(self):
+        """Spread six users, their messages and follows over the shards."""
+
+        self.sessions = []
+        for _ in range(SHARDS):
+            engine = create_engine('sqlite://', poolclass=StaticPool)
+            db.metadata.create_all(engine)
+            self.sessions.append(sessionmaker(bind=engine)())
+
+        self.saved_shards = repository.shards
+        repository.shards = router = repository.ShardRouter(
+            self.sessions, reads_only=True)
+
+        now = datetime(2021, 1, 1)
+
+        for user_id in range(1, 7):
+            session = router.session(user_id)
+            session.add(User(id=user_id, username=f"user{user_id}",
+                             email=f"user{user_id}@test.com", password="x"))
+
+            # Message n by user u is n*10 + u minutes old, so the newest
+            # messages alternate between authors (and shards).
+            session.add_all([
+                Message(id=user_id * 100 + n, user_id=user_id,
+                        text=f"warble {n} by {user_id}",
+                        timestamp=now - timedelta(minutes=n * 10 + user_id))
+                for n in range(5)])
+
+        for follower, followed in [(1, 2), (1, 3), (1, 4), (1, 5),
+                                   (2, 1), (3, 1), (6, 1)]:
+            router.session(follower).add(Follows(
+                user_following_id=follower, user_being_followed_id=followed))
+
+        for session in self.sessions:
+            session.commit()
+
+    def tearDown(self):
+        repository.shards = self.saved_shards
+        for session in self.sessions:
+            session.close()
+
+    def test_routing(self):
+        """Are users grouped by the shard their rows are on?"""
+
+        shards = repository.shards
+        self.assertIs(shards.session(4), self.sessions[1])
+        self.assertEqual(shards.by_shard([1, 2, 3, 4]), {
+            self.sessions[1]: [1, 4],
+            self.sessions[2]: [2],
+            self.sessions[0]: [3],
+        })
+
+        # With no sessions, everything goes to db.session.
+        self.assertEqual(len(repository.ShardRouter()), 1)
+
+        # Writes aren't routed, so several shards must be asked for.
+        with self.assertRaises(ValueError):
+            repository.ShardRouter(self.sessions)
+
+    def test_timeline(self):
+        """Are the newest messages of the followed users (and the user's
+        own) merged across shards, in order?"""
+
+        messages = repository.timeline(1, limit=7)
+
+        self.assertEqual([m.id for m in messages],
+                         [100, 200, 300, 400, 500, 101, 201])
+        self.assertEqual(messages[3].user.username, "user4")
+        self.assertEqual([m.id for m in repository.timeline(6, limit=2)],
+                         [100, 600])
+
+    def test_user_messages(self):
+        """Are a user's messages paged from their own shard?"""
+
+        first = repository.user_messages(5, limit=3)
+        self.assertEqual([m.id for m in first], [500, 501, 502])
+
+        rest = repository.user_messages(5, before=502, limit=3)
+        self.assertEqual([m.id for m in rest], [503, 504])
+
+    def test_follows(self):
+        """Are follows looked up across shards, in id order?"""
+
+        self.assertEqual([u.id for u in repository.following(1)],
+                         [2, 3, 4, 5])
+        self.assertEqual([u.id for u in repository.following(1, 2)],
+                         [2, 3, 4, 5])
+        self.assertEqual([u.id for u in repository.followers(1)], [2, 3, 6])
+
+
+class TimelineTestCase(DBTestCase):
+    """Test the one-database timeline strategies."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.me, self.followed, self.stranger = [user.id for user in users]
+        now = datetime.utcnow()
+
+        db.session.add_all(
+            [Follows(user_following_id=self.me,
+                     user_being_followed_id=self.followed)]
+            + [Message(text=f"warble {i}", user_id=user_id,
+                       timestamp=now - timedelta(minutes=i))
+               for i, user_id in enumerate(
+                   [self.stranger, self.followed, self.me, self.followed])])
+        db.session.commit()
+
+    def test_join(self):
+        """Are the user's and followed users' messages shown, newest first?"""
+
+        self.assertEqual(repository.timeline_strategy(db.session, 10 ** 6),
+                         'join')
+
+        messages = repository.timeline(self.me, limit=2)
+        self.assertEqual([m.text for m in messages], ["warble 1", "warble 2"])
+
+    def test_lateral(self):
+        """Is the LATERAL plan a per-author top-N, then the newest of those?"""
+
+        query = repository.timeline_query(db.session, self.me, 10, 'lateral')
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+        self.assertIn("JOIN LATERAL", sql)
+        self.assertIn("UNION ALL", sql)
+        self.assertEqual(sql.count("LIMIT"), 3)
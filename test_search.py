@@ -0,0 +1,123 @@
+"""Message search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from models import db, User, Message
+from search import search_messages, tokenize
+
+
+class SearchTestCase(DBTestCase):
+    """Test ranked, paginated message search and index upkeep."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        texts = [
+            "Coffee is great",
+            "coffee coffee coffee all day",
+            "I like tea",
+            "Tea or coffee?",
+            "Nothing to see here",
+        ]
+        db.session.add_all([Message(text=text, user_id=user.id)
+                            for text in texts])
+        db.session.commit()
+
+    def texts(self, messages):
+        return [msg.text for msg in messages]
+
+    def test_tokenize(self):
+        """Are words lowercased and stopwords dropped?"""
+
+        self.assertEqual(tokenize("The Coffee, is GREAT!"), ['coffee', 'great'])
+
+    def test_ranked(self):
+        """Are all matches found, most relevant first?"""
+
+        messages, cursor = search_messages("coffee")
+
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0].text, "coffee coffee coffee all day")
+        self.assertIsNone(cursor)
+
+    def test_all_terms(self):
+        """Must results match every search term?"""
+
+        messages, _ = search_messages("tea coffee")
+
+        self.assertEqual(self.texts(messages), ["Tea or coffee?"])
+
+    def test_pagination(self):
+        """Do cursors walk through every result exactly once?"""
+
+        first, cursor = search_messages("coffee", per_page=2)
+        second, last_cursor = search_messages("coffee", cursor, per_page=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(
+            sorted(self.texts(first + second)),
+            sorted(self.texts(search_messages("coffee")[0])))
+
+    def test_pagination_ties(self):
+        """Are results with the same rank paged through without gaps?
+
+        (On Postgres these all rank 0.1, which a float4 can't hold exactly.)
+        """
+
+        db.session.add_all([Message(text=f"matcha number {i}",
+                                    user_id=self.user_id)
+                            for i in range(5)])
+        db.session.commit()
+
+        seen, cursor = search_messages("matcha", per_page=2)
+        while cursor:
+            page, cursor = search_messages("matcha", cursor, per_page=2)
+            seen += page
+
+        self.assertEqual(sorted(self.texts(seen)),
+                         [f"matcha number {i}" for i in range(5)])
+
+    def test_index_updates(self):
+        """Are added and deleted messages reflected in search?"""
+
+        search_messages("coffee")
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.post("/messages/new", data={"text": "espresso is coffee too"})
+            messages, _ = search_messages("espresso")
+            self.assertEqual(len(messages), 1)
+
+            c.post(f"/messages/{messages[0].id}/delete")
+            self.assertEqual(search_messages("espresso")[0], [])
+
+    def test_search_page(self):
+        """Does the search page show matches and a link to more?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/messages/search?q=tea")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("I like tea", html)
+            self.assertNotIn("Coffee is great", html)
@@ -0,0 +1,147 @@
+"""Follow suggestion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_suggestions.py
+
+
+from datetime import datetime
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from models import db, User, Follows, FollowSuggestion, StaleSuggestion
+import suggestions
+from suggestions import refresh_suggestions
+
+
+class SuggestionsTestCase(DBTestCase):
+    """Test the friends-of-friends suggestion job and page."""
+
+    def setUp(self):
+        """Create test client, add sample data.
+
+        alice follows bob and carol; bob and carol both follow dave;
+        carol also follows erin. Everyone follows frank.
+        """
+
+        super().setUp()
+
+        names = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+        users = [User(email=f"{name}@test.com", username=name,
+                      password="HASHED_PASSWORD") for name in names]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.ids = {user.username: user.id for user in users}
+
+        pairs = [('alice', 'bob'), ('alice', 'carol'), ('bob', 'dave'),
+                 ('carol', 'dave'), ('carol', 'erin')]
+        pairs += [(name, 'frank') for name in names if name != 'frank']
+
+        db.session.add_all([
+            Follows(user_following_id=self.ids[a],
+                    user_being_followed_id=self.ids[b])
+            for a, b in pairs
+        ])
+        db.session.commit()
+
+    def suggested(self, name):
+        """Suggested usernames for `name`, best first."""
+
+        return [s.suggested_user.username for s in
+                FollowSuggestion.query
+                .filter_by(user_id=self.ids[name])
+                .order_by(FollowSuggestion.rank)]
+
+    def test_friends_of_friends(self):
+        """Are candidates ranked by mutual follows, minus existing follows?"""
+
+        refresh_suggestions(all_users=True)
+
+        self.assertEqual(self.suggested('alice'), ['dave', 'erin'])
+
+    def test_popular_fallback(self):
+        """Do users with no friends-of-friends get popular accounts?"""
+
+        refresh_suggestions(all_users=True)
+
+        self.assertEqual(self.suggested('frank')[0], 'dave')
+        self.assertNotIn('frank', self.suggested('frank'))
+
+    def test_stale_refresh(self):
+        """Does following someone mark the user stale, and refresh followers?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.ids['bob']
+
+            c.post(f"/users/follow/{self.ids['erin']}")
+
+        self.assertEqual(StaleSuggestion.query.one().user_id, self.ids['bob'])
+
+        refreshed = refresh_suggestions()
+
+        # bob, plus alice who follows bob
+        self.assertEqual(refreshed, 2)
+        self.assertEqual(StaleSuggestion.query.count(), 0)
+        self.assertEqual(self.suggested('alice')[:2], ['dave', 'erin'])
+        self.assertEqual(self.suggested('carol'), [])
+
+    def test_signup_during_refresh(self):
+        """Does a user signing up mid-refresh not break the job?"""
+
+        load = suggestions.load_follow_matrix
+
+        def load_then_signup():
+            follows = load()
+            db.session.add(User(email="late@test.com", username="late",
+                                password="HASHED_PASSWORD"))
+            db.session.commit()
+            return follows
+
+        suggestions.load_follow_matrix = load_then_signup
+        try:
+            refresh_suggestions(all_users=True)
+        finally:
+            suggestions.load_follow_matrix = load
+
+        self.assertEqual(self.suggested('alice'), ['dave', 'erin'])
+
+    def test_marked_during_refresh(self):
+        """Does a user marked stale again mid-refresh stay marked?"""
+
+        db.session.add(StaleSuggestion(user_id=self.ids['bob']))
+        db.session.commit()
+
+        load = suggestions.load_follow_matrix
+
+        def load_then_mark():
+            follows = load()
+            db.session.merge(StaleSuggestion(user_id=self.ids['bob'],
+                                             marked_at=datetime.utcnow()))
+            db.session.commit()
+            return follows
+
+        suggestions.load_follow_matrix = load_then_mark
+        try:
+            refresh_suggestions()
+        finally:
+            suggestions.load_follow_matrix = load
+
+        self.assertEqual(StaleSuggestion.query.one().user_id, self.ids['bob'])
+
+    def test_suggestions_page(self):
+        """Does the page show precomputed suggestions?"""
+
+        refresh_suggestions(all_users=True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.ids['alice']
+
+            resp = c.get("/users/suggestions")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("@dave", html)
+            self.assertIn("Followed by 2 people you follow", html)
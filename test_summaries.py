@@ -0,0 +1,133 @@
+"""Profile summary tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_summaries.py
+
+
+from datetime import datetime, timedelta
+
+from app import CURR_USER_KEY, PROFILE_PAGE_SIZE
+from fixtures import DBTestCase
+from models import db, User, Message, Like, UserSummary
+import summaries
+
+
+class SummariesTestCase(DBTestCase):
+    """Test building summaries and keeping them up to date."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.me, self.other, self.third = [user.id for user in users]
+
+        msg = Message(text="other's warble", user_id=self.other)
+        db.session.add(msg)
+        db.session.commit()
+        self.msg_id = msg.id
+
+        db.session.add(Like(user_id=self.third, message_id=self.msg_id))
+        db.session.commit()
+
+    def login(self, c, user_id=None):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id or self.me
+
+    def assertUpToDate(self, *user_ids):
+        """Do these summaries match a recount from the tables?"""
+
+        for user_id in user_ids:
+            summary = summaries.get_summary(user_id)
+            kept = {field: getattr(summary, field)
+                    for field in summaries.FIELDS}
+
+            summaries.refresh([user_id])
+            db.session.commit()
+
+            recounted = {field: getattr(UserSummary.query.get(user_id), field)
+                         for field in summaries.FIELDS}
+            self.assertEqual(kept, recounted)
+
+    def test_get_summary(self):
+        """Is a summary built on first use, with the right counts?"""
+
+        self.assertIsNone(UserSummary.query.get(self.other))
+
+        summary = summaries.get_summary(self.other)
+        self.assertEqual(summary.username, "testuser1")
+        self.assertEqual(summary.message_count, 1)
+        self.assertEqual(summary.last_message_id, self.msg_id)
+        self.assertEqual(summaries.get_summary(self.third).likes_count, 1)
+
+        self.assertIsNone(summaries.get_summary(99999))
+
+    def test_kept_up_to_date(self):
+        """Do the write routes keep existing summaries in step?"""
+
+        everyone = (self.me, self.other, self.third)
+        for user_id in everyone:
+            summaries.get_summary(user_id)
+
+        with self.client as c:
+            self.login(c)
+
+            c.post(f"/users/follow/{self.other}")
+            c.post(f"/users/follow/{self.third}")
+            c.post("/messages/new", data={"text": "my warble"})
+            c.post(f"/messages/{self.msg_id}/like")
+            self.assertEqual(UserSummary.query.get(self.me).likes_count, 1)
+            self.assertEqual(
+                UserSummary.query.get(self.other).followers_count, 1)
+            self.assertUpToDate(*everyone)
+
+            c.post(f"/users/stop-following/{self.third}")
+            c.post(f"/messages/{self.msg_id}/like")
+            self.assertUpToDate(*everyone)
+
+            self.login(c, self.other)
+            c.post(f"/messages/{self.msg_id}/delete")
+            self.assertUpToDate(*everyone)
+
+            self.login(c, self.other)
+            c.post(f"/users/follow/{self.me}")
+            c.post("/users/delete")
+            self.assertUpToDate(self.me, self.third)
+
+    def test_profile_pages(self):
+        """Do profiles show the summary, with messages a page at a time?"""
+
+        now = datetime.utcnow()
+        db.session.add_all([
+            Message(text=f"warble {i}", user_id=self.me,
+                    timestamp=now - timedelta(minutes=i))
+            for i in range(PROFILE_PAGE_SIZE + 5)])
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c)
+
+            html = c.get(f"/users/{self.me}").get_data(as_text=True)
+            self.assertIn("warble 0<", html)
+            self.assertIn(f"warble {PROFILE_PAGE_SIZE - 1}<", html)
+            self.assertNotIn(f"warble {PROFILE_PAGE_SIZE}<", html)
+            self.assertIn(f">{PROFILE_PAGE_SIZE + 5}</a>", html)
+
+            last_shown = Message.query.filter_by(
+                text=f"warble {PROFILE_PAGE_SIZE - 1}").one().id
+            self.assertIn(f"?before={last_shown}", html)
+
+            html = c.get(f"/users/{self.me}?before={last_shown}").get_data(
+                as_text=True)
+            self.assertIn(f"warble {PROFILE_PAGE_SIZE}<", html)
+            self.assertNotIn(f"warble {PROFILE_PAGE_SIZE - 1}<", html)
+            self.assertIn(f"/users/{self.me}/archive", html)
+
+            self.assertEqual(c.get("/users/99999").status_code, 404)
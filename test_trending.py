@@ -0,0 +1,102 @@
+"""Trending messages tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_trending.py
+
+
+from datetime import datetime, timedelta
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from models import db, User, Message, TrendingMessage
+from trending import refresh_trending, trending_score
+
+
+class TrendingTestCase(DBTestCase):
+    """Test like counting and the trending ranking."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        self.now = datetime.utcnow()
+
+        user1 = User(email="test@test.com", username="testuser",
+                     password="HASHED_PASSWORD")
+        user2 = User(email="test2@test.com", username="testuser2",
+                     password="HASHED_PASSWORD")
+        db.session.add_all([user1, user2])
+        db.session.commit()
+
+        old = Message(text="old but popular", user_id=user1.id,
+                      timestamp=self.now - timedelta(days=3), like_count=20)
+        new = Message(text="new and liked", user_id=user1.id,
+                      timestamp=self.now - timedelta(hours=1), like_count=5)
+        stale = Message(text="too old to trend", user_id=user1.id,
+                        timestamp=self.now - timedelta(days=30), like_count=99)
+        unliked = Message(text="nobody likes me", user_id=user1.id,
+                          timestamp=self.now)
+        db.session.add_all([old, new, stale, unliked])
+        db.session.commit()
+
+        self.user1_id = user1.id
+        self.user2_id = user2.id
+        self.old_id = old.id
+        self.new_id = new.id
+
+    def test_score_decays_with_age(self):
+        """Do older messages score lower for the same number of likes?"""
+
+        self.assertGreater(
+            trending_score(10, self.now - timedelta(hours=1), self.now),
+            trending_score(10, self.now - timedelta(days=1), self.now))
+
+    def test_refresh_trending(self):
+        """Are only recent, liked messages ranked, best first?"""
+
+        count = refresh_trending(now=self.now, batch_size=1)
+
+        self.assertEqual(count, 2)
+        ranked = [t.message_id for t in
+                  TrendingMessage.query.order_by(TrendingMessage.rank)]
+        self.assertEqual(ranked, [self.new_id, self.old_id])
+
+    def test_refresh_trending_top_k(self):
+        """Does the ranking keep only the top K?"""
+
+        refresh_trending(now=self.now, top_k=1)
+
+        self.assertEqual(TrendingMessage.query.one().message_id, self.new_id)
+
+    def test_like_updates_count(self):
+        """Does liking and unliking keep like_count in step?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user2_id
+
+            c.post(f"/messages/{self.new_id}/like")
+            self.assertEqual(Message.query.get(self.new_id).like_count, 6)
+
+            c.post(f"/messages/{self.new_id}/like")
+            self.assertEqual(Message.query.get(self.new_id).like_count, 5)
+
+    def test_trending_page(self):
+        """Does the trending page show the precomputed ranking?"""
+
+        refresh_trending(now=self.now)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user2_id
+
+            resp = c.get("/messages/trending")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("new and liked", html)
+            self.assertNotIn("too old to trend", html)
+            self.assertLess(html.index("new and liked"),
+                            html.index("old but popular"))
@@ -5,45 +5,19 @@
 #    python -m unittest test_user_model.py
 
 
-import os
-from unittest import TestCase
-
-from models import db, User, Message, Follows
 from sqlalchemy.exc import IntegrityError
-from flask_bcrypt import Bcrypt
-
-bcrypt = Bcrypt()
-
-
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
-
-os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 
-# Now we can import app
+from fixtures import DBTestCase
+from models import db, bcrypt, User, Message, Follows
 
-from app import app
 
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-
-db.create_all()
-
-
-class UserModelTestCase(TestCase):
+class UserModelTestCase(DBTestCase):
     """Test views for messages."""
 
     def setUp(self):
         """Create test client, add sample data."""
 
-        User.query.delete()
-        Message.query.delete()
-        Follows.query.delete()
-
-        self.client = app.test_client()
+        super().setUp()
 
         user1 = User(
             email="test@test.com",
@@ -70,11 +44,6 @@ class UserModelTestCase(TestCase):
         db.session.commit()
 
 
-    def tearDown(self):
-        """ Cleans up."""
-        db.session.rollback()
-
-
     def test_user_model(self):
         """Does basic model work?"""
 
@@ -106,6 +75,17 @@ class UserModelTestCase(TestCase):
 
         self.assertEqual(self.user2.is_followed_by(self.user1), False)
 
+    def test_is_following_after_orm_write(self):
+        """ Does is_following see follows added through the ORM at once? """
+
+        self.assertEqual(self.user1.is_following(self.user2), False)
+
+        self.user1.following.append(self.user2)
+        db.session.commit()
+
+        self.assertEqual(self.user1.is_following(self.user2), True)
+        self.assertEqual(self.user2.followers_count, 1)
+
     def test_user_signup(self):
         """ Does User.signup() work? """
         test_user = User.signup(username='test_signup', email='test_signup@gmail.com', password='hahaplaintextpassword', image_url='www.google.com')
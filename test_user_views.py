@@ -0,0 +1,88 @@
+"""User View tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_user_views.py
+
+
+from app import CURR_USER_KEY
+from fixtures import DBTestCase
+from models import db, User, Message, Follows, Like
+
+
+class UserViewsTestCase(DBTestCase):
+    """Test the (streamed) user list pages."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        super().setUp()
+
+        users = [User(email=f"test{i}@test.com", username=f"testuser{i}",
+                      password="HASHED_PASSWORD")
+                 for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.user_ids = [user.id for user in users]
+        first, second, third = self.user_ids
+
+        msg = Message(text="liked warble", user_id=third)
+        db.session.add_all([
+            msg,
+            Follows(user_following_id=first, user_being_followed_id=second),
+            Follows(user_following_id=third, user_being_followed_id=first),
+        ])
+        db.session.commit()
+
+        db.session.add(Like(user_id=first, message_id=msg.id))
+        db.session.commit()
+
+    def get(self, url):
+        """GET `url` as the first user; return the response and its HTML."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_ids[0]
+
+            resp = c.get(url)
+            return resp, resp.get_data(as_text=True)
+
+    def test_following(self):
+        """Are only followed users listed, streamed (so with no length)?"""
+
+        resp, html = self.get(f"/users/{self.user_ids[0]}/following")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertIn("@testuser1", html)
+        self.assertNotIn("@testuser2", html)
+
+    def test_followers(self):
+        """Are only followers listed?"""
+
+        resp, html = self.get(f"/users/{self.user_ids[0]}/followers")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("@testuser2", html)
+        self.assertNotIn("@testuser1", html)
+
+    def test_likes(self):
+        """Are liked messages listed with their authors?"""
+
+        resp, html = self.get(f"/users/{self.user_ids[0]}/likes")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("liked warble", html)
+        self.assertIn("@testuser2", html)
+
+    def test_list_users(self):
+        """Does the user list filter by username, and say when it's empty?"""
+
+        resp, html = self.get("/users?q=user1")
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertIn("@testuser1", html)
+        self.assertNotIn("@testuser2", html)
+
+        resp, html = self.get("/users?q=nobody")
+        self.assertIn("Sorry, no users found", html)
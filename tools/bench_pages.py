@@ -0,0 +1,112 @@
+"""Benchmark page size and render time with compression and trimming.
+
+Seeds a throwaway SQLite database with a user who follows enough people to
+fill the timeline, then fetches the heaviest pages with whitespace trimming
+off and on, and with each content encoding:
+
+    python tools/bench_pages.py
+    python tools/bench_pages.py --runs 50 --followers 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from compress import brotli  # noqa: E402
+from models import db, User, Message, Follows  # noqa: E402
+
+ENCODINGS = ['identity', 'gzip'] + (['br'] if brotli else [])
+
+
+def seed(followers, messages):
+    """Make user 1, who follows (and is followed by) `followers` users."""
+
+    users = [User(email=f"user{i}@test.com", username=f"user{i}",
+                  password="HASHED_PASSWORD")
+             for i in range(followers + 1)]
+    db.session.add_all(users)
+    db.session.commit()
+
+    me, others = users[0], users[1:]
+
+    db.session.add_all(
+        [Follows(user_being_followed_id=other.id, user_following_id=me.id)
+         for other in others]
+        + [Follows(user_being_followed_id=me.id, user_following_id=other.id)
+           for other in others]
+        + [Message(text=f"Warble number {i} from someone I follow #bench",
+                   user_id=others[i % len(others)].id)
+           for i in range(messages)])
+    db.session.commit()
+
+    return me.id
+
+
+def measure(client, url, encoding, runs):
+    """(bytes on the wire, median ms) for GETting `url`."""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        resp = client.get(url, headers={'Accept-Encoding': encoding})
+        times.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, (url, resp.status_code)
+
+    return len(resp.data), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--followers', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    try:
+        results = {}
+
+        for trim in (False, True):
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+                'TEMPLATE_TRIM_WHITESPACE': trim,
+                'RATELIMIT_ENABLED': False,
+            })
+
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                user_id = seed(args.followers, args.messages)
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+
+            for url in ['/', f'/users/{user_id}/followers']:
+                for encoding in ENCODINGS:
+                    results[url, trim, encoding] = measure(
+                        client, url, encoding, args.runs)
+
+    finally:
+        os.remove(path)
+
+    print(f"{'page':24} {'trim':5} {'encoding':9} {'bytes':>8} "
+          f"{'saved':>6} {'ms':>7}")
+
+    for (url, trim, encoding), (size, ms) in results.items():
+        base, _ = results[url, False, 'identity']
+        print(f"{url:24} {'yes' if trim else 'no':5} {encoding:9} "
+              f"{size:8} {1 - size / base:6.0%} {ms:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark the home timeline strategies across follow counts.
+
+Adds one user per follow-count bucket (following that many random users)
+to a database seeded like plan_check.py's, then times each way of fetching
+their timeline: the literal id list the homepage used to send, the JOIN
+against follows, and (on Postgres) the per-author LATERAL plan:
+
+    python tools/bench_timeline.py --database postgresql:///warbler_bench \\
+        --seed --scale 0.2
+
+--seed drops and recreates every table there first. The crossover is what
+repository.TIMELINE_LATERAL_MIN_FOLLOWS should be set to.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from config import create_db_app  # noqa: E402
+from models import db, Follows, Message, User  # noqa: E402
+import repository  # noqa: E402
+from tools.plan_check import seed  # noqa: E402
+
+BUCKETS = [10, 100, 1000, 5000, 20000]
+
+TIMELINE_SIZE = 100
+
+
+def add_bucket_users(buckets):
+    """{follow count: id of a new user following that many random users}."""
+
+    users = {}
+
+    for count in buckets:
+        user = User(email=f"bench{count}@example.com",
+                    username=f"bench{count}", password="x")
+        db.session.add(user)
+        db.session.flush()
+
+        db.session.execute(
+            text("INSERT INTO follows (user_following_id, "
+                 "                     user_being_followed_id) "
+                 "SELECT :user_id, id FROM users WHERE id != :user_id "
+                 "ORDER BY random() LIMIT :count"),
+            {'user_id': user.id, 'count': count})
+        users[count] = user.id
+
+    db.session.commit()
+    return users
+
+
+def id_list_timeline(user_id):
+    """The old way: load the followed ids, send them back as an IN list."""
+
+    ids = [followed_id for (followed_id,) in (db.session
+           .query(Follows.user_being_followed_id)
+           .filter(Follows.user_following_id == user_id))]
+
+    return (Message
+            .query
+            .filter(Message.user_id.in_(ids + [user_id]))
+            .options(joinedload(Message.user))
+            .order_by(Message.timestamp.desc())
+            .limit(TIMELINE_SIZE)
+            .all())
+
+
+def measure(fetch, runs):
+    """Median ms of `fetch()`, after one warm-up run."""
+
+    fetch()
+    times = []
+
+    for _ in range(runs):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fetch()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True,
+                        help="scratch database URL to benchmark in")
+    parser.add_argument('--seed', action='store_true',
+                        help="recreate and fill the tables first")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply the seeded row counts by this")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    create_db_app({'SQLALCHEMY_DATABASE_URI': args.database})
+    postgres = db.engine.dialect.name == 'postgresql'
+
+    if args.seed:
+        if not postgres:
+            parser.error("--seed needs a Postgres database")
+        db.drop_all()
+        db.create_all()
+        seed(db.engine, args.scale)
+
+    user_count = db.session.query(User).count()
+    users = add_bucket_users([n for n in BUCKETS if n < user_count])
+
+    strategies = ['join'] + (['lateral'] if postgres else [])
+
+    print(f"{'follows':>8} {'id list':>9} "
+          + " ".join(f"{name:>9}" for name in strategies)
+          + "  (median ms)")
+
+    try:
+        for count, user_id in users.items():
+            row = [measure(lambda: id_list_timeline(user_id), args.runs)]
+            row += [measure(lambda: repository.timeline(
+                        user_id, TIMELINE_SIZE, strategy), args.runs)
+                    for strategy in strategies]
+
+            print(f"{count:>8} " + " ".join(f"{ms:9.2f}" for ms in row))
+
+    finally:
+        User.query.filter(User.id.in_(list(users.values()))).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
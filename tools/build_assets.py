@@ -0,0 +1,38 @@
+"""Vendor and bundle the front-end assets (see assets.py).
+
+Downloads the pinned third-party files into static/vendor/ (only the ones
+that are missing, unless --refresh), then writes the content-hashed bundles
+and manifest to static/dist/. Commit both directories.
+
+    python tools/build_assets.py
+    python tools/build_assets.py --refresh   # after changing a pinned version
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import assets  # noqa: E402
+
+STATIC_DIR = os.path.join(ROOT, 'static')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--refresh', action='store_true',
+                        help="download vendored files even if we have them")
+    args = parser.parse_args()
+
+    for name in assets.vendor(STATIC_DIR, force=args.refresh):
+        print(f"fetched vendor/{name}")
+
+    for bundle, path in assets.build(STATIC_DIR).items():
+        size = os.path.getsize(os.path.join(STATIC_DIR, path))
+        print(f"{bundle:8} -> {path} ({size / 1024:.0f} KiB)")
+
+
+if __name__ == '__main__':
+    main()
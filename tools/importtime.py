@@ -0,0 +1,118 @@
+"""Profile module import time for Warbler entry points.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each entry point and reports the total plus the slowest imports. Use it to
+keep worker startup and CLI tools (like `seed.py`) fast:
+
+    python tools/importtime.py                # report
+    python tools/importtime.py --write        # refresh the checked-in baseline
+    python tools/importtime.py --check        # fail if we got much slower
+
+--check also fails entry points that aren't in the baseline yet.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'tools', 'baselines', 'importtime.json')
+
+# What each entry point imports. `create_app()` is what gunicorn runs.
+ENTRY_POINTS = {
+    'app': 'import app',
+    'app:create_app': 'import app; app.create_app()',
+    'config': 'import config; config.create_db_app()',
+    'models': 'import models',
+}
+
+RUNS = 5
+
+
+def measure(code):
+    """Return (total_us, [(cumulative_us, module), ...]) for one import."""
+
+    env = dict(os.environ, DATABASE_URL=os.environ.get('DATABASE_URL', 'sqlite://'))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = len(name) - len(name.lstrip())
+        rows.append((int(cumulative), name.strip(), depth))
+
+    # Top-level imports (depth 1) add up to the total import cost.
+    total = sum(cumulative for cumulative, _, depth in rows if depth == 1)
+    top = sorted(((c, n) for c, n, _ in rows), reverse=True)
+
+    return total, top
+
+
+def profile(code):
+    """Best-of-RUNS total (least noisy) and the slowest modules of that run."""
+
+    return min((measure(code) for _ in range(RUNS)), key=lambda r: r[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--write', action='store_true',
+                        help="save results as the new baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="exit non-zero if an entry point regressed")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown vs baseline (default 25%%)")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+
+    for name, code in ENTRY_POINTS.items():
+        total, top = profile(code)
+        results[name] = {
+            'total_us': total,
+            'slowest': [[module, us] for us, module in top[:args.top]],
+        }
+
+        line = f"{name:16} {total / 1000:8.1f} ms"
+        if name in baseline:
+            before = baseline[name]['total_us']
+            change = (total - before) / before
+            line += f"   (baseline {before / 1000:.1f} ms, {change:+.0%})"
+            if change > args.tolerance:
+                failed = True
+                line += "  REGRESSED"
+        elif not args.write:
+            # Nothing to compare with; --write to add it to the baseline.
+            failed = True
+            line += "   NOT IN BASELINE"
+        print(line)
+
+        for us, module in top[:args.top]:
+            print(f"    {us / 1000:8.1f} ms  {module}")
+
+    if args.write:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"wrote {os.path.relpath(BASELINE, ROOT)}")
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""Catch query-plan regressions in the SQL the app runs.
+
+1. Record one example of every distinct SELECT the routes run during the
+   test suite (on Postgres, so the SQL is Postgres SQL):
+
+       CAPTURE_SQL=/tmp/warbler_sql.json \\
+           TEST_DATABASE_URL=postgresql:///warbler_test python -m pytest
+
+   Under pytest-xdist each worker writes its own file (warbler_sql.gw0.json,
+   ...); pass them all below.
+
+2. EXPLAIN (ANALYZE, BUFFERS) each against a seeded scratch database and
+   compare with the checked-in baseline:
+
+       python tools/plan_check.py /tmp/warbler_sql*.json \\
+           --database postgresql:///warbler_plans --seed --check
+
+   --seed drops and recreates every table there and fills them with a
+   sizeable generated dataset, so the planner has a reason to use indexes.
+   It refuses to touch a database with data in it, unless it's one --seed
+   filled before.
+   A query fails the check if its plan gains a sequential scan or its
+   estimated cost grows past --tolerance, or if it isn't in the baseline
+   at all. Use --write to accept the current plans as the new baseline
+   (--check refuses to run without one).
+"""
+
+import argparse
+import atexit
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'tools', 'baselines', 'plans.json')
+
+# Rows generated by --seed, before --scale.
+SEED_SIZES = {
+    'users': 10_000,
+    'messages': 500_000,
+    'follows': 200_000,
+    'likes': 300_000,
+}
+
+SEED_SQL = [
+    "SELECT setseed(0.42)",
+    """INSERT INTO users (email, username, password, image_url,
+                          header_image_url, bio, location)
+       SELECT 'user' || i || '@example.com', 'user' || i, 'x',
+              '/static/images/default-pic.png',
+              '/static/images/warbler-hero.jpg', '', ''
+       FROM generate_series(1, :users) AS i""",
+    """INSERT INTO messages (text, timestamp, user_id, like_count)
+       SELECT 'Warble ' || i || ' about #topic' || (i % 100),
+              now() - random() * interval '730 days',
+              1 + (i % :users), 0
+       FROM generate_series(1, :messages) AS i""",
+    """INSERT INTO follows (user_following_id, user_being_followed_id)
+       SELECT 1 + floor(random() * :users), 1 + floor(random() * :users)
+       FROM generate_series(1, :follows)
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO likes (user_id, message_id)
+       SELECT 1 + floor(random() * :users), 1 + floor(random() * :messages)
+       FROM generate_series(1, :likes)""",
+    """UPDATE messages SET like_count = counts.n
+       FROM (SELECT message_id, count(*) AS n FROM likes
+             GROUP BY message_id) AS counts
+       WHERE messages.id = counts.message_id""",
+]
+
+# Created by --seed, so later runs know the data in the database is ours.
+SEED_MARKER = 'plan_check_seeded'
+
+PLACEHOLDER = r"(?:%\(\w+\)s|\?)"
+IN_LIST = re.compile(rf"IN \({PLACEHOLDER}(?:, {PLACEHOLDER})*\)")
+
+
+##############################################################################
+# Capturing (from fixtures.py)
+
+
+def shape(statement):
+    """`statement` with whitespace and IN-list lengths normalized."""
+
+    return IN_LIST.sub("IN (...)", " ".join(statement.split()))
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def capture_statements(engine, path):
+    """Record an example of each distinct SELECT `engine` runs for a
+    request (not the tests' own queries) into `path`.
+
+    The file is written when the process exits.
+    """
+
+    from flask import has_request_context
+    from sqlalchemy import event
+
+    shapes = {}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not has_request_context():
+            return
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+
+        key = shape(statement)
+        if key in shapes:
+            return
+
+        if isinstance(parameters, dict):
+            parameters = {k: _jsonable(v) for k, v in parameters.items()}
+        else:
+            parameters = [_jsonable(v) for v in parameters]
+
+        shapes[key] = {'statement': statement, 'parameters': parameters}
+
+    def dump():
+        with open(path, 'w') as f:
+            json.dump(shapes, f, indent=2, sort_keys=True)
+
+    atexit.register(dump)
+
+
+##############################################################################
+# Explaining and comparing
+
+
+def seedable(engine):
+    """Whether --seed may drop everything in `engine`'s database: it's
+    empty (tables without rows count as empty), or we seeded it.
+    """
+
+    from sqlalchemy import inspect
+
+    tables = inspect(engine).get_table_names()
+    if SEED_MARKER in tables:
+        return True
+
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.connect() as conn:
+        return not any(
+            conn.execute(f"SELECT 1 FROM {quote(name)} LIMIT 1").first()
+            for name in tables)
+
+
+def seed(engine, scale):
+    """Fill the (freshly created) tables with generated rows."""
+
+    from sqlalchemy import text
+
+    sizes = {name: max(1, int(n * scale)) for name, n in SEED_SIZES.items()}
+
+    with engine.begin() as conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {SEED_MARKER} ()")
+        for sql in SEED_SQL:
+            conn.execute(text(sql), **sizes)
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level='AUTOCOMMIT').execute('ANALYZE')
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _nodes(child)
+
+
+def summarize(explained):
+    """The parts of an EXPLAIN (FORMAT JSON) result we track."""
+
+    plan = explained['Plan']
+    nodes = list(_nodes(plan))
+
+    return {
+        'total_cost': plan['Total Cost'],
+        'actual_ms': round(explained.get('Execution Time', 0), 3),
+        'shared_hit': plan.get('Shared Hit Blocks', 0),
+        'shared_read': plan.get('Shared Read Blocks', 0),
+        'seq_scans': sorted({node['Relation Name'] for node in nodes
+                             if node['Node Type'] == 'Seq Scan'}),
+        'indexes': sorted({node['Index Name'] for node in nodes
+                           if 'Index Name' in node}),
+        'nodes': [node['Node Type'] for node in nodes],
+    }
+
+
+def explain(engine, statement, parameters):
+    """Run and EXPLAIN `statement`, rolling back anything it changed."""
+
+    if isinstance(parameters, list):
+        parameters = tuple(parameters)
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            result = conn.execute(
+                "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement,
+                parameters)
+            explained = result.scalar()
+        finally:
+            trans.rollback()
+
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+
+    return summarize(explained[0])
+
+
+def compare(before, after, tolerance):
+    """Reasons `after` is a worse plan than `before` (empty if it isn't)."""
+
+    problems = []
+
+    new_scans = set(after['seq_scans']) - set(before['seq_scans'])
+    if new_scans:
+        problems.append(f"new seq scan on {', '.join(sorted(new_scans))}")
+
+    if before['total_cost'] and (after['total_cost'] / before['total_cost']
+                                 > 1 + tolerance):
+        problems.append(f"cost {before['total_cost']:.0f} -> "
+                        f"{after['total_cost']:.0f}")
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('captures', nargs='+', metavar='CAPTURE_JSON',
+                        help="files written with CAPTURE_SQL")
+    parser.add_argument('--database', required=True,
+                        help="scratch Postgres database URL to explain in")
+    parser.add_argument('--seed', action='store_true',
+                        help="recreate and fill the tables first")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply the seeded row counts by this")
+    parser.add_argument('--write', action='store_true',
+                        help="save results as the new baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="exit non-zero if a plan regressed")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed cost increase vs baseline (default 50%%)")
+    args = parser.parse_args()
+
+    if args.check and not args.write and not os.path.exists(BASELINE):
+        parser.error(f"no baseline at {os.path.relpath(BASELINE, ROOT)}; "
+                     "make one with --write first")
+
+    sys.path.insert(0, ROOT)
+    from config import create_db_app
+    from models import db
+
+    create_db_app({'SQLALCHEMY_DATABASE_URI': args.database})
+
+    if args.seed:
+        if not seedable(db.engine):
+            parser.error(f"{args.database} has data in it; --seed only "
+                         "replaces an empty database or one it seeded")
+        db.drop_all()
+        db.create_all()
+        seed(db.engine, args.scale)
+
+    shapes = {}
+    for path in args.captures:
+        with open(path) as f:
+            shapes.update(json.load(f))
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+
+    for sql, example in sorted(shapes.items()):
+        key = hashlib.sha1(sql.encode('utf-8')).hexdigest()[:12]
+        summary = explain(db.engine, example['statement'],
+                          example['parameters'])
+        results[key] = {'sql': sql, **summary}
+
+        line = (f"{key}  cost {summary['total_cost']:>10.1f}  "
+                f"{summary['actual_ms']:>8.2f} ms  "
+                f"seq scans: {', '.join(summary['seq_scans']) or '-'}")
+
+        if key not in baseline:
+            line += "  (new)"
+            if not args.write:
+                # Can't tell whether it regressed; make it part of the
+                # baseline (with --write) to have it checked.
+                failed = True
+        else:
+            problems = compare(baseline[key], summary, args.tolerance)
+            if problems:
+                failed = True
+                line += f"  REGRESSED: {'; '.join(problems)}"
+
+        print(line)
+
+    for key in sorted(set(baseline) - set(results)):
+        print(f"{key}  no longer run: {baseline[key]['sql'][:60]}...")
+
+    if args.write:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"wrote {os.path.relpath(BASELINE, ROOT)}")
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
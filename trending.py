@@ -0,0 +1,114 @@
+"""Rebuild the trending-messages ranking.
+
+Like counts are maintained incrementally on `Message.like_count` by the web
+routes; this job turns them into a time-decayed score and stores the top K
+in `trending_messages`. Run it on a schedule:
+
+    python trending.py              # refresh once
+    python trending.py --every 300  # refresh every 5 minutes
+"""
+
+import argparse
+import heapq
+import time
+from datetime import datetime, timedelta
+
+from models import db, Message, TrendingMessage
+
+TOP_K = 100
+
+# Only messages this recent can trend; keeps each batch run small.
+WINDOW = timedelta(days=7)
+
+# How fast old likes stop counting (same idea as Hacker News' gravity).
+GRAVITY = 1.5
+
+BATCH_SIZE = 1000
+
+
+def trending_score(like_count, timestamp, now):
+    """Time-decayed popularity of a message with `like_count` likes."""
+
+    age_hours = max((now - timestamp).total_seconds(), 0) / 3600
+    return like_count / (age_hours + 2) ** GRAVITY
+
+
+def candidate_batches(since, batch_size=BATCH_SIZE):
+    """Yield lists of (id, like_count, timestamp) for liked, recent messages.
+
+    Uses keyset pagination on (timestamp, id), so each batch is a cheap
+    range scan of the timestamp index that starts inside the window.
+    """
+
+    last = None
+
+    while True:
+        query = (db.session
+                 .query(Message.id, Message.like_count, Message.timestamp)
+                 .filter(Message.timestamp >= since,
+                         Message.like_count > 0))
+
+        if last is not None:
+            query = query.filter((Message.timestamp > last.timestamp)
+                                 | ((Message.timestamp == last.timestamp)
+                                    & (Message.id > last.id)))
+
+        batch = (query
+                 .order_by(Message.timestamp, Message.id)
+                 .limit(batch_size)
+                 .all())
+
+        if not batch:
+            return
+
+        yield batch
+        last = batch[-1]
+
+
+def refresh_trending(now=None, top_k=TOP_K, window=WINDOW,
+                     batch_size=BATCH_SIZE):
+    """Recompute the top `top_k` trending messages and store them.
+
+    Returns the number of ranked messages.
+    """
+
+    now = now or datetime.utcnow()
+    top = []
+
+    for batch in candidate_batches(now - window, batch_size):
+        for msg_id, like_count, timestamp in batch:
+            entry = (trending_score(like_count, timestamp, now), msg_id)
+            if len(top) < top_k:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+    ranked = sorted(top, reverse=True)
+
+    TrendingMessage.query.delete()
+    db.session.bulk_insert_mappings(TrendingMessage, [
+        dict(rank=rank, message_id=msg_id, score=score)
+        for rank, (score, msg_id) in enumerate(ranked, start=1)
+    ])
+    db.session.commit()
+
+    return len(ranked)
+
+
+if __name__ == '__main__':
+    from config import create_db_app
+
+    parser = argparse.ArgumentParser(description="Refresh trending messages.")
+    parser.add_argument('--every', type=int, metavar='SECONDS',
+                        help="keep running, refreshing this often")
+    args = parser.parse_args()
+
+    create_db_app()
+
+    while True:
+        count = refresh_trending()
+        print(f"ranked {count} trending messages")
+
+        if not args.every:
+            break
+        time.sleep(args.every)